@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Script to estimate how much each feature generator contributes to the accuracy of the CRF and
+how much it costs to compute (feature ablation).
+The windows are featurized once, while measuring the time spent in each feature generator.
+Then one model is trained with all feature generators (baseline) and one model per feature
+generator (or group of feature generators) with that generator removed. All models are trained
+in parallel processes.
+
+Example usage:
+    python ablation.py --identifier="ablation1"
+    python ablation.py --identifier="ablation2" --groups
+
+The script prints one table with the F1 scores (and their difference to the baseline), the
+featurization time per token and the number of attributes of each removed generator.
+Notice that the POS tagger and the LDA use caches, i.e. their featurization times will be much
+lower if the windows were already featurized in a previous run.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import multiprocessing
+import random
+import time
+
+from model.datasets import load_windows, load_articles, generate_examples
+from model.evaluation import bio_classification_scores
+from model.experiments import train_model, tag_examples, weighted_f1
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# Groups of feature generators that are removed together if --groups is set.
+# Generators that are not listed here form a group on their own.
+ABLATION_GROUPS = [
+    ("shape", ["StartsWithUppercaseFeature", "TokenLengthFeature", "ContainsDigitsFeature",
+               "ContainsPunctuationFeature", "OnlyDigitsFeature", "OnlyPunctuationFeature",
+               "WordPatternFeature"]),
+    ("affixes", ["PrefixFeature", "SuffixFeature"]),
+    ("clusters", ["W2VClusterFeature", "BrownClusterFeature", "BrownClusterBitsFeature"]),
+    ("lexicon", ["GazetteerFeature", "MultiTokenGazetteerFeature", "UnigramRankFeature"]),
+    ("pos", ["POSTagFeature"]),
+    ("lda", ["LDATopicFeature"])
+]
+
+# The featurized windows and the feature values of each feature generator per window.
+# These are set once in the parent process before the worker processes are started.
+_WINDOWS = None
+_WINDOWS_FEATURES_VALUES = None
+
+def main():
+    """Parses the command line arguments and then runs the ablation."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=True,
+                        help="A short name/identifier for your ablation, e.g. 'ablation1'.")
+    parser.add_argument("--groups", required=False, action="store_const", const=True,
+                        help="Whether to remove groups of feature generators (see " \
+                             "ABLATION_GROUPS) instead of single feature generators.")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of models to train in parallel.")
+    parser.add_argument("--output", required=False, default=None,
+                        help="Optional filepath to a file to which to write the results table " \
+                             "(tab-separated).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "ablation"):
+        ablation(args)
+
+def ablation(args):
+    """Featurizes the windows once and then trains and tests one model per removed group of
+    feature generators.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    global _WINDOWS, _WINDOWS_FEATURES_VALUES
+
+    # this may take a few minutes
+    print("Creating features...")
+    feature_generators = features.create_features()
+    names = [feature.__class__.__name__ for feature in feature_generators]
+
+    print("Loading windows...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           only_labeled_windows=True,
+                           nb_append=cfg.COUNT_WINDOWS_TEST + cfg.COUNT_WINDOWS_TRAIN)
+    _WINDOWS = list(windows)
+
+    print("Featurizing %d windows..." % (len(_WINDOWS)))
+    _WINDOWS_FEATURES_VALUES, timings = featurize_windows(_WINDOWS, feature_generators)
+    count_tokens = sum([len(window.tokens) for window in _WINDOWS])
+
+    print("Counting attributes...")
+    count_attributes = count_attributes_per_generator(
+        _WINDOWS[cfg.COUNT_WINDOWS_TEST:], _WINDOWS_FEATURES_VALUES[cfg.COUNT_WINDOWS_TEST:], names)
+
+    groups = create_groups(names, args.groups)
+    runs = [{"run": 0, "name": "(none)", "removed": [],
+             "model_filepath": "%s.baseline" % (args.identifier)}]
+    for group_name, group_members in groups:
+        runs.append({"run": len(runs), "name": group_name,
+                     "removed": [names.index(name) for name in group_members],
+                     "model_filepath": "%s.without_%s" % (args.identifier, group_name)})
+
+    print("Training %d models in %d processes..." % (len(runs), args.workers))
+    pool = multiprocessing.Pool(processes=args.workers)
+    results = []
+    for result in pool.imap_unordered(run_ablation, runs):
+        print("Finished run without '%s' (F1 %.4f)" % (result["name"], result["f1"]))
+        results.append(result)
+    pool.close()
+    pool.join()
+    results = sorted(results, key=lambda result: result["run"])
+
+    for result in results:
+        members = [names[idx] for idx in result["removed"]]
+        result["ms_per_token"] = 1000 * sum([timings[name] for name in members]) \
+                                 / max(count_tokens, 1)
+        result["count_attributes"] = sum([count_attributes[name] for name in members])
+
+    table = results_to_table(results)
+    print(table)
+    if args.output is not None:
+        with open(args.output, "w") as handle:
+            handle.write(table.encode("utf-8"))
+
+def featurize_windows(windows, feature_generators):
+    """Applies all feature generators to all windows, while measuring the time spent in each
+    feature generator.
+
+    Args:
+        windows: List of Window objects.
+        feature_generators: List of feature generators, as returned by create_features().
+    Returns:
+        Tuple (features values, timings), where features values contains one entry per window
+        (the results of each feature generator's convert_window()) and timings is a dictionary
+        of feature generator class name to the total time spent in it (in seconds).
+    """
+    timings = dict([(feature.__class__.__name__, 0.0) for feature in feature_generators])
+    windows_features_values = []
+    for i, window in enumerate(windows):
+        features_values = []
+        for feature in feature_generators:
+            start = time.time()
+            features_values.append(feature.convert_window(window))
+            timings[feature.__class__.__name__] += time.time() - start
+        windows_features_values.append(features_values)
+
+        if (i + 1) % 500 == 0:
+            print("Featurized %d of %d windows" % (i + 1, len(windows)))
+    return windows_features_values, timings
+
+def count_attributes_per_generator(windows, windows_features_values, names):
+    """Counts the distinct attributes (feature values including their skipchain offsets)
+    that each feature generator adds to the examples.
+
+    Args:
+        windows: List of Window objects.
+        windows_features_values: The feature values of each window, as returned by
+            featurize_windows().
+        names: The class names of the feature generators (in the same order as in the
+            feature values).
+    Returns:
+        Dictionary of feature generator class name to number of distinct attributes.
+    """
+    attributes = [set() for _ in names]
+    for window, features_values in zip(windows, windows_features_values):
+        length = len(window.tokens)
+        for generator_idx, feature_values in enumerate(features_values):
+            for token_idx, token_values in enumerate(feature_values):
+                # token token_idx is part of the features of all words in the skipchain range
+                # around it, which gives it these offsets (see Window.get_feature_values_list())
+                min_offset = max(-cfg.SKIPCHAIN_LEFT, token_idx - (length - 1))
+                max_offset = min(cfg.SKIPCHAIN_RIGHT, token_idx)
+                for offset in range(min_offset, max_offset + 1):
+                    for value in token_values:
+                        # weighted feature values are tuples (name, weight)
+                        name = value[0] if isinstance(value, tuple) else value
+                        attributes[generator_idx].add((offset, name))
+    return dict([(name, len(attributes[idx])) for idx, name in enumerate(names)])
+
+def create_groups(names, use_groups):
+    """Creates the groups of feature generators to remove.
+
+    Args:
+        names: The class names of the feature generators.
+        use_groups: Whether to use ABLATION_GROUPS or one group per feature generator.
+    Returns:
+        List of tuples (group name, list of feature generator class names).
+    """
+    if not use_groups:
+        return [(name, [name]) for name in names]
+
+    groups = []
+    grouped = set()
+    for group_name, group_members in ABLATION_GROUPS:
+        group_members = [name for name in group_members if name in names]
+        if len(group_members) > 0:
+            groups.append((group_name, group_members))
+            grouped.update(group_members)
+    for name in names:
+        if name not in grouped:
+            groups.append((name, [name]))
+    return groups
+
+def run_ablation(run):
+    """Trains and tests one model without the feature generators of a group.
+    This is executed in a worker process.
+
+    Args:
+        run: The run description, see ablation().
+    Returns:
+        The run description, extended by the keys "scores", "f1", "train_time" and "model_size".
+    """
+    for window, features_values in zip(_WINDOWS, _WINDOWS_FEATURES_VALUES):
+        window.set_feature_values([feature_values \
+                                   for idx, feature_values in enumerate(features_values) \
+                                   if idx not in run["removed"]])
+
+    train_examples = generate_examples(_WINDOWS[cfg.COUNT_WINDOWS_TEST:], verbose=False)
+    train_time, model_size = train_model(train_examples, run["model_filepath"],
+                                         params=get_training_params())
+
+    test_examples = generate_examples(_WINDOWS[:cfg.COUNT_WINDOWS_TEST], verbose=False)
+    correct_label_chains, predicted_label_chains = tag_examples(run["model_filepath"],
+                                                                test_examples)
+    scores = bio_classification_scores(correct_label_chains, predicted_label_chains)
+
+    result = dict(run)
+    result["scores"] = scores
+    result["f1"] = weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])
+    result["train_time"] = train_time
+    result["model_size"] = model_size
+    return result
+
+def get_training_params():
+    """Returns the crfsuite training parameters, as also used by train.py.
+    Returns:
+        Dictionary of crfsuite parameters.
+    """
+    params = dict()
+    if cfg.MAX_ITERATIONS is not None and cfg.MAX_ITERATIONS > 0:
+        params["max_iterations"] = cfg.MAX_ITERATIONS
+    return params
+
+def results_to_table(results):
+    """Converts the results of all runs to a (tab-separated) table.
+    The first result must be the baseline (no feature generator removed).
+
+    Args:
+        results: List of run descriptions, as returned by run_ablation().
+    Returns:
+        The table as a string.
+    """
+    def get_f1(result, label):
+        """Returns the F1 score of a label or 0.0 if the label did not appear.
+        Args:
+            result: The run description.
+            label: The label, e.g. "PER".
+        Returns:
+            float
+        """
+        return result["scores"][label][2] if label in result["scores"] else 0.0
+
+    baseline = results[0]
+    header = ["removed"] \
+             + ["f1_%s\tdelta_%s" % (label, label) for label in cfg.LABELS] \
+             + ["f1_avg", "delta_avg", "ms_per_token", "attributes", "train_seconds", "model_mb"]
+    lines = ["\t".join(header)]
+    for result in results:
+        row = [result["name"]]
+        for label in cfg.LABELS:
+            row.append("%.4f" % (get_f1(result, label)))
+            row.append("%+.4f" % (get_f1(result, label) - get_f1(baseline, label)))
+        row.append("%.4f" % (result["f1"]))
+        row.append("%+.4f" % (result["f1"] - baseline["f1"]))
+        row.append("%.4f" % (result["ms_per_token"]))
+        row.append(str(result["count_attributes"]))
+        row.append("%.1f" % (result["train_time"]))
+        row.append("%.2f" % (result["model_size"] / (1024 * 1024)))
+        lines.append("\t".join(row))
+    return "\n".join(lines)
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
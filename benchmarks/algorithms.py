@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that compares the time-to-F1 of crfsuite's training algorithms (lbfgs, l2sgd, ap, pa,
+arow) on the corpus.
+The training and holdout windows are featurized and added to one trainer once. Then each
+algorithm is trained for the same wall-clock time and crfsuite evaluates the model on the
+holdout windows after every iteration. The output table contains one row per algorithm with the
+time per iteration, the holdout F1 after several shares of the time and the time after which the
+algorithm reached several shares of the best F1 of all algorithms ("-" if never). Use it to
+choose TRAINING_ALGORITHMS and TIME_BUDGET_MINUTES (see model/budget.py).
+
+Execute via:
+    python -m benchmarks/algorithms --seconds=600
+    python -m benchmarks/algorithms --seconds=300 --algorithms="lbfgs,l2sgd" --count_windows=5000
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import os
+import random
+import time
+
+from model.budget import BudgetedTrainer
+from model.datasets import load_windows, load_articles, generate_examples
+from model.dedup import create_deduplicator
+from model.monitoring import load_holdout_examples
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# shares of the training time after which the holdout F1 is reported
+TIME_SHARES = [0.1, 0.25, 0.5, 1.0]
+
+# shares of the best holdout F1 (over all algorithms) for which the time is reported
+F1_SHARES = [0.9, 0.95, 0.99]
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=False, default="benchmark_algorithms",
+                        help="Prefix of the filepath under which to save the trained models.")
+    parser.add_argument("--seconds", required=False, default=600, type=float,
+                        help="Training time per algorithm in seconds.")
+    parser.add_argument("--algorithms", required=False,
+                        default=",".join(cfg.TRAINING_ALGORITHMS),
+                        help="Comma-separated list of crfsuite algorithms.")
+    parser.add_argument("--count_windows", required=False, default=None, type=int,
+                        help="Number of training windows (default: COUNT_WINDOWS_TRAIN).")
+    parser.add_argument("--count_holdout", required=False, default=None, type=int,
+                        help="Number of holdout windows (default: COUNT_WINDOWS_HOLDOUT or " \
+                             "1000 if that is 0).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.algorithms"):
+        benchmark(args)
+
+def benchmark(args):
+    """Compares the training algorithms by their holdout F1 over the training time.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    count_windows_train = args.count_windows if args.count_windows is not None \
+                          else cfg.COUNT_WINDOWS_TRAIN
+    count_windows_holdout = args.count_holdout if args.count_holdout is not None \
+                            else (cfg.COUNT_WINDOWS_HOLDOUT or 1000)
+    algorithms = args.algorithms.split(",")
+    trainer = BudgetedTrainer(args.seconds * len(algorithms), algorithms=algorithms)
+
+    print("Creating features...")
+    feature_generators = features.create_features()
+    print("Loading and featurizing windows...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           feature_generators, only_labeled_windows=True,
+                           nb_skip=cfg.COUNT_WINDOWS_TEST, nb_append=count_windows_train,
+                           deduplicator=create_deduplicator())
+    for feature_values_lists, labels in generate_examples(windows, verbose=False):
+        trainer.append(feature_values_lists, labels, 0)
+    # the holdout windows continue the (deduplicated) stream of training windows and are
+    # only cached if they match the settings of train.py
+    cache_filepath = cfg.HOLDOUT_CACHE_FILEPATH \
+                     if count_windows_holdout == cfg.COUNT_WINDOWS_HOLDOUT else None
+    holdout_examples = load_holdout_examples(feature_generators,
+                                             cfg.COUNT_WINDOWS_TEST + count_windows_train,
+                                             count_windows_holdout, cache_filepath)
+    for feature_values_lists, labels in holdout_examples:
+        trainer.append(feature_values_lists, labels, 1)
+
+    # train every algorithm until the time is up (or until it converges)
+    runs = []
+    for algorithm in algorithms:
+        runs.append(trainer.train_run(args.identifier, algorithm, 100000, None, 1,
+                                      time.time() + args.seconds))
+    if os.path.isfile(args.identifier):
+        os.remove(args.identifier)
+
+    best_f1 = max([f1 for run in runs for _, f1 in run["curve"] if f1 is not None] + [0.0])
+    print("Best holdout F1 of all algorithms: %.4f" % (best_f1))
+    print("\t".join(["algorithm", "iterations", "seconds_per_iteration"]
+                    + ["f1_after_%ds" % (int(args.seconds * share)) for share in TIME_SHARES]
+                    + ["best_f1"]
+                    + ["seconds_to_%d%%" % (int(100 * share)) for share in F1_SHARES]))
+    for run in runs:
+        f1_scores = [f1 for _, f1 in run["curve"] if f1 is not None]
+        row = [run["algorithm"], str(run["iterations"]),
+               "%.3f" % (run["seconds_per_iteration"] or 0.0)]
+        row.extend(["%.4f" % (get_f1_at(run["curve"], args.seconds * share)) \
+                    for share in TIME_SHARES])
+        row.append("%.4f" % (max(f1_scores + [0.0])))
+        for share in F1_SHARES:
+            seconds = get_time_to_f1(run["curve"], share * best_f1)
+            row.append("-" if seconds is None else "%.1f" % (seconds))
+        print("\t".join(row))
+
+def get_f1_at(curve, seconds):
+    """Returns the holdout F1 score of a training run at a point in time.
+    Args:
+        curve: List of pairs (elapsed seconds, holdout F1), one per iteration
+            (see BudgetedTrainer.train_run()).
+        seconds: Seconds since the start of the run.
+    Returns:
+        F1 score of the last iteration that was finished at that time (0.0 if none).
+    """
+    result = 0.0
+    for elapsed, f1 in curve:
+        if elapsed > seconds:
+            break
+        if f1 is not None:
+            result = f1
+    return result
+
+def get_time_to_f1(curve, target_f1):
+    """Returns the time after which a training run reached a holdout F1 score.
+    Args:
+        curve: List of pairs (elapsed seconds, holdout F1), one per iteration
+            (see BudgetedTrainer.train_run()).
+        target_f1: The F1 score.
+    Returns:
+        Seconds since the start of the run or None if the run never reached the score.
+    """
+    for elapsed, f1 in curve:
+        if f1 is not None and f1 >= target_f1:
+            return elapsed
+    return None
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that compares the tagging throughput of pycrfsuite.Tagger.tag() (one window at a time)
+with the batched numpy Viterbi decoder (model/viterbi.py) for several batch sizes.
+It also verifies that both predict exactly the same labels.
+
+The featurization is not part of the measured times. A trained model is required (see train.py).
+
+Execute via:
+    python -m benchmarks/batch_decoding --identifier="my_experiment" --batch_sizes="1,10,100,1000"
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import random
+import time
+
+from model.crf import open_tagger
+from model.datasets import load_windows, load_articles, generate_examples, split_to_chunks
+from model.profiling import add_profile_argument, profile
+from model.viterbi import load_batch_tagger
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=True,
+                        help="Identifier of the trained model, e.g. 'my_experiment'.")
+    parser.add_argument("--batch_sizes", required=False, default="1,10,100,1000",
+                        help="Comma-separated list of batch sizes (windows per tag_batch()).")
+    parser.add_argument("--count_windows", required=False, default=cfg.COUNT_WINDOWS_TEST,
+                        type=int, help="Number of windows to tag (default: COUNT_WINDOWS_TEST).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.batch_decoding"):
+        benchmark(args)
+
+def benchmark(args):
+    """Compares the tagging throughput of pycrfsuite with the batched numpy Viterbi decoder.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    print("Creating features...")
+    feature_generators = features.create_features()
+    print("Loading and featurizing windows...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           feature_generators, only_labeled_windows=True,
+                           nb_append=args.count_windows)
+    xseqs = [fvlists for fvlists, _ in generate_examples(windows, verbose=False)]
+
+    tagger = open_tagger(args.identifier)
+    start = time.time()
+    expected = [tagger.tag(xseq) for xseq in xseqs]
+    tagger_time = time.time() - start
+
+    start = time.time()
+    batch_tagger = load_batch_tagger(args.identifier)
+    print("Loading the batch tagger took %.2f seconds." % (time.time() - start))
+
+    print("\t".join(["decoder", "batch_size", "seconds", "windows_per_second", "same_labels"]))
+    print("\t".join(["tagger.tag", "1", "%.2f" % (tagger_time),
+                     "%.1f" % (len(xseqs) / max(tagger_time, 1e-6)), "True"]))
+    for batch_size in [int(value) for value in args.batch_sizes.split(",")]:
+        start = time.time()
+        predicted = []
+        for batch in split_to_chunks(xseqs, batch_size):
+            predicted.extend(batch_tagger.tag_batch(batch))
+        batch_time = time.time() - start
+        print("\t".join(["tag_batch", str(batch_size), "%.2f" % (batch_time),
+                         "%.1f" % (len(xseqs) / max(batch_time, 1e-6)),
+                         str(predicted == expected)]))
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
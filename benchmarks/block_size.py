@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that measures the featurization time per window as a function of the block size
+(see FEATURE_BLOCK_SIZE and convert_windows() in model/datasets.py).
+The windows are loaded once without features. Then every feature generator converts all of them,
+once via convert_window() per window and once per block size in blocks of that size. The caches
+of the POS tagger and the LDA are disabled (unless --caches is set), as otherwise every run after
+the first one would only measure cache lookups.
+
+Execute via:
+    python -m benchmarks/block_size
+    python -m benchmarks/block_size --sizes="1,10,100,1000" --windows=2000
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import random
+import time
+
+from model.datasets import load_windows, load_articles, split_to_chunks, convert_windows
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", required=False, default="1,10,100,1000",
+                        help="Comma-separated list of block sizes.")
+    parser.add_argument("--windows", required=False, default=1000, type=int,
+                        help="Number of windows to featurize per block size.")
+    parser.add_argument("--caches", required=False, action="store_const", const=True,
+                        help="Whether to keep the caches of the POS tagger and the LDA enabled.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.block_size"):
+        benchmark(args)
+
+def benchmark(args):
+    """Measures the featurization time per window for each block size.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    print("Creating features...")
+    feature_generators = features.create_features()
+    if not args.caches:
+        for feature in feature_generators:
+            if hasattr(feature, "pos_tagger"):
+                feature.pos_tagger.cache = None
+            if hasattr(feature, "lda_wrapper"):
+                feature.lda_wrapper.cache = None
+
+    print("Loading windows...")
+    windows = list(load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                                only_labeled_windows=True, nb_append=args.windows))
+    count = max(len(windows), 1)
+
+    names = [feature.__class__.__name__ for feature in feature_generators]
+    print("\t".join(["block_size"] + names + ["total_ms_per_window"]))
+    sizes = [None] + [int(size) for size in args.sizes.split(",")]
+    for size in sizes:
+        timings = [measure(feature, windows, size) for feature in feature_generators]
+        print("\t".join(["per window" if size is None else str(size)]
+                        + ["%.3f" % (1000 * seconds / count) for seconds in timings]
+                        + ["%.3f" % (1000 * sum(timings) / count)]))
+
+def measure(feature, windows, block_size):
+    """Measures how long a feature generator needs to convert windows.
+    Args:
+        feature: The feature generator.
+        windows: List of Window objects.
+        block_size: Number of windows per call of convert_windows() or None to call
+            convert_window() once per window.
+    Returns:
+        The time in seconds.
+    """
+    start = time.time()
+    if block_size is None:
+        for window in windows:
+            feature.convert_window(window)
+    else:
+        for block in split_to_chunks(windows, block_size):
+            convert_windows(feature, block)
+    return time.time() - start
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
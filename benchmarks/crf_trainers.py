@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that compares the time-to-F1 of pycrfsuite's trainer with the numpy CRF trainer
+(model/crf.py).
+The windows are featurized once. Then each trainer is trained with increasing limits on the
+number of iterations and each resulting model is tested on the test windows. The output table
+contains one row per (trainer, iteration limit) with the training time and the F1 score, i.e.
+it shows which trainer reaches a given F1 score faster.
+
+Execute via:
+    python -m benchmarks/crf_trainers --iterations="10,25,50,100" --workers=8
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import multiprocessing
+import os
+import random
+
+from model.datasets import load_windows, load_articles, generate_examples
+from model.evaluation import bio_classification_scores
+from model.experiments import train_model, tag_examples, weighted_f1
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=False, default="benchmark_crf_trainers",
+                        help="Prefix of the filepaths under which to save the trained models.")
+    parser.add_argument("--iterations", required=False, default="10,25,50,100",
+                        help="Comma-separated list of limits on the number of iterations.")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of processes of the numpy trainer.")
+    parser.add_argument("--c2", required=False, default=1.0, type=float,
+                        help="L2 regularization of all trainers.")
+    parser.add_argument("--count_windows", required=False, default=None, type=int,
+                        help="Number of training windows (default: COUNT_WINDOWS_TRAIN).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.crf_trainers"):
+        benchmark(args)
+
+def benchmark(args):
+    """Compares the time-to-F1 of pycrfsuite's trainer with the numpy CRF trainer.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    count_windows_train = args.count_windows if args.count_windows is not None \
+                          else cfg.COUNT_WINDOWS_TRAIN
+    print("Creating features...")
+    feature_generators = features.create_features()
+    print("Loading and featurizing windows...")
+    windows = list(load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                                feature_generators, only_labeled_windows=True,
+                                nb_append=cfg.COUNT_WINDOWS_TEST + count_windows_train))
+    train_examples = list(generate_examples(windows[cfg.COUNT_WINDOWS_TEST:], verbose=False))
+    test_examples = list(generate_examples(windows[:cfg.COUNT_WINDOWS_TEST], verbose=False))
+
+    trainers = [("crfsuite-lbfgs", "crfsuite", "lbfgs", 1),
+                ("numpy-lbfgs", "numpy", "lbfgs", args.workers),
+                ("numpy-adagrad", "numpy", "adagrad", args.workers)]
+    rows = []
+    for name, engine, algorithm, workers in trainers:
+        for max_iterations in [int(value) for value in args.iterations.split(",")]:
+            print("Training %s with max. %d iterations..." % (name, max_iterations))
+            model_filepath = "%s.%s.%d" % (args.identifier, name, max_iterations)
+            train_time, model_size = train_model(train_examples, model_filepath,
+                                                 algorithm=algorithm,
+                                                 params={"c2": args.c2,
+                                                         "max_iterations": max_iterations},
+                                                 engine=engine, workers=workers)
+            correct_label_chains, predicted_label_chains = tag_examples(model_filepath,
+                                                                        test_examples)
+            scores = bio_classification_scores(correct_label_chains, predicted_label_chains)
+            rows.append([name, str(max_iterations), "%.1f" % (train_time),
+                         "%.4f" % (weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])),
+                         "%.2f" % (model_size / (1024 * 1024))])
+            os.remove(model_filepath)
+
+    print("\t".join(["trainer", "max_iterations", "train_seconds", "f1_avg", "model_mb"]))
+    for row in rows:
+        print("\t".join(row))
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
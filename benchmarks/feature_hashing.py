@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that quantifies how much memory feature hashing (model/hashing.py) saves and how much
+F1 it costs.
+The windows are featurized once. Then one model is trained without hashing (baseline) and one
+model per number of buckets, each one in a new process. For each model the script reports the
+number of distinct attributes, the increase of the peak memory usage (RSS) of its process during
+training, the model size, the training time and the F1 score. It also reports the share of
+colliding pairs of attributes (of the same length) with opposite signs in the signed scheme,
+which should be around 50%.
+
+Execute via:
+    python -m benchmarks/feature_hashing --buckets="65536,262144,1048576"
+    python -m benchmarks/feature_hashing --buckets="262144" --unsigned
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+
+from model.datasets import load_windows, load_articles, generate_examples
+from model.evaluation import bio_classification_scores
+from model.experiments import train_model, tag_examples, weighted_f1
+from model.hashing import AttributeHasher
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# The featurized examples. These are set once in the parent process before the worker processes
+# are started.
+_TRAIN_EXAMPLES = None
+_TEST_EXAMPLES = None
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=False, default="benchmark_feature_hashing",
+                        help="Prefix of the filepaths under which to save the trained models.")
+    parser.add_argument("--buckets", required=False, default="65536,262144,1048576",
+                        help="Comma-separated list of bucket counts.")
+    parser.add_argument("--unsigned", required=False, action="store_const", const=True,
+                        help="Whether to use the unsigned hashing scheme.")
+    parser.add_argument("--workers", required=False, default=1, type=int,
+                        help="Number of models to train in parallel. (Parallel runs share the " \
+                             "RAM, which may distort the memory measurements.)")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.feature_hashing"):
+        benchmark(args)
+
+def benchmark(args):
+    """Trains and tests one model without hashing and one per number of buckets.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    global _TRAIN_EXAMPLES, _TEST_EXAMPLES
+
+    print("Creating features...")
+    feature_generators = features.create_features()
+    print("Loading and featurizing windows...")
+    windows = list(load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                                feature_generators, only_labeled_windows=True,
+                                nb_append=cfg.COUNT_WINDOWS_TEST + cfg.COUNT_WINDOWS_TRAIN))
+    _TRAIN_EXAMPLES = list(generate_examples(windows[cfg.COUNT_WINDOWS_TEST:], verbose=False))
+    _TEST_EXAMPLES = list(generate_examples(windows[:cfg.COUNT_WINDOWS_TEST], verbose=False))
+    windows = None
+
+    runs = [{"count_buckets": None, "signed": False,
+             "model_filepath": "%s.baseline" % (args.identifier)}]
+    for count_buckets in [int(value) for value in args.buckets.split(",")]:
+        runs.append({"count_buckets": count_buckets, "signed": not args.unsigned,
+                     "model_filepath": "%s.%d" % (args.identifier, count_buckets)})
+
+    # each run gets its own process, so that the peak memory usage can be measured per run
+    pool = multiprocessing.Pool(processes=args.workers, maxtasksperchild=1)
+    results = pool.map(run_benchmark, runs, chunksize=1)
+    pool.close()
+    pool.join()
+
+    baseline = results[0]
+    print("\t".join(["buckets", "signed", "attributes", "opposite_sign_pairs", "train_rss_mb",
+                     "model_mb", "train_seconds", "f1_avg", "delta_f1"]))
+    for result in results:
+        print("\t".join([str(result["count_buckets"]), str(result["signed"]),
+                         str(result["count_attributes"]),
+                         "%.1f%%" % (100 * result["opposite_sign_pairs"]),
+                         "%.1f" % (result["train_rss"] / 1024),
+                         "%.2f" % (result["model_size"] / (1024 * 1024)),
+                         "%.1f" % (result["train_time"]),
+                         "%.4f" % (result["f1"]),
+                         "%+.4f" % (result["f1"] - baseline["f1"])]))
+
+def run_benchmark(run):
+    """Trains and tests one model with the hashing settings of a run.
+    This is executed in a worker process.
+
+    Args:
+        run: Dictionary with the keys count_buckets (None for no hashing), signed and
+            model_filepath.
+    Returns:
+        The run dictionary, extended by count_attributes, opposite_sign_pairs (share of the
+        colliding pairs of attributes), train_rss (in KB), model_size, train_time and f1.
+    """
+    hasher = None
+    if run["count_buckets"] is not None:
+        hasher = AttributeHasher(run["count_buckets"], run["signed"])
+
+    def prepare(examples):
+        """Hashes the attributes of examples (if hashing is active)."""
+        for feature_values_lists, labels in examples:
+            if hasher is not None:
+                feature_values_lists = hasher.hash_example(feature_values_lists)
+            yield (feature_values_lists, labels)
+
+    attributes = set()
+    for feature_values_lists, _ in prepare(_TRAIN_EXAMPLES):
+        for feature_values in feature_values_lists:
+            attributes.update(feature_values)
+
+    opposite_sign_pairs = 0.0
+    if hasher is not None and hasher.signed:
+        original_attributes = set()
+        for feature_values_lists, _ in _TRAIN_EXAMPLES:
+            for feature_values in feature_values_lists:
+                original_attributes.update(feature_values)
+        count_pairs, count_opposite = hasher.count_collisions(original_attributes)
+        opposite_sign_pairs = count_opposite / max(count_pairs, 1)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    train_time, model_size = train_model(prepare(_TRAIN_EXAMPLES), run["model_filepath"],
+                                         params={"max_iterations": cfg.MAX_ITERATIONS} \
+                                                if cfg.MAX_ITERATIONS else None)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    correct_label_chains, predicted_label_chains = tag_examples(run["model_filepath"],
+                                                                prepare(_TEST_EXAMPLES))
+    scores = bio_classification_scores(correct_label_chains, predicted_label_chains)
+    os.remove(run["model_filepath"])
+
+    result = dict(run)
+    result["count_attributes"] = len(attributes)
+    result["opposite_sign_pairs"] = opposite_sign_pairs
+    result["train_rss"] = rss_after - rss_before
+    result["model_size"] = model_size
+    result["train_time"] = train_time
+    result["f1"] = weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])
+    return result
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark that compares the encodings of TokenLengthFeature and UnigramRankFeature
+(see NUMERIC_FEATURE_ENCODING): one attribute per value ("categorical"), one weighted attribute
+("numeric") or one attribute per log2-bucket ("buckets").
+The windows are featurized once. Then only the values of these two feature generators are
+generated again with each encoding and one model is trained per encoding (in parallel
+processes). For each model the script reports the number of distinct attributes (in total and
+of the two feature generators), the training time, the model size and the F1 score.
+
+Execute via:
+    python -m benchmarks/numeric_features
+    python -m benchmarks/numeric_features --encodings="categorical,buckets"
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import multiprocessing
+import os
+import random
+
+from model.datasets import load_windows, load_articles, generate_examples
+from model.evaluation import bio_classification_scores
+from model.experiments import train_model, tag_examples, weighted_f1
+from model.features import TokenLengthFeature, UnigramRankFeature
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# The windows and the feature values of each feature generator per window. These are set once
+# in the parent process before the worker processes are started.
+_WINDOWS = None
+_WINDOWS_FEATURES_VALUES = None
+# indices of TokenLengthFeature and UnigramRankFeature among the feature generators
+_LENGTH_IDX = None
+_RANK_IDX = None
+_UNIGRAMS = None
+
+def main():
+    """Parses the command line arguments and then runs the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=False, default="benchmark_numeric_features",
+                        help="Prefix of the filepaths under which to save the trained models.")
+    parser.add_argument("--encodings", required=False, default="categorical,numeric,buckets",
+                        help="Comma-separated list of encodings to compare.")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of models to train in parallel.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "benchmarks.numeric_features"):
+        benchmark(args)
+
+def benchmark(args):
+    """Trains and tests one model per encoding of the numeric features.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    global _WINDOWS, _WINDOWS_FEATURES_VALUES, _LENGTH_IDX, _RANK_IDX, _UNIGRAMS
+
+    print("Creating features...")
+    feature_generators = features.create_features()
+    names = [feature.__class__.__name__ for feature in feature_generators]
+    _LENGTH_IDX = names.index("TokenLengthFeature")
+    _RANK_IDX = names.index("UnigramRankFeature")
+    _UNIGRAMS = feature_generators[_RANK_IDX].unigrams
+
+    print("Loading and featurizing windows...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           only_labeled_windows=True,
+                           nb_append=cfg.COUNT_WINDOWS_TEST + cfg.COUNT_WINDOWS_TRAIN)
+    _WINDOWS = list(windows)
+    _WINDOWS_FEATURES_VALUES = [[feature.convert_window(window) \
+                                 for feature in feature_generators] for window in _WINDOWS]
+
+    runs = [{"encoding": encoding, "model_filepath": "%s.%s" % (args.identifier, encoding)} \
+            for encoding in args.encodings.split(",")]
+    pool = multiprocessing.Pool(processes=args.workers)
+    results = pool.map(run_benchmark, runs, chunksize=1)
+    pool.close()
+    pool.join()
+
+    baseline = results[0]
+    print("\t".join(["encoding", "attributes", "length_rank_attributes", "train_seconds",
+                     "model_mb", "f1_avg", "delta_f1"]))
+    for result in results:
+        print("\t".join([result["encoding"],
+                         "%d (%+.1f%%)" % (result["count_attributes"],
+                                           100 * (result["count_attributes"] \
+                                                  / max(baseline["count_attributes"], 1) - 1)),
+                         str(result["count_length_rank_attributes"]),
+                         "%.1f" % (result["train_time"]),
+                         "%.2f" % (result["model_size"] / (1024 * 1024)),
+                         "%.4f" % (result["f1"]),
+                         "%+.4f" % (result["f1"] - baseline["f1"])]))
+
+def run_benchmark(run):
+    """Trains and tests one model with one encoding of the length and rank features.
+    This is executed in a worker process.
+
+    Args:
+        run: Dictionary with the keys encoding and model_filepath.
+    Returns:
+        The run dictionary, extended by count_attributes, count_length_rank_attributes,
+        train_time, model_size and f1.
+    """
+    length_feature = TokenLengthFeature(encoding=run["encoding"])
+    rank_feature = UnigramRankFeature(_UNIGRAMS, encoding=run["encoding"])
+    for window, features_values in zip(_WINDOWS, _WINDOWS_FEATURES_VALUES):
+        features_values = list(features_values)
+        features_values[_LENGTH_IDX] = length_feature.convert_window(window)
+        features_values[_RANK_IDX] = rank_feature.convert_window(window)
+        window.set_feature_values(features_values)
+
+    train_examples = list(generate_examples(_WINDOWS[cfg.COUNT_WINDOWS_TEST:], verbose=False))
+    attributes = set()
+    for feature_values_lists, _ in train_examples:
+        for feature_values in feature_values_lists:
+            attributes.update(feature_values)
+    # e.g. "-3:l=7", "0:l" or "2:ng1=b5"
+    length_rank_attributes = [attribute for attribute in attributes \
+                              if attribute.split(":", 1)[1].split("=", 1)[0] in ["l", "ng1"]]
+
+    train_time, model_size = train_model(train_examples, run["model_filepath"],
+                                         params={"max_iterations": cfg.MAX_ITERATIONS} \
+                                                if cfg.MAX_ITERATIONS else None)
+
+    test_examples = generate_examples(_WINDOWS[:cfg.COUNT_WINDOWS_TEST], verbose=False)
+    correct_label_chains, predicted_label_chains = tag_examples(run["model_filepath"],
+                                                                test_examples)
+    scores = bio_classification_scores(correct_label_chains, predicted_label_chains)
+    os.remove(run["model_filepath"])
+
+    result = dict(run)
+    result["count_attributes"] = len(attributes)
+    result["count_length_rank_attributes"] = len(length_rank_attributes)
+    result["train_time"] = train_time
+    result["model_size"] = model_size
+    result["f1"] = weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])
+    return result
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
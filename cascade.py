@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Script to choose the confidence threshold of the cascade (see model/cascade.py).
+Both models have to be trained first, the cheap one with only the cheap feature generators:
+    python train.py --identifier="my_experiment"
+    python train.py --identifier="my_experiment_cheap" --cheap
+
+The script tags the test windows (the first COUNT_WINDOWS_TEST windows) once with both models,
+while measuring the time of the cheap tier (cheap features and cheap model) and of the full tier
+(remaining features and full model) per window. Then it computes for each threshold which windows
+the cascade would have escalated to the full model, the resulting F1 scores and the throughput.
+
+Example usage:
+    python cascade.py --cheap="my_experiment_cheap" --full="my_experiment"
+    python cascade.py --cheap="my_experiment_cheap" --full="my_experiment" \
+                      --thresholds="0.5,0.8,0.9,0.95" --confidence="probability"
+
+Notice that the POS tagger and the LDA use caches, i.e. the time of the full tier will be much
+lower if the test windows were already featurized in a previous run.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import random
+import time
+
+from model.cascade import CascadeTagger
+from model.datasets import load_windows, load_articles
+from model.evaluation import IncrementalEvaluation
+from model.experiments import weighted_f1
+from model.profiling import add_profile_argument, profile
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+def main():
+    """Parses the command line arguments and then evaluates the thresholds."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cheap", required=True,
+                        help="Identifier of the cheap model (trained via train.py --cheap).")
+    parser.add_argument("--full", required=True,
+                        help="Identifier of the full model.")
+    parser.add_argument("--thresholds", required=False,
+                        default="0.5,0.6,0.7,0.8,0.85,0.9,0.95,0.98,0.99",
+                        help="Comma-separated list of thresholds to evaluate.")
+    parser.add_argument("--confidence", required=False, default=cfg.CASCADE_CONFIDENCE,
+                        choices=["marginal", "probability"],
+                        help="How to measure the confidence of the cheap model " \
+                             "(default: CASCADE_CONFIDENCE).")
+    parser.add_argument("--windows", required=False, default=cfg.COUNT_WINDOWS_TEST, type=int,
+                        help="Number of test windows (default: COUNT_WINDOWS_TEST).")
+    parser.add_argument("--output", required=False, default=None,
+                        help="Optional filepath to a file to which to write the results table " \
+                             "(tab-separated).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "cascade"):
+        evaluate_cascade(args)
+
+def evaluate_cascade(args):
+    """Tags the test windows with the cascade and evaluates the thresholds.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    thresholds = [float(threshold) for threshold in args.thresholds.split(",")]
+
+    print("Creating features...")
+    feature_generators = features.create_features()
+    cascade = CascadeTagger(args.cheap, args.full, feature_generators,
+                            confidence=args.confidence)
+
+    print("Tagging test windows with both models...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           only_labeled_windows=True, nb_append=args.windows)
+    results = tag_windows(cascade, windows)
+
+    table = results_to_table(results, thresholds)
+    print(table)
+    if args.output is not None:
+        with open(args.output, "w") as handle:
+            handle.write(table.encode("utf-8"))
+
+def tag_windows(cascade, windows):
+    """Tags windows with both tiers of a cascade and measures the time of each tier.
+    Args:
+        cascade: The CascadeTagger.
+        windows: Windows without features.
+    Returns:
+        List of dictionaries, one per window, with the keys "labels", "cheap_labels",
+        "full_labels", "confidence", "seconds_cheap_features", "seconds_cheap" (features and
+        tagging) and "seconds_full" (remaining features and tagging).
+    """
+    results = []
+    for i, window in enumerate(windows):
+        start = time.time()
+        computed = dict()
+        for feature in cascade.cheap.feature_generators:
+            computed[id(feature)] = feature.convert_window(window)
+        seconds_cheap_features = time.time() - start
+        cheap_labels, confidence = cascade.tag_cheap(window, computed)
+        seconds_cheap = time.time() - start
+
+        start = time.time()
+        full_labels = cascade.tag_full(window, computed)
+        seconds_full = time.time() - start
+
+        results.append({"labels": window.get_labels(), "cheap_labels": cheap_labels,
+                        "full_labels": full_labels, "confidence": confidence,
+                        "seconds_cheap_features": seconds_cheap_features,
+                        "seconds_cheap": seconds_cheap, "seconds_full": seconds_full})
+        if (i + 1) % 500 == 0:
+            print("Tagged %d windows" % (i + 1))
+    return results
+
+def evaluate_threshold(results, threshold):
+    """Computes the scores and the time of the cascade for one threshold.
+    Args:
+        results: The results of tag_windows().
+        threshold: The threshold. None means "always use the full model without the cheap tier".
+    Returns:
+        Dictionary with the keys "escalated", "f1_token", "f1_entity" and "seconds".
+    """
+    evaluation = IncrementalEvaluation()
+    escalated = 0
+    seconds = 0.0
+    for result in results:
+        if threshold is None:
+            # the full model alone computes the cheap features, but does not use the cheap model
+            labels = result["full_labels"]
+            seconds += result["seconds_cheap_features"] + result["seconds_full"]
+            escalated += 1
+        elif result["confidence"] < threshold:
+            labels = result["full_labels"]
+            seconds += result["seconds_cheap"] + result["seconds_full"]
+            escalated += 1
+        else:
+            labels = result["cheap_labels"]
+            seconds += result["seconds_cheap"]
+        evaluation.update(result["labels"], labels)
+    return {"escalated": escalated,
+            "f1_token": weighted_f1(evaluation.token_scores(), ignore_labels=[cfg.NO_NE_LABEL]),
+            "f1_entity": weighted_f1(evaluation.entity_scores()),
+            "seconds": seconds}
+
+def results_to_table(results, thresholds):
+    """Evaluates all thresholds and converts the results to a (tab-separated) table.
+    The first rows are the cheap model alone (threshold 0) and the full model alone.
+
+    Args:
+        results: The results of tag_windows().
+        thresholds: List of thresholds.
+    Returns:
+        The table as a string.
+    """
+    count = max(len(results), 1)
+    full_only = evaluate_threshold(results, None)
+    rows = [("cheap only", evaluate_threshold(results, 0.0)), ("full only", full_only)]
+    rows.extend([("%.4f" % (threshold), evaluate_threshold(results, threshold)) \
+                 for threshold in thresholds])
+
+    header = ["threshold", "escalated", "f1_token", "delta_token", "f1_entity", "delta_entity",
+              "ms_per_window", "windows_per_second", "speedup"]
+    lines = ["\t".join(header)]
+    for name, row in rows:
+        lines.append("\t".join([
+            name,
+            "%.1f%%" % (100 * row["escalated"] / count),
+            "%.4f" % (row["f1_token"]),
+            "%+.4f" % (row["f1_token"] - full_only["f1_token"]),
+            "%.4f" % (row["f1_entity"]),
+            "%+.4f" % (row["f1_entity"] - full_only["f1_entity"]),
+            "%.2f" % (1000 * row["seconds"] / count),
+            "%.1f" % (count / max(row["seconds"], 1e-9)),
+            "%.2fx" % (full_only["seconds"] / max(row["seconds"], 1e-9))]))
+    return "\n".join(lines)
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
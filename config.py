@@ -11,6 +11,10 @@ CURRENT_DIR = os.path.dirname(os.path.realpath(__file__))
 #   John/PER Doe/PER did something yesterday. Then he did something else.
 #   Washington/LOC D.C./LOC is the capital of the U.S.
 #   ....
+# The corpus may be compressed (.gz, .bz2, .xz) and may be split into several shards by using
+# a glob pattern, e.g. "/var/corpus/annotated-*.txt.gz". Files ending in .jsonl, .tsv (germeval)
+# and .conll are read with the respective readers in model/readers.py. A directory created by
+# preprocessing/binarize_corpus.py is loaded as a binary corpus (without any text parsing).
 ARTICLES_FILEPATH = "/media/aj/grab/nlp/corpus/processed/wikipedia-ner/annotated-fulltext.txt"
 
 # filepath to the germeval corpus 2014 for german NER
@@ -25,6 +29,28 @@ UNIGRAMS_FILEPATH = os.path.join(CURRENT_DIR, "preprocessing/unigrams.txt")
 # in preprocessing/collect_unigrams.py
 UNIGRAMS_PERSON_FILEPATH = os.path.join(CURRENT_DIR, "preprocessing/unigrams_per.txt")
 
+# whether to use the multi-token gazetteer feature (MultiTokenGazetteerFeature), which requires
+# the gazetteer at GAZETTEER_FILEPATH. Models must be tested with the same setting that they were
+# trained with. Off by default, so that setups and models from before the gazetteer keep their
+# features.
+MULTI_TOKEN_GAZETTEER = False
+
+# filepath to the multi-token gazetteer (names of all labels, e.g. "Ang Lee" or "New York"),
+# generated by preprocessing/build_gazetteer.py
+GAZETTEER_FILEPATH = os.path.join(CURRENT_DIR, "preprocessing/gazetteer.bin")
+
+# maximum number of tokens of a name in the multi-token gazetteer
+GAZETTEER_MAX_TOKENS = 6
+
+# minimum number of times that a name must appear with a label in the corpus to be added to the
+# multi-token gazetteer (for that label)
+GAZETTEER_MIN_COUNT = 2
+
+# minimum share of all appearances of a name in the corpus in which it has the label, e.g. 0.5
+# means that at least half of all appearances of "Paris" must be labeled as LOC for "Paris" to
+# be added to the gazetteer as LOC (removes common words that are sometimes part of names)
+GAZETTEER_MIN_LABEL_RATIO = 0.5
+
 # number of words to skip in the list of all unigrams for the CRF training,
 # e.g. a value of 100 means that during feature generation no feature will be generated
 # for the 100 most common words (except for "not in unigrams list" feature)
@@ -78,6 +104,15 @@ STANFORD_MODEL_FILEPATH = os.path.join(STANFORD_DIR, "models/german-fast.tagger"
 # filepath to the cache to use for the pos tagger during training of the CRF
 POS_TAGGER_CACHE_FILEPATH = os.path.join(CURRENT_DIR, "pos.cache")
 
+# which POS tagger to use: "stanford" (the stanford POS tagger via nltk, requires java) or
+# "perceptron" (an averaged perceptron tagger that was trained on the results of the stanford
+# tagger via preprocessing/train_pos_perceptron.py, runs in-process and is much faster)
+POS_TAGGER_ENGINE = "stanford"
+
+# filepath to the trained averaged perceptron POS tagger (only used if POS_TAGGER_ENGINE is
+# "perceptron")
+POS_PERCEPTRON_MODEL_FILEPATH = os.path.join(CURRENT_DIR, "pos.perceptron")
+
 # filepath to the w2v clusters file as genreated by the word2vec tool
 W2V_CLUSTERS_FILEPATH = "/media/aj/ssd2a/nlp/corpus/word2vec/wikipedia-de/classes1000_cbow0_size300_neg0_win10_sample1em3_min50.txt"
 
@@ -87,6 +122,16 @@ BROWN_CLUSTERS_FILEPATH = "/media/aj/ssd2a/nlp/corpus/brown/wikipedia-de/brown_c
 # window size of each example to train on
 WINDOW_SIZE = 50
 
+# number of windows to which the feature generators are applied at once (see load_windows()).
+# Larger blocks let the POS tagger and the LDA process more windows per call.
+FEATURE_BLOCK_SIZE = 100
+
+# number of threads that apply the feature generators to blocks of windows in parallel (see
+# load_windows()). Threads share all loaded resources. They help mostly while waiting for the
+# Stanford POS tagger (a separate JVM process), as python code only runs in one thread at a time.
+# 1 deactivates the threads.
+FEATURE_THREADS = 1
+
 # how many words to the left of a word will be part of the feature set of a word,
 # e.g. if set to >=1 and the word 1 left of a word W has the feature "w2v=123" then W will get a
 # featur "-1:w2v=123".
@@ -95,6 +140,42 @@ SKIPCHAIN_LEFT = 5
 # see SKIPCHAIN_LEFT, just to the right
 SKIPCHAIN_RIGHT = 5
 
+# minimum number of times that an attribute (a feature value including its skipchain offset,
+# e.g. "-3:pf=Joh") must appear among the training windows to be used. Rarer attributes are
+# removed before the examples are added to the trainer, which reduces the memory usage and the
+# time per training iteration. The same attributes are then also removed during testing.
+# A value of 1 keeps all attributes.
+ATTRIBUTE_MIN_FREQ = 1
+
+# optional minimum frequencies per feature, overriding ATTRIBUTE_MIN_FREQ if higher,
+# e.g. {"pf": 3, "sf": 3, "wp": 2, "lda": 2}. Features are identified by the name of their feature
+# values (the part before the "=" without topic indices, e.g. "lda" for "lda_15=1").
+ATTRIBUTE_MIN_FREQ_PER_FEATURE = {}
+
+# optional minimum frequencies per skipchain offset, overriding ATTRIBUTE_MIN_FREQ if higher,
+# e.g. {-5: 3, -4: 2, 4: 2, 5: 3}
+ATTRIBUTE_MIN_FREQ_PER_OFFSET = {}
+
+# Number of buckets for feature hashing. If set, every attribute (feature value including its
+# skipchain offset) is hashed into one of this many buckets before it is added to the trainer,
+# which bounds the memory usage of the training and the size of the model, at the cost of some
+# collisions between attributes. The same hashing is applied during testing.
+# None deactivates feature hashing.
+FEATURE_HASHING_BUCKETS = None
+
+# whether colliding attributes get random signs (+1/-1), so that they cancel each other out on
+# average instead of always adding up (only used if FEATURE_HASHING_BUCKETS is set)
+FEATURE_HASHING_SIGNED = True
+
+# How TokenLengthFeature ("l") and UnigramRankFeature ("ng1") encode their values:
+#   "categorical": one attribute per value, e.g. "l=7" and "ng1=57" (up to 31 and 1001 values)
+#   "numeric": one weighted attribute per feature, e.g. {"l": 0.23} (scaled to 0 to 1)
+#   "buckets": one attribute per log2-bucket, e.g. "l=b2" for lengths 4-7
+# "numeric" and "buckets" need far fewer attributes (times skipchain offsets and labels). The
+# same encoding must be used for training and testing. Compare them via
+# "python -m benchmarks/numeric_features".
+NUMERIC_FEATURE_ENCODING = "categorical"
+
 # maximum number of optimizer iterations during training of the CRF (if set to None the optimizer
 # will decide when to quit)
 MAX_ITERATIONS = None
@@ -106,6 +187,100 @@ COUNT_WINDOWS_TRAIN = 20000
 # Number of windows to use during testing
 COUNT_WINDOWS_TEST = 4000
 
+# Number of windows that crfsuite evaluates after every training iteration (holdout windows,
+# taken after the training windows). Their F1 score is written to the training log
+# ("<identifier>.training.json") and used for early stopping. 0 deactivates the holdout windows.
+COUNT_WINDOWS_HOLDOUT = 0
+
+# filepath to the cache of the featurized holdout windows
+HOLDOUT_CACHE_FILEPATH = os.path.join(CURRENT_DIR, "holdout.pickle")
+
+# Stop the training if the F1 score on the holdout windows did not improve for this many
+# iterations (the model of the best iteration is then saved). Requires COUNT_WINDOWS_HOLDOUT > 0.
+# None deactivates early stopping.
+EARLY_STOPPING_PATIENCE = None
+
+# minimum increase of the holdout F1 score that counts as an improvement for the early stopping
+EARLY_STOPPING_MIN_DELTA = 0.001
+
+# Wall-clock budget of the training in minutes ("python train.py --time_budget=45" overrides it).
+# Within the budget, train.py first trains each of TRAINING_ALGORITHMS for a short time, then
+# trains the one with the best holdout F1 with as many iterations as fit into the remaining time
+# (see model/budget.py). The best model so far is always saved under the identifier. Requires
+# COUNT_WINDOWS_HOLDOUT > 0. None trains with crfsuite's default algorithm (lbfgs) and
+# MAX_ITERATIONS. Compare the algorithms via "python -m benchmarks/algorithms".
+TIME_BUDGET_MINUTES = None
+
+# crfsuite's training algorithms among which to choose within the time budget
+TRAINING_ALGORITHMS = ["lbfgs", "l2sgd", "ap", "pa", "arow"]
+
+# share of the time budget that is spent on training every algorithm for a short time
+TIME_BUDGET_PROBE_SHARE = 0.3
+
+# directory in which the results of "--profile" are saved (if no filepath prefix is given)
+PROFILE_DIRPATH = os.path.join(CURRENT_DIR, "profiles")
+
+# seconds between two samples of the sampling profiler of "--profile"
+PROFILE_INTERVAL = 0.005
+
+# directory of the state of pipeline.py (keys and hashes of the stages, timings), of the logs of
+# the stages and of the stored artifacts
+PIPELINE_DIRPATH = os.path.join(CURRENT_DIR, "pipeline")
+
+# maximum number of stages that pipeline.py runs at the same time
+PIPELINE_JOBS = 1
+
+# Whether pipeline.py keeps a copy of the outputs of every successful run of a stage (under the
+# key of its inputs), so that returning to a previous config restores them instead of running
+# the stage again. Needs disk space for every stored version of the models.
+PIPELINE_STORE_ARTIFACTS = False
+
+# Whether train.py and the LDA training drop articles/windows that are near-duplicates of
+# previously loaded ones (MinHash/LSH over word shingles, see model/dedup.py). Dropped articles and
+# windows are never featurized or trained on. The test windows are not deduplicated.
+DEDUP_ARTICLES = False
+DEDUP_WINDOWS = False
+
+# minimum estimated Jaccard similarity (of the sets of 3-word shingles) of two articles/windows
+# for them to count as near-duplicates
+DEDUP_THRESHOLD = 0.8
+
+# length of the MinHash signatures (higher = more precise, but slower and more memory)
+DEDUP_NUM_PERMUTATIONS = 64
+
+# Feature generators of the cheap model of the cascade (train it via "train.py --cheap"). The
+# cascade tags every window with the cheap model first and only featurizes the windows whose
+# confidence is below CASCADE_THRESHOLD with all feature generators (e.g. POS and LDA) and tags
+# them with the full model (see model/cascade.py and cascade.py).
+CASCADE_CHEAP_FEATURES = ["StartsWithUppercaseFeature", "TokenLengthFeature",
+                          "ContainsDigitsFeature", "ContainsPunctuationFeature",
+                          "OnlyDigitsFeature", "OnlyPunctuationFeature", "W2VClusterFeature",
+                          "BrownClusterFeature", "BrownClusterBitsFeature", "GazetteerFeature",
+                          "MultiTokenGazetteerFeature", "WordPatternFeature",
+                          "UnigramRankFeature", "PrefixFeature", "SuffixFeature"]
+
+# windows tagged by the cheap model with a lower confidence than this are tagged again by the
+# full model (use cascade.py to choose the threshold)
+CASCADE_THRESHOLD = 0.9
+
+# How the confidence of the cheap model in a window is measured:
+#   "marginal": the lowest marginal probability of any predicted label in the window
+#   "probability": the probability of the whole predicted label sequence
+CASCADE_CONFIDENCE = "marginal"
+
+# Optional memory budget in MB (resident set size of the process). If set, train.py moves the
+# featurized windows that it has to keep for the second pass over them (see ATTRIBUTE_MIN_FREQ)
+# to a temporary file on disk whenever the process uses more memory than this, instead of
+# keeping them in RAM. The memory reports mark stages that exceeded the budget.
+MEMORY_BUDGET_MB = None
+
+# directory of the temporary files of MEMORY_BUDGET_MB (None = the system's temporary directory)
+MEMORY_SPILL_DIRPATH = None
+
+# Whether the memory reports also contain the allocations measured by tracemalloc
+# (only python 3, slows down the featurization)
+MEMORY_TRACEMALLOC = False
+
 # Label for any word that has no named entity label
 NO_NE_LABEL = "O"
 
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Training of the CRF within a wall-clock time budget, including the choice of crfsuite's training
+algorithm.
+
+crfsuite offers several training algorithms (L-BFGS, SGD with L2 regularization, averaged
+perceptron, passive aggressive and AROW), which differ a lot in their time per iteration and in
+how fast the F1 score increases. The BudgetedTrainer spends a share of the budget (probe phase)
+on training every algorithm for the same amount of time and evaluates each resulting model on
+the holdout windows. Then it trains the algorithm with the best holdout F1 again, with as many
+iterations as fit into the remaining budget (final phase).
+
+Every algorithm is first trained for two iterations to measure the time per iteration (including
+the evaluation of the holdout windows) and crfsuite's overhead (setup and storing of the model),
+from which the max_iterations (and for lbfgs/l2sgd the period of the convergence test) of the
+following runs are derived. The model of every completed run is
+compared to the best one so far by its holdout F1 and copied to the model filepath if it is
+better, i.e. the model filepath always contains the best model found so far (checkpoint). Runs
+that would exceed the budget are aborted as soon as that is foreseeable (crfsuite can't save the
+model of an aborted run). If the final run is aborted, it is started again with fewer
+iterations, estimated from the time per iteration of the aborted run, as long as that still
+improves on the probe.
+
+Example usage:
+    trainer = BudgetedTrainer(45 * 60, log_filepath="my_experiment.training.json")
+    trainer.append(feature_values_lists, labels, 0) # training window
+    trainer.append(feature_values_lists, labels, 1) # holdout window
+    trainer.train_budgeted("my_experiment", holdout=1)
+    print(trainer.report())
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import time
+
+from model.monitoring import MonitoredTrainer
+
+# crfsuite's training algorithms
+ALGORITHMS = ["lbfgs", "l2sgd", "ap", "pa", "arow"]
+
+# algorithms that support crfsuite's "period" parameter (convergence test over the last period
+# iterations)
+ALGORITHMS_WITH_PERIOD = ["lbfgs", "l2sgd"]
+
+# share of the available time that is not planned for iterations
+TIME_RESERVE = 0.2
+
+# number of iterations after which a run is aborted if it is projected to exceed its deadline
+MIN_ITERATIONS_FOR_PROJECTION = 5
+
+class TimeLimitReached(Exception):
+    """Raised in on_iteration() to abort a training run that would exceed the budget."""
+    pass
+
+class BudgetedTrainer(MonitoredTrainer):
+    """MonitoredTrainer that chooses the training algorithm and the number of iterations to
+    get the best model (by holdout F1) within a time budget."""
+    def __init__(self, budget_seconds, algorithms=None, probe_share=0.3, log_filepath=None,
+                 **kwargs):
+        """Initialize the trainer.
+        Args:
+            budget_seconds: The time budget of train_budgeted() in seconds.
+            algorithms: List of crfsuite training algorithms to choose from.
+                (Default is None, all of ALGORITHMS.)
+            probe_share: Share of the budget that is spent on the probe phase, i.e. on training
+                every algorithm for a short time. (Default is 0.3.)
+            log_filepath: Optional filepath of the JSON log (see MonitoredTrainer).
+            **kwargs: Arguments for pycrfsuite.Trainer or MonitoredTrainer.
+        """
+        super(BudgetedTrainer, self).__init__(log_filepath=log_filepath, **kwargs)
+        self.budget_seconds = budget_seconds
+        self.algorithms = algorithms if algorithms is not None else list(ALGORITHMS)
+        for algorithm in self.algorithms:
+            assert algorithm in ALGORITHMS, "Unknown algorithm '%s'" % (algorithm)
+        self.probe_share = probe_share
+        # end of the whole budget and of the current run (points in time, see time.time())
+        self.deadline = None
+        self.deadline_of_run = None
+        # index of the first entry of the current run in self.iterations
+        self.first_iteration_of_run = 0
+        # one summary per training run (see train_run())
+        self.runs = []
+        # summary of the run whose model is currently saved at the model filepath
+        self.best_run = None
+
+    def train_budgeted(self, model_filepath, holdout=1, params=None):
+        """Trains the best model that can be found within the budget and saves it.
+        Args:
+            model_filepath: Filepath under which to save the best model.
+            holdout: The group of the holdout windows, which are used to compare the models.
+                (Default is 1.)
+            params: Optional dictionary of further crfsuite parameters, e.g. {"c2": 0.5}.
+                Parameters that an algorithm does not support are ignored for that algorithm.
+        Returns:
+            The summary of the run of the saved model (see train_run()) or None if no run could
+            be completed within the budget.
+        """
+        assert holdout >= 0, "Holdout windows are required to compare the models."
+        self.deadline = time.time() + self.budget_seconds
+        probe_seconds = self.budget_seconds * self.probe_share / len(self.algorithms)
+
+        # probe phase: train each algorithm for probe_seconds
+        probes = dict()
+        for algorithm in self.algorithms:
+            probe_deadline = min(self.deadline, time.time() + probe_seconds)
+            calibration = self.train_run(model_filepath, algorithm, 2, params, holdout,
+                                         probe_deadline)
+            if not calibration["completed"]:
+                continue
+            probes[algorithm] = calibration
+            max_iterations = self.estimate_iterations(calibration, probe_deadline - time.time())
+            if max_iterations > calibration["max_iterations"]:
+                probe = self.train_run(model_filepath, algorithm, max_iterations, params,
+                                       holdout, probe_deadline)
+                if probe["completed"]:
+                    probes[algorithm] = probe
+
+        if len(probes) == 0:
+            print("[Warning] Not a single training run could be completed within the budget.")
+            return self.best_run
+
+        # final phase: train the best algorithm with the remaining budget
+        algorithm = max(probes.keys(), key=lambda alg: probes[alg]["holdout_f1"])
+        print("Best algorithm after the probe phase: %s (holdout F1 %.4f)." \
+              % (algorithm, probes[algorithm]["holdout_f1"]))
+        estimate = probes[algorithm]
+        while True:
+            max_iterations = self.estimate_iterations(estimate, self.deadline - time.time())
+            print("Remaining budget: %.0f seconds, i.e. up to %d iterations." \
+                  % (self.deadline - time.time(), max_iterations))
+            if max_iterations <= probes[algorithm]["max_iterations"]:
+                break
+            final = self.train_run(model_filepath, algorithm, max_iterations, params, holdout,
+                                   self.deadline)
+            if final["completed"] or final["seconds_per_iteration"] is None:
+                break
+            # the iterations were slower than estimated, retry with the measured time per
+            # iteration (the aborted run did not store a model, hence the probe's overhead)
+            print("Final run was aborted after %d iterations, retrying with fewer iterations." \
+                  % (final["iterations"]))
+            estimate = {"seconds_per_iteration": max(final["seconds_per_iteration"],
+                                                     estimate["seconds_per_iteration"]),
+                        "overhead_seconds": max(final["overhead_seconds"],
+                                                estimate["overhead_seconds"])}
+
+        return self.best_run
+
+    def train_run(self, model_filepath, algorithm, max_iterations, params, holdout, deadline):
+        """Trains one model and keeps it if it is better than the best model so far.
+        Args:
+            model_filepath: Filepath of the best model so far.
+            algorithm: The crfsuite training algorithm.
+            max_iterations: Maximum number of iterations.
+            params: Optional dictionary of further crfsuite parameters.
+            holdout: The group of the holdout windows.
+            deadline: Point in time (time.time()) at which to abort the run.
+        Returns:
+            Summary of the run as dictionary with the keys algorithm, max_iterations,
+            iterations, completed, seconds, overhead_seconds, seconds_per_iteration,
+            holdout_f1 and curve (list of pairs (elapsed seconds, holdout F1)).
+        """
+        candidate_filepath = "%s.%s.candidate" % (model_filepath, algorithm)
+        self.select(algorithm)
+        supported = self.params()
+        run_params = dict([(key, value) for key, value in (params or dict()).items() \
+                           if key in supported])
+        run_params["max_iterations"] = max_iterations
+        if algorithm in ALGORITHMS_WITH_PERIOD:
+            run_params["period"] = max(10, max_iterations // 10)
+        self.set_params(run_params)
+
+        print("Training %s with up to %d iterations..." % (algorithm, max_iterations))
+        first = len(self.iterations)
+        start = time.time()
+        self.start_run()
+        self.deadline_of_run = deadline
+        self.first_iteration_of_run = first
+        completed = True
+        try:
+            self.train(candidate_filepath, holdout=holdout)
+        except TimeLimitReached:
+            completed = False
+        self.deadline_of_run = None
+        iterations = self.iterations[first:]
+
+        summary = {"algorithm": algorithm, "max_iterations": max_iterations,
+                   "iterations": len(iterations), "completed": completed,
+                   "seconds": time.time() - start, "overhead_seconds": 0.0,
+                   "seconds_per_iteration": None, "holdout_f1": None,
+                   "curve": [(entry["elapsed_seconds"], entry.get("holdout_f1")) \
+                             for entry in iterations]}
+        if len(iterations) > 0:
+            # crfsuite's time per iteration does not include the evaluation of the holdout
+            # windows, hence the elapsed time (minus crfsuite's setup) is used
+            elapsed = iterations[-1]["elapsed_seconds"]
+            setup = max(iterations[0]["elapsed_seconds"] - (iterations[0]["seconds"] or 0.0), 0.0)
+            summary["seconds_per_iteration"] = max((elapsed - setup) / len(iterations), 1e-6)
+            # setup and storing of the model
+            summary["overhead_seconds"] = max(summary["seconds"] - elapsed, 0.0) + setup
+            summary["holdout_f1"] = iterations[-1].get("holdout_f1")
+
+        if completed and summary["holdout_f1"] is not None \
+                and (self.best_run is None or summary["holdout_f1"] > self.best_run["holdout_f1"]):
+            shutil.copyfile(candidate_filepath, model_filepath)
+            self.best_run = summary
+            print("Saved %s model after %d iterations as new best model (holdout F1 %.4f)." \
+                  % (algorithm, summary["iterations"], summary["holdout_f1"]))
+        if os.path.isfile(candidate_filepath):
+            os.remove(candidate_filepath)
+
+        self.runs.append(summary)
+        self.write_log()
+        return summary
+
+    def estimate_iterations(self, run, seconds):
+        """Estimates how many iterations of an algorithm fit into some time.
+        Args:
+            run: Summary of a previous run of the algorithm (see train_run()).
+            seconds: The available time.
+        Returns:
+            Number of iterations (integer, may be 0).
+        """
+        if run["seconds_per_iteration"] is None:
+            return 0
+        # an aborted run can't be saved, hence keep a reserve for variations of the time per
+        # iteration
+        available = (1 - TIME_RESERVE) * seconds - run["overhead_seconds"]
+        return max(int(available / run["seconds_per_iteration"]), 0)
+
+    def on_iteration(self, log, info):
+        """Records the metrics of the iteration (see MonitoredTrainer) and aborts the run if its
+        deadline was reached or if it will be reached before the last iteration (projected from
+        the time per iteration of the run so far).
+        Args:
+            log: The log messages of the iteration.
+            info: Dictionary of metrics, as parsed by pycrfsuite's log parser.
+        """
+        super(BudgetedTrainer, self).on_iteration(log, info)
+        if self.deadline_of_run is None:
+            return
+        max_iterations = self.get_params()["max_iterations"]
+        # after the last iteration only the model has to be stored
+        if info["num"] >= max_iterations:
+            return
+        now = time.time()
+        if now > self.deadline_of_run:
+            raise TimeLimitReached()
+        # abort early, so that the remaining time can still be used for a shorter run
+        # (the time per iteration is measured from the end of the first iteration, i.e. without
+        # crfsuite's setup)
+        if info["num"] >= MIN_ITERATIONS_FOR_PROJECTION:
+            first = self.iterations[self.first_iteration_of_run]
+            seconds_per_iteration = (self.iterations[-1]["elapsed_seconds"]
+                                     - first["elapsed_seconds"]) \
+                                    / max(len(self.iterations) - self.first_iteration_of_run - 1, 1)
+            if now + seconds_per_iteration * (max_iterations - info["num"]) \
+                    > self.deadline_of_run:
+                raise TimeLimitReached()
+
+    def get_log_content(self):
+        """Returns the content of the JSON log, including the summaries of all runs.
+        Returns:
+            Dictionary.
+        """
+        content = super(BudgetedTrainer, self).get_log_content()
+        content["budget_seconds"] = self.budget_seconds
+        content["runs"] = self.runs
+        content["best_run"] = self.best_run
+        return content
+
+    def report(self):
+        """Returns a table with one row per training run.
+        Returns:
+            The table as (tab-separated) string.
+        """
+        lines = ["\t".join(["algorithm", "max_iterations", "iterations", "completed", "seconds",
+                            "seconds_per_iteration", "holdout_f1", "saved"])]
+        for run in self.runs:
+            lines.append("\t".join([run["algorithm"], str(run["max_iterations"]),
+                                    str(run["iterations"]), str(run["completed"]),
+                                    "%.1f" % (run["seconds"]),
+                                    "%.3f" % (run["seconds_per_iteration"] or 0.0),
+                                    "%.4f" % (run["holdout_f1"] or 0.0),
+                                    "*" if run is self.best_run else ""]))
+        return "\n".join(lines)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Shelve cache of the results of slow feature generators (POS tagger, LDA), which can be
+shared between threads."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import glob
+import os
+import shelve
+import threading
+
+# key under which the fingerprint is stored in the shelve (the other keys are hashes of texts)
+FINGERPRINT_KEY = "__fingerprint__"
+
+class ShelveCache(object):
+    """Shelve cache that can be used by several threads at the same time.
+
+    All accesses to the shelve are synchronized. New entries are written to the disk every
+    synch_every entries (and by synchronize()).
+
+    The cache can be bound to a fingerprint of whatever produced its results, e.g. of the files of
+    the LDA model (see get_files_fingerprint()). If the fingerprint changed since the cache was
+    filled (e.g. because the LDA was trained again), the cache is emptied. Caches without a
+    fingerprint (created before fingerprints existed) are kept and get the current one.
+
+    Example usage:
+        cache = ShelveCache("pos.cache", fingerprint=get_files_fingerprint([model_filepath]))
+        results = cache.get_many(keys) # dictionary of the keys that are in the cache
+        cache.add([(key, result) for key, result in new_results])
+    """
+    def __init__(self, filepath, synch_every=50, fingerprint=None):
+        """Opens (or creates) the cache.
+        Args:
+            filepath: Filepath of the shelve.
+            synch_every: Number of new entries after which the shelve is synchronized.
+                (Default is 50.)
+            fingerprint: Optional fingerprint (any picklable value) of what produced the
+                results. (Default is None, never empty the cache.)
+        """
+        self.filepath = filepath
+        self.synch_every = synch_every
+        self.shelf = shelve.open(filepath)
+        self.count_writes = 0
+        self.lock = threading.Lock()
+
+        if fingerprint is not None and self.shelf.get(FINGERPRINT_KEY) != fingerprint:
+            if FINGERPRINT_KEY in self.shelf:
+                print("[Info] Emptying the cache '%s', its results were produced by other " \
+                      "files." % (filepath))
+                self.shelf.close()
+                self.shelf = shelve.open(filepath, flag="n")
+            self.shelf[FINGERPRINT_KEY] = fingerprint
+            self.shelf.sync()
+
+    def get(self, key):
+        """Returns a cached result.
+        Args:
+            key: The key (string), e.g. the hash of a text.
+        Returns:
+            The result or None if the key is not in the cache.
+        """
+        with self.lock:
+            if key in self.shelf:
+                return self.shelf[key]
+        return None
+
+    def get_many(self, keys):
+        """Returns several cached results.
+        Args:
+            keys: List of keys (strings).
+        Returns:
+            Dictionary of key to result, only containing the keys that are in the cache.
+        """
+        with self.lock:
+            return dict([(key, self.shelf[key]) for key in set(keys) if key in self.shelf])
+
+    def add(self, entries):
+        """Adds results to the cache and synchronizes it every synch_every new entries.
+        Args:
+            entries: List of pairs (key, result).
+        """
+        with self.lock:
+            for key, result in entries:
+                self.shelf[key] = result
+            count_syncs_before = self.count_writes // self.synch_every
+            self.count_writes += len(entries)
+            if self.count_writes // self.synch_every > count_syncs_before:
+                self.shelf.sync()
+
+    def synchronize(self):
+        """Synchronizes the shelve on the HDD with the version in the RAM."""
+        with self.lock:
+            self.shelf.sync()
+
+    def close(self):
+        """Synchronizes and closes the shelve."""
+        with self.lock:
+            self.shelf.close()
+
+def get_files_fingerprint(patterns):
+    """Returns a fingerprint of files, which changes whenever one of them is written again.
+    Args:
+        patterns: List of filepaths or glob patterns, e.g. [LDA_MODEL_FILEPATH + "*"].
+    Returns:
+        List of [filepath, size, modification time], one per existing file.
+    """
+    filepaths = sorted(set([filepath for pattern in patterns for filepath in glob.glob(pattern)]))
+    return [[filepath, os.path.getsize(filepath), os.path.getmtime(filepath)] \
+            for filepath in filepaths]
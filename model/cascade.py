@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Confidence-gated cascade of two CRF models.
+
+Most windows can be tagged confidently without the expensive feature generators (POS tagger and
+LDA). The cascade therefore tags every window first with a cheap model, which was trained only on
+the cheap feature generators (CASCADE_CHEAP_FEATURES, train it via "train.py --cheap"). If the
+cheap model is not confident enough in its labels, the remaining feature generators are applied
+to the window and the full model tags it again. The feature values of the cheap feature
+generators are reused for the full model.
+
+The confidence of a window is measured with pycrfsuite's Tagger.marginal() (lowest marginal
+probability of any predicted label) or Tagger.probability() (probability of the whole predicted
+label sequence), see CASCADE_CONFIDENCE. Use cascade.py to choose the threshold.
+
+Example usage:
+    feature_generators = create_features()
+    cascade = CascadeTagger("my_experiment_cheap", "my_experiment", feature_generators)
+    labels, escalated = cascade.tag(window)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+from collections import Counter
+import pycrfsuite
+
+from model.crf import open_tagger
+from model.hashing import AttributeHasher, get_hashing_filepath
+from model.pruning import AttributePruner, get_attributes_filepath
+
+# All capitalized constants come from this file
+import config as cfg
+
+class ModelTier(object):
+    """One model of the cascade, together with its feature generators and the pruning/hashing
+    of attributes that was used during its training."""
+    def __init__(self, identifier, feature_generators, tagger=None):
+        """Loads a trained model.
+        Args:
+            identifier: Identifier of the model, as used in train.py.
+            feature_generators: The feature generators that were used to train the model
+                (in the same order).
+            tagger: Optional already opened tagger of the model. (Default is None, open it.)
+        """
+        self.identifier = identifier
+        self.feature_generators = feature_generators
+        self.tagger = tagger if tagger is not None else open_tagger(identifier)
+
+        self.pruner = None
+        if os.path.isfile(get_attributes_filepath(identifier)):
+            self.pruner = AttributePruner()
+            self.pruner.load(get_attributes_filepath(identifier))
+
+        self.hasher = None
+        if os.path.isfile(get_hashing_filepath(identifier)):
+            self.hasher = AttributeHasher()
+            self.hasher.load(get_hashing_filepath(identifier))
+
+    def to_example(self, window, features_values):
+        """Converts the feature values of a window to the input of the tagger.
+        Args:
+            window: The Window object.
+            features_values: The results of the convert_window() of each of the model's
+                feature generators.
+        Returns:
+            List of feature values (or dictionaries of hashed attributes) per token.
+        """
+        window.set_feature_values(features_values)
+        feature_values_lists = [window.get_feature_values_list(word_idx, cfg.SKIPCHAIN_LEFT,
+                                                               cfg.SKIPCHAIN_RIGHT) \
+                                for word_idx in range(len(window.tokens))]
+        if self.pruner is not None:
+            feature_values_lists = self.pruner.prune(feature_values_lists)
+        if self.hasher is not None:
+            feature_values_lists = self.hasher.hash_example(feature_values_lists)
+        return feature_values_lists
+
+class CascadeTagger(object):
+    """Tags windows with a cheap model and only the uncertain ones with the full model.
+
+    The cascade keeps statistics about how many windows were tagged by which model and how much
+    time was spent in each tier (see stats and report())."""
+    def __init__(self, cheap_identifier, full_identifier, feature_generators,
+                 cheap_feature_names=None, threshold=None, confidence=None):
+        """Loads both models.
+        Args:
+            cheap_identifier: Identifier of the cheap model (trained with "train.py --cheap").
+            full_identifier: Identifier of the full model (trained with all feature generators).
+            feature_generators: All feature generators, as returned by create_features().
+            cheap_feature_names: Class names of the feature generators of the cheap model.
+                (Default is None, which means CASCADE_CHEAP_FEATURES.)
+            threshold: Windows with a lower confidence are tagged by the full model.
+                (Default is None, which means CASCADE_THRESHOLD.)
+            confidence: How to measure the confidence, "marginal" or "probability".
+                (Default is None, which means CASCADE_CONFIDENCE.)
+        """
+        cheap_feature_names = cheap_feature_names if cheap_feature_names is not None \
+                              else cfg.CASCADE_CHEAP_FEATURES
+        self.threshold = threshold if threshold is not None else cfg.CASCADE_THRESHOLD
+        self.confidence = confidence if confidence is not None else cfg.CASCADE_CONFIDENCE
+        assert self.confidence in ["marginal", "probability"]
+
+        # only pycrfsuite can compute marginals and sequence probabilities
+        cheap_tagger = pycrfsuite.Tagger()
+        cheap_tagger.open(cheap_identifier)
+        self.cheap = ModelTier(cheap_identifier,
+                               [feature for feature in feature_generators \
+                                if feature.__class__.__name__ in cheap_feature_names],
+                               tagger=cheap_tagger)
+        self.full = ModelTier(full_identifier, feature_generators)
+        self.stats = Counter()
+
+    def tag(self, window):
+        """Tags a window (without features) with the cascade.
+        Args:
+            window: The Window object.
+        Returns:
+            Tuple (labels, escalated), where escalated is True if the labels came from the full
+            model.
+        """
+        start = time.time()
+        computed = dict()
+        for feature in self.cheap.feature_generators:
+            computed[id(feature)] = feature.convert_window(window)
+        labels, confidence = self.tag_cheap(window, computed)
+        self.stats["windows"] += 1
+        self.stats["seconds_cheap"] += time.time() - start
+
+        if confidence >= self.threshold:
+            return (labels, False)
+
+        start = time.time()
+        labels = self.tag_full(window, computed)
+        self.stats["escalated"] += 1
+        self.stats["seconds_full"] += time.time() - start
+        return (labels, True)
+
+    def tag_cheap(self, window, computed):
+        """Tags a window with the cheap model.
+        Args:
+            window: The Window object.
+            computed: Dictionary of id(feature generator) to the result of its convert_window()
+                for this window, must contain the results of all cheap feature generators.
+        Returns:
+            Tuple (labels, confidence).
+        """
+        features_values = [computed[id(feature)] for feature in self.cheap.feature_generators]
+        tagger = self.cheap.tagger
+        labels = tagger.tag(self.cheap.to_example(window, features_values))
+        return (labels, get_confidence(tagger, labels, self.confidence))
+
+    def tag_full(self, window, computed):
+        """Tags a window with the full model. Feature values that are not yet in computed are
+        generated (and added to computed).
+        Args:
+            window: The Window object.
+            computed: Dictionary of id(feature generator) to the result of its convert_window()
+                for this window.
+        Returns:
+            The labels (list of strings).
+        """
+        features_values = []
+        for feature in self.full.feature_generators:
+            if id(feature) not in computed:
+                computed[id(feature)] = feature.convert_window(window)
+            features_values.append(computed[id(feature)])
+        return self.full.tagger.tag(self.full.to_example(window, features_values))
+
+    def report(self):
+        """Returns how many windows were tagged by the full model and the time spent per tier.
+        Returns:
+            The report as string.
+        """
+        count = max(self.stats["windows"], 1)
+        return "Tagged %d windows, %d (%.1f%%) of them with the full model. " \
+               "Time per window: %.2fms cheap tier, %.2fms full tier, %.2fms total." \
+               % (self.stats["windows"], self.stats["escalated"],
+                  100 * self.stats["escalated"] / count,
+                  1000 * self.stats["seconds_cheap"] / count,
+                  1000 * self.stats["seconds_full"] / count,
+                  1000 * (self.stats["seconds_cheap"] + self.stats["seconds_full"]) / count)
+
+def get_confidence(tagger, labels, measure="marginal"):
+    """Returns the confidence of a pycrfsuite tagger in the labels it just predicted.
+    Must be called directly after tagger.tag().
+
+    Args:
+        tagger: The pycrfsuite.Tagger.
+        labels: The predicted labels.
+        measure: "marginal" (lowest marginal probability of any predicted label) or
+            "probability" (probability of the whole label sequence). (Default is "marginal".)
+    Returns:
+        The confidence (float between 0 and 1).
+    """
+    if len(labels) == 0:
+        return 1.0
+    if measure == "probability":
+        return tagger.probability(labels)
+    return min([tagger.marginal(label, position) for position, label in enumerate(labels)])
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Featurization and tagging of windows in a pool of threads, which share all loaded resources.
+
+Thread safety of the pipeline:
+    - The lexicon-backed feature generators (w2v and brown clusters, gazetteers, unigram ranks)
+      and the averaged perceptron POS tagger only read their data after loading it, so they are
+      shared without any locks.
+    - PosTagger and LdaWrapper synchronize the accesses to their shelve caches. The LDA
+      inference runs outside of the lock. The Stanford tagger (nltk's StanfordPOSTagger, which
+      starts a JVM process) is not thread-safe, so PosTagger lets only one thread call it at a
+      time, while other threads run the LDA or the CRF.
+    - pycrfsuite Taggers must not be shared between threads, hence TaggerPool opens one per
+      thread. The numpy CrfTagger (see crf.py) only reads its weights and is shared.
+    - The feature values are stored in the Window objects (see Window.set_feature_values()), so
+      each window must only be processed by one thread at a time.
+
+As python code runs in only one thread at a time, threads mostly overlap the waits for the
+Stanford tagger with other work and speed up the parts of the LDA that run in numpy. Compared to
+worker processes they don't duplicate the loaded resources.
+
+Example usage:
+    tagger = ThreadedTagger("my_experiment", create_features(), threads=4)
+    labels = tagger.tag_windows(windows) # one list of labels per window
+    tagger.close()
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+from multiprocessing.pool import ThreadPool
+import pycrfsuite
+
+from model.cascade import ModelTier
+from model.crf import is_numpy_model, open_tagger
+from model.datasets import convert_windows, split_to_chunks
+from model.profiling import stage
+
+# All capitalized constants come from this file
+import config as cfg
+
+class TaggerPool(object):
+    """Tagger that can be used by several threads at the same time.
+    Has the same tagging interface as pycrfsuite.Tagger (tag(), marginal(), probability(),
+    labels(), close()), but forwards every call to the tagger of the calling thread."""
+    def __init__(self, model_filepath):
+        """Initialize the pool. The pycrfsuite taggers are opened when they are first needed.
+        Args:
+            model_filepath: Filepath of the model file (of pycrfsuite or of CrfTrainer).
+        """
+        self.model_filepath = model_filepath
+        # models of CrfTrainer are only read while tagging, one tagger is enough
+        self.shared_tagger = open_tagger(model_filepath) if is_numpy_model(model_filepath) \
+                             else None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.taggers = []
+
+    def get_tagger(self):
+        """Returns the tagger of the calling thread and opens it if necessary.
+        Returns:
+            pycrfsuite.Tagger (or the shared CrfTagger).
+        """
+        if self.shared_tagger is not None:
+            return self.shared_tagger
+        tagger = getattr(self.local, "tagger", None)
+        if tagger is None:
+            tagger = pycrfsuite.Tagger()
+            tagger.open(self.model_filepath)
+            self.local.tagger = tagger
+            with self.lock:
+                self.taggers.append(tagger)
+        return tagger
+
+    def count_taggers(self):
+        """Returns the number of opened taggers.
+        Returns:
+            Integer.
+        """
+        return 1 if self.shared_tagger is not None else len(self.taggers)
+
+    def tag(self, xseq):
+        """Tags a sequence with the tagger of the calling thread.
+        Args:
+            xseq: List of feature values (or dictionaries of weighted attributes) per token.
+        Returns:
+            List of labels (strings), one per token.
+        """
+        return self.get_tagger().tag(xseq)
+
+    def marginal(self, label, position):
+        """Returns the marginal probability of a label at a position of the sequence that was
+        last tagged by the calling thread (only pycrfsuite)."""
+        return self.get_tagger().marginal(label, position)
+
+    def probability(self, labels):
+        """Returns the probability of a label sequence for the sequence that was last tagged by
+        the calling thread (only pycrfsuite)."""
+        return self.get_tagger().probability(labels)
+
+    def labels(self):
+        """Returns the labels of the model."""
+        return self.get_tagger().labels()
+
+    def close(self):
+        """Closes all opened taggers."""
+        with self.lock:
+            for tagger in self.taggers:
+                tagger.close()
+            self.taggers = []
+        if self.shared_tagger is not None:
+            self.shared_tagger.close()
+        self.local = threading.local()
+
+class ThreadedTagger(object):
+    """Featurizes and tags blocks of windows in a pool of threads."""
+    def __init__(self, identifier, feature_generators, threads=None, block_size=None):
+        """Loads the model and starts the threads.
+        Args:
+            identifier: Identifier of the model, as used in train.py.
+            feature_generators: The feature generators that were used to train the model
+                (in the same order), as returned by create_features().
+            threads: Number of threads. (Default is None, which means FEATURE_THREADS.)
+            block_size: Number of windows that one thread featurizes and tags at once.
+                (Default is None, which means FEATURE_BLOCK_SIZE.)
+        """
+        self.model = ModelTier(identifier, feature_generators, tagger=TaggerPool(identifier))
+        self.threads = threads if threads is not None else cfg.FEATURE_THREADS
+        self.block_size = block_size if block_size is not None else cfg.FEATURE_BLOCK_SIZE
+        self.pool = ThreadPool(processes=max(self.threads, 1))
+
+    def tag_windows(self, windows):
+        """Featurizes and tags windows.
+        Args:
+            windows: List of Window objects (without features).
+        Returns:
+            List of lists of labels (strings), one list per window, in the same order.
+        """
+        blocks = list(split_to_chunks(list(windows), self.block_size))
+        labels = []
+        for block_labels in self.pool.imap(self.tag_block, blocks):
+            labels.extend(block_labels)
+        return labels
+
+    def tag_block(self, block):
+        """Featurizes and tags one block of windows (called by the threads).
+        Args:
+            block: List of Window objects (without features).
+        Returns:
+            List of lists of labels, one list per window.
+        """
+        features_values = [convert_windows(feature, block) \
+                           for feature in self.model.feature_generators]
+        labels = []
+        with stage("tag"):
+            for window_idx, window in enumerate(block):
+                window_features = [feature_values[window_idx] \
+                                   for feature_values in features_values]
+                labels.append(self.model.tagger.tag(self.model.to_example(window,
+                                                                          window_features)))
+        return labels
+
+    def close(self):
+        """Stops the threads and closes the taggers."""
+        self.pool.close()
+        self.pool.join()
+        self.model.tagger.close()
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+Linear-chain CRF implemented with numpy/scipy, as an optional alternative to pycrfsuite.
+Only the training needs scipy. CrfTagger and the helpers that train.py, test.py etc. import
+from this module only need numpy.
+
+The trainer accepts the same examples as pycrfsuite.Trainer (see generate_examples()) and has a
+similar interface (append(), set_params(), train()). Its advantage is that the gradient of the
+log-likelihood is computed in parallel by several worker processes, each one responsible for
+a shard of the training examples. The model has the same structure as crfsuite's 1st-order CRF:
+one weight per (attribute, label) pair and one weight per (label, label) transition.
+
+Example usage:
+    trainer = CrfTrainer(algorithm="lbfgs", workers=8)
+    trainer.set_params({"c2": 1.0, "max_iterations": 100})
+    for feature_values_lists, labels in examples:
+        trainer.append(feature_values_lists, labels)
+    trainer.train("my_experiment")
+
+    tagger = CrfTagger()
+    tagger.open("my_experiment")
+    labels = tagger.tag(feature_values_lists)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import ctypes
+import multiprocessing
+import time
+import numpy as np
+import pycrfsuite
+
+try:
+    import scipy.sparse
+    from scipy.optimize import minimize
+except ImportError:
+    # scipy is optional, it is only needed by CrfTrainer
+    scipy = None
+    minimize = None
+
+# The training data and the shared parameter/gradient arrays of the current training run.
+# These are set by the parent process before the worker processes are started, so that the
+# workers can access them without copying.
+_SHARDS = None
+_SHARED_THETA = None
+_SHARED_GRADIENTS = None
+
+def iterate_item(item):
+    """Iterates over the attributes of one item (token) of a sequence.
+    Args:
+        item: Either a list of attribute names (each with value 1.0) or a dictionary of
+            attribute name to value, like in pycrfsuite.
+    Returns:
+        Generator of tuples (attribute name, value).
+    """
+    if isinstance(item, dict):
+        for name, value in item.items():
+            yield (name, value)
+    else:
+        for name in item:
+            yield (name, 1.0)
+
+def logsumexp(values, axis):
+    """Computes log(sum(exp(values))) along an axis in a numerically stable way.
+    Args:
+        values: numpy array.
+        axis: The axis along which to sum.
+    Returns:
+        numpy array with the axis removed.
+    """
+    maximum = np.max(values, axis=axis, keepdims=True)
+    return np.squeeze(maximum, axis=axis) \
+           + np.log(np.sum(np.exp(values - maximum), axis=axis))
+
+class SequenceGroup(object):
+    """Several sequences of the same length, stored as one sparse matrix, so that the
+    forward-backward algorithm can process them together."""
+    def __init__(self, matrix, labels):
+        """Initialize the group.
+        Args:
+            matrix: Sparse CSR matrix of shape (count sequences * length, count attributes),
+                containing the attribute values of each token.
+            labels: Label id of each token, numpy array of shape (count sequences, length).
+        """
+        self.matrix = matrix
+        self.labels = labels
+
+def compute_loss_and_gradient(groups, weights, transitions):
+    """Computes the negative log-likelihood of groups of sequences and its gradient
+    (without regularization).
+
+    Args:
+        groups: List of SequenceGroup objects.
+        weights: Attribute weights, numpy array of shape (count attributes, count labels).
+        transitions: Transition weights, numpy array of shape (count labels, count labels).
+    Returns:
+        Tuple (loss, gradient of the weights, gradient of the transitions).
+    """
+    count_labels = transitions.shape[0]
+    loss = 0.0
+    grad_weights = np.zeros_like(weights)
+    grad_transitions = np.zeros_like(transitions)
+
+    for group in groups:
+        count_sequences, length = group.labels.shape
+        emissions = np.asarray(group.matrix.dot(weights)).reshape(count_sequences, length,
+                                                                  count_labels)
+
+        # forward-backward (in log space)
+        alpha = np.empty_like(emissions)
+        beta = np.empty_like(emissions)
+        alpha[:, 0] = emissions[:, 0]
+        for t in range(1, length):
+            alpha[:, t] = logsumexp(alpha[:, t-1, :, np.newaxis] + transitions, axis=1) \
+                          + emissions[:, t]
+        beta[:, length-1] = 0
+        for t in range(length - 2, -1, -1):
+            beta[:, t] = logsumexp(transitions + (emissions[:, t+1] + beta[:, t+1])[:, np.newaxis, :],
+                                   axis=2)
+        log_z = logsumexp(alpha[:, length-1], axis=1)
+
+        # score of the correct label chains
+        seq_idx = np.arange(count_sequences)[:, np.newaxis]
+        pos_idx = np.arange(length)[np.newaxis, :]
+        gold = emissions[seq_idx, pos_idx, group.labels].sum() \
+               + transitions[group.labels[:, :-1], group.labels[:, 1:]].sum()
+        loss += log_z.sum() - gold
+
+        # gradient = expected counts - observed counts
+        marginals = np.exp(alpha + beta - log_z[:, np.newaxis, np.newaxis])
+        marginals[seq_idx, pos_idx, group.labels] -= 1
+        grad_weights += group.matrix.T.dot(marginals.reshape(count_sequences * length,
+                                                             count_labels))
+        if length > 1:
+            pairwise = np.exp(alpha[:, :-1, :, np.newaxis] + transitions
+                              + (emissions[:, 1:] + beta[:, 1:])[:, :, np.newaxis, :]
+                              - log_z[:, np.newaxis, np.newaxis, np.newaxis])
+            grad_transitions += pairwise.sum(axis=(0, 1))
+            np.add.at(grad_transitions, (group.labels[:, :-1], group.labels[:, 1:]), -1)
+
+    return loss, grad_weights, grad_transitions
+
+def viterbi(emissions, transitions):
+    """Finds the most probable label chain of one sequence.
+    Args:
+        emissions: Emission scores, numpy array of shape (length, count labels).
+        transitions: Transition weights, numpy array of shape (count labels, count labels).
+    Returns:
+        List of label ids.
+    """
+    length = emissions.shape[0]
+    if length == 0:
+        return []
+    scores = emissions[0]
+    backpointers = np.zeros(emissions.shape, dtype=np.int32)
+    for t in range(1, length):
+        candidates = scores[:, np.newaxis] + transitions
+        backpointers[t] = np.argmax(candidates, axis=0)
+        scores = np.max(candidates, axis=0) + emissions[t]
+    path = [int(np.argmax(scores))]
+    for t in range(length - 1, 0, -1):
+        path.append(int(backpointers[t, path[-1]]))
+    return path[::-1]
+
+def shard_loss_and_gradient(task):
+    """Computes the loss and gradient of one batch of one shard and writes the gradient into
+    the shared gradient array of the shard. This is executed in a worker process.
+
+    Args:
+        task: Tuple (shard index, batch index).
+    Returns:
+        The loss (float).
+    """
+    shard_idx, batch_idx = task
+    count_attributes, count_labels = _SHARDS["shape"]
+    theta = np.frombuffer(_SHARED_THETA, dtype=np.float64)
+    weights = theta[:count_attributes * count_labels].reshape(count_attributes, count_labels)
+    transitions = theta[count_attributes * count_labels:].reshape(count_labels, count_labels)
+
+    loss, grad_weights, grad_transitions = compute_loss_and_gradient(
+        _SHARDS["shards"][shard_idx][batch_idx], weights, transitions)
+
+    gradient = np.frombuffer(_SHARED_GRADIENTS[shard_idx], dtype=np.float64)
+    gradient[:count_attributes * count_labels] = grad_weights.ravel()
+    gradient[count_attributes * count_labels:] = grad_transitions.ravel()
+    return loss
+
+class CrfTrainer(object):
+    """Trains a linear-chain CRF with numpy, computing the gradients in parallel processes.
+
+    Supported algorithms:
+        lbfgs: L-BFGS (via scipy) on the full training set. With c1 > 0 the L1 term is handled
+               by splitting each weight into a positive and a negative part with bounds.
+        adagrad: AdaGrad on mini-batches, with L1 (via proximal updates) and L2 regularization.
+    """
+    def __init__(self, algorithm="lbfgs", workers=1, verbose=True):
+        """Initialize the trainer.
+        Args:
+            algorithm: "lbfgs" or "adagrad". (Default is "lbfgs".)
+            workers: Number of processes that compute the gradient. (Default is 1.)
+            verbose: Whether to print a message after each iteration. (Default is True.)
+        """
+        assert algorithm in ["lbfgs", "adagrad"]
+        self.algorithm = algorithm
+        self.workers = workers
+        self.verbose = verbose
+        # same defaults as crfsuite (except for the adagrad parameters)
+        self.params = {"c1": 0.0, "c2": 1.0, "max_iterations": None, "learning_rate": 0.1,
+                       "batch_size": 100}
+
+        self.attribute_to_id = dict()
+        self.label_to_id = dict()
+        self.labels = []
+        self.sequences = []
+
+    def set_params(self, params):
+        """Sets training parameters.
+        Args:
+            params: Dictionary of parameter name to value. Supported are c1 (L1 regularization),
+                c2 (L2 regularization), max_iterations, learning_rate (adagrad only) and
+                batch_size (adagrad only, number of sequences per batch and shard).
+        """
+        for name, value in params.items():
+            if name not in self.params:
+                raise Exception("Unknown parameter '%s' for CrfTrainer." % (name))
+            self.params[name] = value
+
+    def append(self, xseq, yseq):
+        """Adds a training sequence.
+        Args:
+            xseq: List of items (one per token), each item either a list of attribute names or
+                a dictionary of attribute name to value.
+            yseq: List of labels (one per token).
+        """
+        assert len(xseq) == len(yseq)
+
+        indptr = [0]
+        indices = []
+        values = []
+        for item in xseq:
+            for name, value in iterate_item(item):
+                attribute_id = self.attribute_to_id.get(name)
+                if attribute_id is None:
+                    attribute_id = len(self.attribute_to_id)
+                    self.attribute_to_id[name] = attribute_id
+                indices.append(attribute_id)
+                values.append(value)
+            indptr.append(len(indices))
+
+        label_ids = []
+        for label in yseq:
+            if label not in self.label_to_id:
+                self.label_to_id[label] = len(self.labels)
+                self.labels.append(label)
+            label_ids.append(self.label_to_id[label])
+
+        if len(yseq) > 0:
+            self.sequences.append((np.asarray(indptr, dtype=np.int32),
+                                   np.asarray(indices, dtype=np.int32),
+                                   np.asarray(values, dtype=np.float32),
+                                   np.asarray(label_ids, dtype=np.int32)))
+
+    def train(self, model_filepath):
+        """Trains the CRF on all appended sequences and saves the model.
+        Args:
+            model_filepath: Filepath under which to save the model, see CrfTagger.
+        """
+        global _SHARDS, _SHARED_THETA, _SHARED_GRADIENTS
+
+        if scipy is None:
+            raise Exception("Training with the numpy CRF trainer requires scipy " \
+                            "(pip install scipy).")
+
+        count_attributes = len(self.attribute_to_id)
+        count_labels = len(self.labels)
+        size = count_attributes * count_labels + count_labels * count_labels
+        count_shards = max(1, min(self.workers, len(self.sequences)))
+        if self.algorithm == "adagrad":
+            count_batches = max(1, len(self.sequences) // (count_shards * self.params["batch_size"]))
+        else:
+            count_batches = 1
+
+        # distribute the sequences over the shards and batches (round-robin)
+        self.print_if_verbose("Preparing %d shards with %d batches each (%d attributes, " \
+                              "%d labels)..." % (count_shards, count_batches, count_attributes,
+                                                 count_labels))
+        shards = []
+        for shard_idx in range(count_shards):
+            batches = []
+            for batch_idx in range(count_batches):
+                start = shard_idx + batch_idx * count_shards
+                step = count_shards * count_batches
+                batches.append(self.create_groups(self.sequences[start::step], count_attributes))
+            shards.append(batches)
+        # the sequences are no longer needed, they are now part of the shards
+        self.sequences = []
+
+        _SHARDS = {"shape": (count_attributes, count_labels), "shards": shards}
+        _SHARED_THETA = multiprocessing.RawArray(ctypes.c_double, size)
+        _SHARED_GRADIENTS = [multiprocessing.RawArray(ctypes.c_double, size) \
+                             for _ in range(count_shards)]
+        pool = multiprocessing.Pool(processes=count_shards) if count_shards > 1 else None
+
+        try:
+            if self.algorithm == "lbfgs":
+                theta = self.train_lbfgs(pool, size, count_shards)
+            else:
+                theta = self.train_adagrad(pool, size, count_shards, count_batches)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            _SHARDS = None
+            _SHARED_THETA = None
+            _SHARED_GRADIENTS = None
+
+        weights = theta[:count_attributes * count_labels].reshape(count_attributes, count_labels)
+        transitions = theta[count_attributes * count_labels:].reshape(count_labels, count_labels)
+        attributes = [None] * count_attributes
+        for name, attribute_id in self.attribute_to_id.items():
+            attributes[attribute_id] = name
+        save_model(model_filepath, attributes, self.labels, weights, transitions)
+
+    def create_groups(self, sequences, count_attributes):
+        """Groups sequences by their length and converts each group to a SequenceGroup.
+        Args:
+            sequences: List of sequences as stored by append().
+            count_attributes: Number of attributes (columns of the sparse matrices).
+        Returns:
+            List of SequenceGroup objects.
+        """
+        by_length = dict()
+        for sequence in sequences:
+            by_length.setdefault(len(sequence[3]), []).append(sequence)
+
+        groups = []
+        for length in sorted(by_length.keys()):
+            group = by_length[length]
+            indptrs = []
+            offset = 0
+            for indptr, _, _, _ in group:
+                indptrs.append(indptr[:-1] + offset)
+                offset += indptr[-1]
+            indptrs.append(np.asarray([offset], dtype=np.int32))
+            matrix = scipy.sparse.csr_matrix(
+                (np.concatenate([values for _, _, values, _ in group]).astype(np.float64),
+                 np.concatenate([indices for _, indices, _, _ in group]),
+                 np.concatenate(indptrs)),
+                shape=(len(group) * length, count_attributes))
+            labels = np.vstack([label_ids for _, _, _, label_ids in group])
+            groups.append(SequenceGroup(matrix, labels))
+        return groups
+
+    def compute_objective(self, pool, theta, count_shards, batch_idx):
+        """Computes the (unregularized) loss and gradient over all shards for one batch index.
+        Args:
+            pool: The worker pool or None if only one shard is used.
+            theta: The current parameters, numpy array.
+            count_shards: Number of shards.
+            batch_idx: The index of the batch within each shard.
+        Returns:
+            Tuple (loss, gradient).
+        """
+        np.frombuffer(_SHARED_THETA, dtype=np.float64)[:] = theta
+        tasks = [(shard_idx, batch_idx) for shard_idx in range(count_shards)]
+        if pool is not None:
+            losses = pool.map(shard_loss_and_gradient, tasks)
+        else:
+            losses = [shard_loss_and_gradient(task) for task in tasks]
+
+        gradient = np.zeros_like(theta)
+        for shard_idx in range(count_shards):
+            gradient += np.frombuffer(_SHARED_GRADIENTS[shard_idx], dtype=np.float64)
+        return sum(losses), gradient
+
+    def train_lbfgs(self, pool, size, count_shards):
+        """Optimizes the parameters with L-BFGS.
+        Args:
+            pool: The worker pool or None.
+            size: Number of parameters.
+            count_shards: Number of shards.
+        Returns:
+            The optimized parameters (numpy array).
+        """
+        c1 = self.params["c1"]
+        c2 = self.params["c2"]
+        state = {"iteration": 0, "start": time.time(), "loss": None}
+
+        def objective(variables):
+            """Computes the regularized loss and its gradient."""
+            theta = variables[:size] - variables[size:] if c1 > 0 else variables
+            loss, gradient = self.compute_objective(pool, theta, count_shards, 0)
+            loss += c2 * np.dot(theta, theta)
+            gradient += 2 * c2 * theta
+            if c1 > 0:
+                loss += c1 * np.sum(variables)
+                gradient = np.concatenate([gradient + c1, -gradient + c1])
+            state["loss"] = loss
+            return loss, gradient
+
+        def callback(variables):
+            """Prints the progress after each iteration."""
+            state["iteration"] += 1
+            theta = variables[:size] - variables[size:] if c1 > 0 else variables
+            self.print_if_verbose("Iteration %d: loss %.4f, active features %d, %.1f seconds" \
+                                  % (state["iteration"], state["loss"],
+                                     np.count_nonzero(theta), time.time() - state["start"]))
+
+        options = dict()
+        if self.params["max_iterations"] is not None:
+            options["maxiter"] = self.params["max_iterations"]
+        if c1 > 0:
+            # theta = positive part - negative part, both parts >= 0
+            initial = np.zeros(2 * size)
+            bounds = [(0, None)] * (2 * size)
+        else:
+            initial = np.zeros(size)
+            bounds = None
+        result = minimize(objective, initial, method="L-BFGS-B", jac=True, bounds=bounds,
+                          callback=callback, options=options)
+        self.print_if_verbose("L-BFGS finished: %s" % (result.message,))
+        return result.x[:size] - result.x[size:] if c1 > 0 else result.x
+
+    def train_adagrad(self, pool, size, count_shards, count_batches):
+        """Optimizes the parameters with AdaGrad on mini-batches.
+        Each step uses one batch of every shard (computed in parallel).
+
+        Args:
+            pool: The worker pool or None.
+            size: Number of parameters.
+            count_shards: Number of shards.
+            count_batches: Number of batches per shard.
+        Returns:
+            The optimized parameters (numpy array).
+        """
+        c1 = self.params["c1"] / count_batches
+        c2 = self.params["c2"] / count_batches
+        learning_rate = self.params["learning_rate"]
+        max_iterations = self.params["max_iterations"]
+        max_iterations = max_iterations if max_iterations is not None else 50
+        theta = np.zeros(size)
+        sum_squared_gradients = np.zeros(size)
+        start = time.time()
+
+        for epoch in range(max_iterations):
+            epoch_loss = 0.0
+            for batch_idx in range(count_batches):
+                loss, gradient = self.compute_objective(pool, theta, count_shards, batch_idx)
+                gradient += 2 * c2 * theta
+                epoch_loss += loss + c2 * np.dot(theta, theta)
+
+                sum_squared_gradients += gradient * gradient
+                step_sizes = learning_rate / (np.sqrt(sum_squared_gradients) + 1e-8)
+                theta = theta - step_sizes * gradient
+                if c1 > 0:
+                    # proximal step for the L1 term
+                    theta = np.sign(theta) * np.maximum(np.abs(theta) - step_sizes * c1, 0)
+            epoch_loss += self.params["c1"] * np.sum(np.abs(theta))
+
+            self.print_if_verbose("Epoch %d: loss %.4f, active features %d, %.1f seconds" \
+                                  % (epoch + 1, epoch_loss, np.count_nonzero(theta),
+                                     time.time() - start))
+        return theta
+
+    def print_if_verbose(self, msg):
+        """Prints a message only if verbose was set to True.
+        Args:
+            msg: The message to print.
+        """
+        if self.verbose:
+            print(msg)
+
+def save_model(model_filepath, attributes, labels, weights, transitions):
+    """Saves a trained model as a numpy .npz file.
+    Attributes whose weights are all zero are not saved.
+
+    Args:
+        model_filepath: Filepath of the model file.
+        attributes: List of attribute names (one per row of weights).
+        labels: List of labels (one per column of weights).
+        weights: Attribute weights, numpy array of shape (count attributes, count labels).
+        transitions: Transition weights, numpy array of shape (count labels, count labels).
+    """
+    active = np.flatnonzero(np.any(weights != 0, axis=1))
+    with open(model_filepath, "wb") as handle:
+        np.savez(handle, attributes=np.asarray([attributes[idx] for idx in active]),
+                 labels=np.asarray(labels), weights=weights[active], transitions=transitions)
+
+def is_numpy_model(model_filepath):
+    """Returns whether a model file was saved by CrfTrainer (instead of pycrfsuite).
+    Args:
+        model_filepath: Filepath of the model file.
+    Returns:
+        True for models of CrfTrainer, False otherwise.
+    """
+    with open(model_filepath, "rb") as handle:
+        # .npz files are zip files
+        return handle.read(2) == b"PK"
+
+def open_tagger(model_filepath):
+    """Opens a tagger for a model file of either CrfTrainer or pycrfsuite.
+    Args:
+        model_filepath: Filepath of the model file.
+    Returns:
+        CrfTagger or pycrfsuite.Tagger object.
+    """
+    tagger = CrfTagger() if is_numpy_model(model_filepath) else pycrfsuite.Tagger()
+    tagger.open(model_filepath)
+    return tagger
+
+class CrfTagger(object):
+    """Tags sequences with a model trained by CrfTrainer.
+    Has the same tagging interface as pycrfsuite.Tagger (open(), tag(), labels(), close())."""
+    def __init__(self):
+        """Initialize the tagger, a model must be loaded via open() afterwards."""
+        self.attribute_to_id = None
+        self.label_names = None
+        self.weights = None
+        self.transitions = None
+
+    def open(self, model_filepath):
+        """Loads a model.
+        Args:
+            model_filepath: Filepath of the model file, as saved by CrfTrainer.
+        """
+        with open(model_filepath, "rb") as handle:
+            model = np.load(handle)
+            self.attribute_to_id = dict([(name, idx) for idx, name \
+                                         in enumerate(model["attributes"].tolist())])
+            self.label_names = model["labels"].tolist()
+            self.weights = model["weights"]
+            self.transitions = model["transitions"]
+
+    def close(self):
+        """Unloads the model."""
+        self.__init__()
+
+    def labels(self):
+        """Returns the labels of the model.
+        Returns:
+            List of strings.
+        """
+        return list(self.label_names)
+
+    def tag(self, xseq):
+        """Predicts the most probable label chain of a sequence.
+        Args:
+            xseq: List of items (one per token), each item either a list of attribute names or
+                a dictionary of attribute name to value. Unknown attributes are ignored.
+        Returns:
+            List of labels (strings).
+        """
+        emissions = np.zeros((len(xseq), len(self.label_names)))
+        for t, item in enumerate(xseq):
+            for name, value in iterate_item(item):
+                attribute_id = self.attribute_to_id.get(name)
+                if attribute_id is not None:
+                    emissions[t] += value * self.weights[attribute_id]
+        return [self.label_names[label_id] for label_id in viterbi(emissions, self.transitions)]
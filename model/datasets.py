@@ -2,8 +2,15 @@
 """Functions to load data from the corpus."""
 from __future__ import absolute_import, division, print_function, unicode_literals
 import re
+import os
+import json
 #from unidecode import unidecode
-from collections import Counter
+from collections import Counter, deque
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from model.profiling import iterate_in_stage, stage
+from model.readers import create_reader
 
 # All capitalized constants come from this file
 import config as cfg
@@ -21,32 +28,67 @@ def split_to_chunks(of_list, chunk_size):
     for i in range(0, len(of_list), chunk_size):
         yield of_list[i:i + chunk_size]
 
-def load_articles(filepath, start_at=0):
+def split_iterable_to_chunks(iterable, chunk_size):
+    """Splits an iterable (e.g. a generator) to smaller chunks, without loading it completely.
+    Args:
+        iterable: The iterable to split.
+        chunk_size: The maximum size of each smaller part/chunk.
+    Returns:
+        Generator of lists (i.e. list of lists).
+    """
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+def load_articles(filepath, start_at=0, corpus_format=None):
     """Loads all articles (documents) from a corpus.
 
-    The corpus is expected to be a UTF-8 encoded textfile with one article/document per line.
+    By default the corpus is expected to be a UTF-8 encoded textfile with one article/document
+    per line. The file may be compressed (.gz, .bz2, .xz) and the filepath may be a glob pattern
+    matching several shards. Other formats are supported via corpus_format, see readers.py.
+    The corpus is streamed, i.e. it is never loaded completely into RAM.
+
+    If the filepath points to a binary corpus (see write_binary_corpus()), a BinaryCorpus object
+    is returned, which can be iterated like the generator of the other formats, but does not
+    require any text parsing.
 
     Args:
         filepath: The filepath to the corpus file.
-        start_at: The index of the line to start at. (Default is 0.)
+        start_at: The index of the article to start at. (Default is 0.)
+        corpus_format: The format of the corpus file, see create_reader() in readers.py, or
+            "binary". (Default is None, guess the format from the file extension.)
     Returns:
         Generator of Article objects, i.e. list of Article.
     """
-    skipped = 0
-    with open(filepath, "r") as handle:
-        for article in handle:
-            article = article.decode("utf-8").strip()
+    if corpus_format == "binary" or (corpus_format is None and is_binary_corpus(filepath)):
+        return BinaryCorpus(filepath, start_at=start_at)
 
-            if len(article) > 0:
-                if skipped < start_at:
-                    skipped += 1
-                else:
-                    yield Article(article)
+    articles = create_reader(filepath, corpus_format=corpus_format)
+    return (Article(article) for article in islice(articles, start_at, None))
 
 def load_windows(articles, window_size, features=None, every_nth_window=1,
-                 only_labeled_windows=False):
+                 only_labeled_windows=False, nb_skip=0, nb_append=None, deduplicator=None,
+                 block_size=None, threads=None):
     """Loads smaller windows with a maximum size per window from a generator of articles.
 
+    If articles is a BinaryCorpus, the windows are cut directly out of its arrays,
+    see BinaryCorpus.load_windows().
+
+    Skipping (nb_skip) and limiting (nb_append) happen on the raw windows, i.e. before any
+    features are applied. Skipped windows therefore never go through the (potentially slow)
+    feature generators, e.g. the POS tagger or the LDA.
+
+    The features are applied to blocks of windows (see convert_windows()), so that feature
+    generators with a batch implementation (e.g. one call of the Stanford POS tagger per block)
+    can amortize their per-call costs. With several threads, the blocks are featurized in
+    parallel, e.g. the LDA inference of one block overlaps with the wait for the Stanford POS
+    tagger of another one. (The Stanford tagger itself only tags one block at a time.)
+
     Args:
         articles: Generator of articles, as provided by load_articles().
         window_size: Maximum length of each window (in tokens/words).
@@ -57,10 +99,118 @@ def load_windows(articles, window_size, features=None, every_nth_window=1,
             (different) articles. (Default is 1, return every window.)
         only_labeled_windows: If set to True, the function will only return windows that contain
             at least one labeled token (at leas one named entity). (Default is False.)
+        nb_skip: How many windows to skip at the start, without applying features to them.
+            E.g. the training uses this to skip the windows of the test split. (Default is 0.)
+        nb_append: How many windows to return max or None if unlimited. (Default is None.)
+        deduplicator: Optional Deduplicator (see model/dedup.py). Near-duplicate articles and
+            windows are then dropped before they are counted for every_nth_window, nb_skip and
+            nb_append. Skipped windows are still added to the deduplicator, so that duplicates
+            of them (e.g. of test windows) are dropped later on. (Default is None.)
+        block_size: Number of windows to which the features are applied at once.
+            (Default is None, which means that FEATURE_BLOCK_SIZE will be used.)
+        threads: Number of threads that apply the features to the blocks.
+            (Default is None, which means that FEATURE_THREADS will be used.)
+    Returns:
+        Generator of Window objects, i.e. list of Window objects.
+    """
+    if isinstance(articles, BinaryCorpus):
+        windows = articles.load_windows(window_size, every_nth_window=every_nth_window,
+                                        only_labeled_windows=only_labeled_windows,
+                                        nb_skip=nb_skip, nb_append=nb_append,
+                                        deduplicator=deduplicator)
+    else:
+        windows = load_windows_from_articles(articles, window_size,
+                                             every_nth_window=every_nth_window,
+                                             only_labeled_windows=only_labeled_windows,
+                                             nb_skip=nb_skip, nb_append=nb_append,
+                                             deduplicator=deduplicator)
+
+    if features is None:
+        return windows
+    windows = iterate_in_stage(windows, "parse corpus and cut windows")
+    block_size = block_size if block_size is not None else cfg.FEATURE_BLOCK_SIZE
+    threads = threads if threads is not None else cfg.FEATURE_THREADS
+    return apply_features_in_blocks(windows, features, block_size, threads)
+
+def apply_features_in_blocks(windows, features, block_size, threads=1):
+    """Applies feature generators to blocks of windows.
+
+    With more than one thread, up to two blocks per thread are featurized at the same time
+    (the windows are read ahead accordingly). The feature generators must then be thread-safe,
+    which all generators of create_features() are (see model/concurrency.py). Resources that
+    are not thread-safe, such as the Stanford POS tagger, are locked by their generators, i.e.
+    their calls are not parallelized.
+
+    Args:
+        windows: Generator of Window objects (without features).
+        features: List of feature generators.
+        block_size: Number of windows per block.
+        threads: Number of threads that featurize the blocks. (Default is 1, no threads.)
+    Returns:
+        Generator of Window objects (with features), in the same order.
+    """
+    blocks = split_iterable_to_chunks(windows, block_size)
+    if threads <= 1:
+        for block in blocks:
+            for window in apply_features_to_block(block, features):
+                yield window
+        return
+
+    pool = ThreadPool(processes=threads)
+    pending = deque()
+    try:
+        for block in blocks:
+            pending.append(pool.apply_async(apply_features_to_block, (block, features)))
+            if len(pending) >= 2 * threads:
+                for window in pending.popleft().get():
+                    yield window
+        while len(pending) > 0:
+            for window in pending.popleft().get():
+                yield window
+    finally:
+        pool.terminate()
+
+def apply_features_to_block(block, features):
+    """Applies feature generators to one block of windows.
+    Args:
+        block: List of Window objects (without features).
+        features: List of feature generators.
+    Returns:
+        The same list of Window objects (with features).
+    """
+    features_values = [convert_windows(feature, block) for feature in features]
+    for window_idx, window in enumerate(block):
+        window.set_feature_values([feature_values[window_idx] \
+                                   for feature_values in features_values])
+    return block
+
+def convert_windows(feature, windows):
+    """Converts several windows with one feature generator.
+    Feature generators may implement convert_windows(windows) to process whole blocks of windows
+    at once (e.g. to tag all windows with a single call of the POS tagger). For all other
+    feature generators, convert_window() is called once per window.
+
+    Args:
+        feature: The feature generator.
+        windows: List of Window objects.
+    Returns:
+        List with one entry per window, each one the result of convert_window() for that window.
+    """
+    with stage("featurize %s" % (feature.__class__.__name__)):
+        if hasattr(feature, "convert_windows"):
+            return feature.convert_windows(windows)
+        return [feature.convert_window(window) for window in windows]
+
+def load_windows_from_articles(articles, window_size, features=None, every_nth_window=1,
+                               only_labeled_windows=False, nb_skip=0, nb_append=None,
+                               deduplicator=None):
+    """Loads windows from a generator of Article objects, see load_windows() for the arguments.
     Returns:
         Generator of Window objects, i.e. list of Window objects.
     """
     processed_windows = 0
+    skipped = 0
+    added = 0
     for article in articles:
         # count how many labels there are in the article
         count = article.count_labels()
@@ -73,6 +223,10 @@ def load_windows(articles, window_size, features=None, every_nth_window=1,
             # ignore articles completely that have no labels at all, if that was requested via
             # the parameters
             pass
+        elif deduplicator is not None \
+                and deduplicator.is_duplicate_article([token.word for token in article.tokens]):
+            # ignore near-duplicates of previous articles
+            pass
         else:
             # split the tokens in the article to windows
             token_windows = split_to_chunks(article.tokens, window_size)
@@ -80,21 +234,41 @@ def load_windows(articles, window_size, features=None, every_nth_window=1,
                 window = Window([token for token in token_window])
                 # ignore the window if it contains no labels and that was requested via parameters
                 if not only_labeled_windows or window.count_labels() > 0:
+                    if deduplicator is not None:
+                        words = [token.word for token in window.tokens]
+                        if deduplicator.is_duplicate_window(words, count_stats=skipped >= nb_skip):
+                            # ignore near-duplicates of previous windows
+                            continue
                     if processed_windows % every_nth_window == 0:
-                        # generate features for all tokens in the window
-                        if features is not None:
-                            window.apply_features(features)
-                        yield window
+                        if skipped < nb_skip:
+                            # skip the window before the features are generated for it
+                            skipped += 1
+                        else:
+                            # generate features for all tokens in the window
+                            if features is not None:
+                                window.apply_features(features)
+                            yield window
+                            added += 1
+                            if nb_append is not None and added >= nb_append:
+                                return
                     processed_windows += 1
 
-def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True):
+def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True, skipchain_left=None,
+                      skipchain_right=None):
     """Generates example pairs of feature lists (one per token) and labels.
 
     Args:
         windows: The windows to generate features and labels from, see load_windows().
         nb_append: How many windows to append max or None if unlimited. (Default is None.)
         nb_skip: How many windows to skip at the start. (Default is 0.)
+            Notice that the skipped windows already had their features applied by
+            load_windows(). Use the nb_skip argument of load_windows() to avoid that.
         verbose: Whether to print status messages. (Default is True.)
+        skipchain_left: How many words to the left of each word will be part of the word's
+            features, see Window.get_feature_values_list(). (Default is None, which means that
+            the value of SKIPCHAIN_LEFT will be used.)
+        skipchain_right: See skipchain_left, just to the right. (Default is None, which means
+            that the value of SKIPCHAIN_RIGHT will be used.)
     Returns:
         Pairs of (features, labels),
         where features is a list of lists of strings,
@@ -102,6 +276,9 @@ def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True):
         and labels is a list of strings,
             e.g. ["PER", "O", "O", "LOC", ...].
     """
+    skipchain_left = cfg.SKIPCHAIN_LEFT if skipchain_left is None else skipchain_left
+    skipchain_right = cfg.SKIPCHAIN_RIGHT if skipchain_right is None else skipchain_right
+
     skipped = 0
     added = 0
     for window in windows:
@@ -114,8 +291,7 @@ def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True):
             # chain of features (list of lists of strings)
             feature_values_lists = []
             for word_idx in range(len(window.tokens)):
-                fvl = window.get_feature_values_list(word_idx,
-                                                     cfg.SKIPCHAIN_LEFT, cfg.SKIPCHAIN_RIGHT)
+                fvl = window.get_feature_values_list(word_idx, skipchain_left, skipchain_right)
                 feature_values_lists.append(fvl)
             # yield (features, labels) pair
             yield (feature_values_lists, labels)
@@ -131,6 +307,229 @@ def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True):
             if nb_append is not None and added == nb_append:
                 break
 
+def is_binary_corpus(filepath):
+    """Returns whether a filepath points to a binary corpus, as written by write_binary_corpus().
+    Args:
+        filepath: The filepath to check.
+    Returns:
+        True if the filepath is a binary corpus directory, False otherwise.
+    """
+    return os.path.isfile(os.path.join(filepath, BinaryCorpus.META_FILENAME))
+
+def write_binary_corpus(articles, dirpath, verbose=True):
+    """Converts articles to a binary corpus, which can later be loaded without any text parsing
+    via BinaryCorpus (or load_articles()).
+
+    The binary corpus is a directory containing:
+        vocabulary.bin: All distinct words, UTF-8 encoded, one after the other.
+        vocabulary_offsets.int64: Start of each word in vocabulary.bin (plus the end of the last
+            word), i.e. the word with id i is vocabulary.bin[offsets[i]:offsets[i+1]].
+        tokens.int32: The word id of each token of the corpus.
+        labels.uint8: The label id of each token of the corpus, where 0 is NO_NE_LABEL and
+            i > 0 is the label at index i-1 in LABELS.
+        articles.int64: Start of each article in tokens.int32 (plus the end of the last article).
+        meta.json: Number of articles/tokens and the labels.
+
+    Args:
+        articles: Generator of Article objects, as provided by load_articles().
+        dirpath: Filepath of the directory to create.
+        verbose: Whether to print status messages. (Default is True.)
+    """
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+
+    label_to_id = dict([(label, i + 1) for i, label in enumerate(cfg.LABELS)])
+    label_to_id[cfg.NO_NE_LABEL] = 0
+    word_to_id = dict()
+    vocabulary_end = 0
+    count_tokens = 0
+    count_articles = 0
+
+    def filepath_of(filename):
+        """Returns the filepath of a file in the binary corpus directory."""
+        return os.path.join(dirpath, filename)
+
+    with open(filepath_of("vocabulary.bin"), "wb") as vocabulary_handle, \
+         open(filepath_of("vocabulary_offsets.int64"), "wb") as vocabulary_offsets_handle, \
+         open(filepath_of("tokens.int32"), "wb") as tokens_handle, \
+         open(filepath_of("labels.uint8"), "wb") as labels_handle, \
+         open(filepath_of("articles.int64"), "wb") as articles_handle:
+        np.asarray([0], dtype=np.int64).tofile(vocabulary_offsets_handle)
+        np.asarray([0], dtype=np.int64).tofile(articles_handle)
+
+        for article in articles:
+            if len(article.tokens) == 0:
+                continue
+
+            token_ids = []
+            for token in article.tokens:
+                if token.word not in word_to_id:
+                    word_bytes = token.word.encode("utf-8")
+                    vocabulary_handle.write(word_bytes)
+                    vocabulary_end += len(word_bytes)
+                    np.asarray([vocabulary_end], dtype=np.int64).tofile(vocabulary_offsets_handle)
+                    word_to_id[token.word] = len(word_to_id)
+                token_ids.append(word_to_id[token.word])
+
+            np.asarray(token_ids, dtype=np.int32).tofile(tokens_handle)
+            np.asarray([label_to_id[token.label] for token in article.tokens],
+                       dtype=np.uint8).tofile(labels_handle)
+            count_tokens += len(token_ids)
+            count_articles += 1
+            np.asarray([count_tokens], dtype=np.int64).tofile(articles_handle)
+
+            if verbose and count_articles % 10000 == 0:
+                print("Converted %d articles (%d tokens, %d distinct words)" \
+                      % (count_articles, count_tokens, len(word_to_id)))
+
+    with open(filepath_of(BinaryCorpus.META_FILENAME), "w") as handle:
+        json.dump({"count_articles": count_articles, "count_tokens": count_tokens,
+                   "count_words": len(word_to_id), "labels": cfg.LABELS,
+                   "no_ne_label": cfg.NO_NE_LABEL,
+                   "remove_bio_encoding": cfg.REMOVE_BIO_ENCODING}, handle)
+
+class BinaryCorpus(object):
+    """A corpus that was converted to the binary format of write_binary_corpus().
+
+    All arrays are memory-mapped, so opening the corpus is fast and the corpus is never parsed
+    as text. Iterating over a BinaryCorpus returns Article objects (like load_articles()) and
+    load_windows() recognizes BinaryCorpus objects and cuts the windows directly out of the
+    arrays. Token objects are then only created for the windows that are actually returned.
+
+    Example usage:
+        corpus = BinaryCorpus("/var/corpus/annotated-fulltext.bin")
+        windows = load_windows(corpus, 50, only_labeled_windows=True)
+    """
+    META_FILENAME = "meta.json"
+
+    def __init__(self, dirpath, start_at=0):
+        """Opens a binary corpus.
+        Args:
+            dirpath: Filepath of the binary corpus directory.
+            start_at: The index of the article to start at. (Default is 0.)
+        """
+        with open(os.path.join(dirpath, BinaryCorpus.META_FILENAME), "r") as handle:
+            meta = json.load(handle)
+        if meta["labels"] != cfg.LABELS or meta["no_ne_label"] != cfg.NO_NE_LABEL \
+                or meta["remove_bio_encoding"] != cfg.REMOVE_BIO_ENCODING:
+            raise Exception("The binary corpus at '%s' was created with different settings " \
+                            "for LABELS, NO_NE_LABEL or REMOVE_BIO_ENCODING. Please convert " \
+                            "the corpus again." % (dirpath))
+
+        def open_array(filename, dtype):
+            """Memory-maps one of the arrays of the corpus."""
+            filepath = os.path.join(dirpath, filename)
+            if os.path.getsize(filepath) == 0:
+                return np.zeros((0,), dtype=dtype)
+            return np.memmap(filepath, dtype=dtype, mode="r")
+
+        self.vocabulary = open_array("vocabulary.bin", np.uint8)
+        self.vocabulary_offsets = open_array("vocabulary_offsets.int64", np.int64)
+        self.token_ids = open_array("tokens.int32", np.int32)
+        self.label_ids = open_array("labels.uint8", np.uint8)
+        self.article_offsets = open_array("articles.int64", np.int64)
+        self.labels = [cfg.NO_NE_LABEL] + list(meta["labels"])
+        self.start_at = start_at
+        # words are decoded from the vocabulary only when they are needed
+        self.words = dict()
+
+    def __len__(self):
+        """Returns the number of articles (after start_at)."""
+        return max(0, len(self.article_offsets) - 1 - self.start_at)
+
+    def __iter__(self):
+        """Iterates over the articles of the corpus.
+        Returns:
+            Generator of Article objects.
+        """
+        for article_idx in range(self.start_at, len(self.article_offsets) - 1):
+            start = self.article_offsets[article_idx]
+            end = self.article_offsets[article_idx + 1]
+            yield Article("", tokens=self.get_tokens(start, end))
+
+    def get_word(self, word_id):
+        """Returns the word of a word id.
+        Args:
+            word_id: The id of the word (integer).
+        Returns:
+            The word (unicode string).
+        """
+        word = self.words.get(word_id)
+        if word is None:
+            start = self.vocabulary_offsets[word_id]
+            end = self.vocabulary_offsets[word_id + 1]
+            word = self.vocabulary[start:end].tobytes().decode("utf-8")
+            self.words[word_id] = word
+        return word
+
+    def get_words(self, start, end):
+        """Returns the words of a range of tokens of the corpus (without creating Token objects).
+        Args:
+            start: Index of the first token.
+            end: Index after the last token.
+        Returns:
+            List of words (unicode strings).
+        """
+        return [self.get_word(word_id) for word_id in self.token_ids[start:end].tolist()]
+
+    def get_tokens(self, start, end):
+        """Creates the Token objects of a range of tokens of the corpus.
+        Args:
+            start: Index of the first token.
+            end: Index after the last token.
+        Returns:
+            List of Token objects.
+        """
+        labels = self.labels
+        return [Token(self.get_word(word_id), label=labels[label_id]) \
+                for word_id, label_id in zip(self.token_ids[start:end].tolist(),
+                                             self.label_ids[start:end].tolist())]
+
+    def load_windows(self, window_size, features=None, every_nth_window=1,
+                     only_labeled_windows=False, nb_skip=0, nb_append=None, deduplicator=None):
+        """Loads windows from the corpus, see load_windows() for the arguments.
+        The articles and windows are filtered on the label arrays, Token objects are only created
+        for windows that are returned."""
+        processed_windows = 0
+        skipped = 0
+        added = 0
+        for article_idx in range(self.start_at, len(self.article_offsets) - 1):
+            article_start = int(self.article_offsets[article_idx])
+            article_end = int(self.article_offsets[article_idx + 1])
+            count = int(np.count_nonzero(self.label_ids[article_start:article_end]))
+
+            if count / (article_end - article_start) >= 0.10:
+                # ignore articles with too many labels, see load_windows()
+                continue
+            elif only_labeled_windows and count == 0:
+                continue
+            elif deduplicator is not None and deduplicator.is_duplicate_article(
+                    self.get_words(article_start, article_end)):
+                continue
+
+            for window_start in range(article_start, article_end, window_size):
+                window_end = min(window_start + window_size, article_end)
+                if only_labeled_windows \
+                        and np.count_nonzero(self.label_ids[window_start:window_end]) == 0:
+                    continue
+                if deduplicator is not None:
+                    words = self.get_words(window_start, window_end)
+                    if deduplicator.is_duplicate_window(words, count_stats=skipped >= nb_skip):
+                        continue
+
+                if processed_windows % every_nth_window == 0:
+                    if skipped < nb_skip:
+                        skipped += 1
+                    else:
+                        window = Window(self.get_tokens(window_start, window_end))
+                        if features is not None:
+                            window.apply_features(features)
+                        yield window
+                        added += 1
+                        if nb_append is not None and added >= nb_append:
+                            return
+                processed_windows += 1
+
 # this was removed to get rid of the unicecode dependency and because the ascii representation
 # of words weren't used anyways
 #def cleanup_unicode(in_str):
@@ -157,11 +556,17 @@ def generate_examples(windows, nb_append=None, nb_skip=0, verbose=True):
 class Article(object):
     """Class modelling an article/document from the corpus. It's mostly a wrapper around a list
     of Token objects."""
-    def __init__(self, text):
+    def __init__(self, text, tokens=None):
         """Initialize a new Article object.
         Args:
             text: The string content of the article/document.
+            tokens: Optional list of already parsed Token objects. If provided, text is ignored.
+                (Default is None.)
         """
+        if tokens is not None:
+            self.tokens = tokens
+            return
+
         # Adding re.UNICODE with \s gets rid of some stupid special unicode whitespaces
         # That's neccessary, because otherwise the stanford POS tagger will split words at
         # these whitespaces and then the POS sequences have different lengths from the
@@ -234,7 +639,17 @@ class Window(Article):
         # 3rd dimension: values (for this token and feature, usually just one value, sometimes more,
         #                        e.g. "w2vc=975")
         features_values = [feature.convert_window(self) for feature in features]
+        self.set_feature_values(features_values)
+
+    def set_feature_values(self, features_values):
+        """Sets the feature values of all tokens in this window from the results of several
+        feature generators.
 
+        Args:
+            features_values: List with one entry per feature generator. Each entry is the result
+                of the generator's convert_window(), i.e. a list of lists of feature values
+                (one list per token).
+        """
         for token in self.tokens:
             token.feature_values = []
 
@@ -250,6 +665,11 @@ class Window(Article):
     def get_feature_values_list(self, word_index, skipchain_left, skipchain_right):
         """Generates a list of feature values (strings) for one token/word in the window.
 
+        Feature generators may also generate weighted (numeric) feature values as tuples
+        (name, value), e.g. ("l", 0.4). If any of these appear, the result is a dictionary of
+        attribute to value instead of a list (all string feature values get the value 1.0),
+        which pycrfsuite accepts as weighted attributes.
+
         Args:
             word_index: The index of the word/token for which to generate the featueres.
             skipchain_left: How many words to the left will be included among the features of
@@ -257,21 +677,29 @@ class Window(Article):
                 ["-1:w2vc=123", "-1:l=30", "0:w2vc=18", "0:l=4"].
             skipchain_right: Like skipchain_left, but to the right side.
         Returns:
-            List of strings (list of feature values).
+            List of strings (list of feature values) or, if there are weighted feature values,
+            dictionary of feature value to weight.
         """
         assert word_index >= 0
         assert word_index < len(self.tokens)
 
         all_feature_values = []
+        weighted = dict()
 
         start = max(0, word_index - skipchain_left)
         end = min(len(self.tokens), word_index + 1 + skipchain_right)
         for i, token in enumerate(self.tokens[start:end]):
             diff = start + i - word_index
-            feature_values = ["%d:%s" % (diff, feature_value) \
-                              for feature_value in token.feature_values]
-            all_feature_values.extend(feature_values)
+            for feature_value in token.feature_values:
+                if isinstance(feature_value, tuple):
+                    weighted["%d:%s" % (diff, feature_value[0])] = feature_value[1]
+                else:
+                    all_feature_values.append("%d:%s" % (diff, feature_value))
 
+        if len(weighted) > 0:
+            for feature_value in all_feature_values:
+                weighted[feature_value] = 1.0
+            return weighted
         return all_feature_values
 
     def get_labels(self):
@@ -289,16 +717,22 @@ class Token(object):
         token.feature_values: The feature values, after they have been applied.
             (See Window.apply_features().)
     """
-    def __init__(self, original):
+    def __init__(self, original, label=None):
         """Initialize a new Token object.
         Args:
             original: The original word as found in the text document, including the label,
                 e.g. "foo", "John/PER".
+            label: Optional already parsed label of the word. If provided, original is expected
+                to be the word without the label and will not be parsed. (Default is None.)
         """
         self.original = original
         self.word = original
         self.label = cfg.NO_NE_LABEL
-        if "/" in original:
+        if label is not None:
+            self.label = label
+            if label != cfg.NO_NE_LABEL:
+                self.original = original + "/" + label
+        elif "/" in original:
             pos = original.rfind("/")
             end = original[pos+1:]
             # remove parts of BIO encoding, e.g. remove "B-" from "B-PER" or "I-" from "I-PER"
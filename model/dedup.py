@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""Detection of near-duplicate articles and windows via MinHash and locality sensitive hashing.
+
+Wikipedia-derived corpora contain many boilerplate and almost identical articles (e.g. stubs about
+villages or species that only differ in a few words). Every copy costs POS tagging, LDA and
+training time, but adds almost no information. load_windows() accepts a Deduplicator, which drops
+such articles and windows before any features are generated for them.
+
+Each text is represented by its set of word shingles (n consecutive words). MinHash estimates
+the Jaccard similarity of two such sets by the fraction of equal entries in their signatures.
+The signatures are split into bands and every text is put into one bucket per band (LSH), so
+that only texts which share at least one bucket are compared. A text is a near-duplicate if its
+estimated similarity to any previously seen text is at least the threshold.
+
+Example usage:
+    deduplicator = Deduplicator(threshold=0.8, articles=True, windows=True)
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           deduplicator=deduplicator)
+    ...
+    print(deduplicator.report())
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import zlib
+from collections import Counter
+import numpy as np
+
+# All capitalized constants come from this file
+import config as cfg
+
+class MinHashIndex(object):
+    """LSH index of MinHash signatures, which finds texts that are similar to previously added
+    texts.
+
+    The hash functions are derived from a fixed seed and the shingles are hashed with crc32
+    (python's hash() differs between processes), so that the results do not change between runs.
+    """
+    def __init__(self, threshold=0.8, num_permutations=64, shingle_size=3, seed=42):
+        """Initialize an empty index.
+        Args:
+            threshold: Minimum estimated Jaccard similarity of the shingle sets of two texts for
+                them to count as near-duplicates. (Default is 0.8.)
+            num_permutations: Length of the MinHash signatures. Higher values estimate the
+                similarity more precisely, but are slower and need more memory. (Default is 64.)
+            shingle_size: Number of consecutive words per shingle. (Default is 3.)
+            seed: Seed of the hash functions. (Default is 42.)
+        """
+        assert 0 < threshold <= 1.0
+        self.threshold = threshold
+        self.num_permutations = num_permutations
+        self.shingle_size = shingle_size
+        self.count_bands, self.count_rows = choose_bands(num_permutations, threshold)
+
+        # hash functions of the form h(x) = ((a*x + b) mod 2^64) >> 32 (multiply-shift) with
+        # random odd 64bit values a and random 64bit values b
+        rng = np.random.RandomState(seed)
+        def random_uint64():
+            """Returns num_permutations random 64bit integers."""
+            high = rng.randint(0, 2**32, size=num_permutations).astype(np.uint64)
+            low = rng.randint(0, 2**32, size=num_permutations).astype(np.uint64)
+            return (high << np.uint64(32)) | low
+        self.coefficients_a = random_uint64() | np.uint64(1)
+        self.coefficients_b = random_uint64()
+
+        # one dictionary per band: band content -> ids of the texts in that bucket
+        self.buckets = [dict() for _ in range(self.count_bands)]
+        self.signatures = []
+
+    def get_shingles(self, words):
+        """Returns the crc32 hashes of the word shingles of a text.
+        Args:
+            words: List of words (strings).
+        Returns:
+            Numpy array of uint64.
+        """
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = [" ".join(words)]
+        else:
+            shingles = [" ".join(words[i:i+size]) for i in range(len(words) - size + 1)]
+        return np.array([zlib.crc32(shingle.encode("utf-8")) & 0xffffffff \
+                         for shingle in set(shingles)], dtype=np.uint64)
+
+    def get_signature(self, words):
+        """Computes the MinHash signature of a text.
+        Args:
+            words: List of words (strings).
+        Returns:
+            Numpy array of uint32 with num_permutations entries.
+        """
+        shingles = self.get_shingles(words)
+        hashes = (self.coefficients_a[:, np.newaxis] * shingles[np.newaxis, :] \
+                  + self.coefficients_b[:, np.newaxis]) >> np.uint64(32)
+        return hashes.min(axis=1).astype(np.uint32)
+
+    def add_if_new(self, words):
+        """Checks whether a text is a near-duplicate of a previously added text and adds it to the
+        index if it is not.
+        Args:
+            words: List of words (strings).
+        Returns:
+            True if the text is a near-duplicate (it is then not added), False otherwise.
+        """
+        if len(words) == 0:
+            return False
+
+        signature = self.get_signature(words)
+        keys = [signature[i*self.count_rows:(i+1)*self.count_rows].tobytes() \
+                for i in range(self.count_bands)]
+
+        candidates = set()
+        for band, key in zip(self.buckets, keys):
+            candidates.update(band.get(key, []))
+        for candidate in candidates:
+            similarity = np.mean(self.signatures[candidate] == signature)
+            if similarity >= self.threshold:
+                return True
+
+        text_id = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in zip(self.buckets, keys):
+            band.setdefault(key, []).append(text_id)
+        return False
+
+class Deduplicator(object):
+    """Drops near-duplicate articles and/or windows and counts how many were dropped.
+    Pass it to load_windows() via its deduplicator argument."""
+    def __init__(self, threshold=0.8, articles=True, windows=True, num_permutations=64):
+        """Initialize the deduplicator.
+        Args:
+            threshold: Minimum similarity for two articles/windows to count as near-duplicates,
+                see MinHashIndex. (Default is 0.8.)
+            articles: Whether to drop near-duplicate articles. (Default is True.)
+            windows: Whether to drop near-duplicate windows. (Default is True.)
+            num_permutations: Length of the MinHash signatures. (Default is 64.)
+        """
+        self.threshold = threshold
+        self.article_index = None
+        self.window_index = None
+        if articles:
+            self.article_index = MinHashIndex(threshold, num_permutations=num_permutations)
+        if windows:
+            self.window_index = MinHashIndex(threshold, num_permutations=num_permutations)
+        # e.g. stats["windows"] = number of checked windows,
+        # stats["windows_dropped_tokens"] = number of tokens in dropped windows
+        self.stats = Counter()
+
+    def is_duplicate_article(self, words):
+        """Checks whether an article is a near-duplicate of a previous article.
+        Args:
+            words: The words of the article.
+        Returns:
+            True if the article should be dropped, False otherwise.
+        """
+        return self._check(self.article_index, "articles", words, True)
+
+    def is_duplicate_window(self, words, count_stats=True):
+        """Checks whether a window is a near-duplicate of a previous window.
+        Args:
+            words: The words of the window.
+            count_stats: Whether to count the window in the statistics. load_windows() sets this
+                to False for windows that are skipped anyways (nb_skip), as dropping them does
+                not save any work. (Default is True.)
+        Returns:
+            True if the window should be dropped, False otherwise.
+        """
+        return self._check(self.window_index, "windows", words, count_stats)
+
+    def _check(self, index, kind, words, count_stats):
+        """Checks a text against an index and updates the statistics, see is_duplicate_article()
+        and is_duplicate_window()."""
+        if index is None:
+            return False
+        duplicate = index.add_if_new(words)
+        if count_stats:
+            self.stats[kind] += 1
+            self.stats[kind + "_tokens"] += len(words)
+            if duplicate:
+                self.stats[kind + "_dropped"] += 1
+                self.stats[kind + "_dropped_tokens"] += len(words)
+        return duplicate
+
+    def report(self):
+        """Returns a summary of how many articles and windows were dropped, i.e. how many tokens
+        were not featurized (POS, LDA, ...) and how many windows were not trained on.
+        Returns:
+            The summary as string.
+        """
+        lines = []
+        for kind, index in [("articles", self.article_index), ("windows", self.window_index)]:
+            if index is None:
+                continue
+            lines.append("Dropped %d of %d %s as near-duplicates (%.1f%%, %d of %d tokens)." \
+                         % (self.stats[kind + "_dropped"], self.stats[kind], kind,
+                            100 * self.stats[kind + "_dropped"] / max(self.stats[kind], 1),
+                            self.stats[kind + "_dropped_tokens"], self.stats[kind + "_tokens"]))
+        saved_tokens = self.stats["articles_dropped_tokens"] + self.stats["windows_dropped_tokens"]
+        lines.append("Saved the featurization of %d tokens." % (saved_tokens))
+        return "\n".join(lines)
+
+def choose_bands(num_permutations, threshold):
+    """Chooses how to split the signatures into bands for LSH.
+    Two texts with similarity s end up in at least one common bucket with probability
+    1 - (1 - s^rows)^bands. The split is chosen so that this S-curve is steepest near the
+    threshold, i.e. (1/bands)^(1/rows) is as close as possible to the threshold, but not above it
+    (which would miss many near-duplicates).
+
+    Args:
+        num_permutations: Length of the signatures.
+        threshold: The similarity threshold.
+    Returns:
+        Tuple (count_bands, count_rows) with count_bands * count_rows == num_permutations.
+    """
+    best = None
+    for rows in range(1, num_permutations + 1):
+        if num_permutations % rows != 0:
+            continue
+        bands = num_permutations // rows
+        steepest = (1 / bands) ** (1 / rows)
+        if steepest <= threshold and (best is None or steepest > best[0]):
+            best = (steepest, bands, rows)
+    if best is None:
+        return (num_permutations, 1)
+    return (best[1], best[2])
+
+def create_deduplicator():
+    """Creates a Deduplicator with the settings in config.py (DEDUP_*).
+    Returns:
+        Deduplicator or None if neither articles nor windows are supposed to be deduplicated.
+    """
+    if not cfg.DEDUP_ARTICLES and not cfg.DEDUP_WINDOWS:
+        return None
+    return Deduplicator(cfg.DEDUP_THRESHOLD, articles=cfg.DEDUP_ARTICLES,
+                        windows=cfg.DEDUP_WINDOWS, num_permutations=cfg.DEDUP_NUM_PERMUTATIONS)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Functions and classes to evaluate predicted label chains against the correct label chains."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import Counter
+
+# All capitalized constants come from this file
+import config as cfg
+
+class IncrementalEvaluation(object):
+    """Accumulates the counts that are needed to compute precision, recall and F1 per label,
+    one label chain at a time. The memory usage therefore does not depend on the number of
+    evaluated windows.
+
+    Two kinds of metrics are collected:
+        token-level: Each token counts on its own (same as the classification reports of
+                     scikit-learn over all tokens).
+        entity-level: Consecutive tokens with the same label form one entity, e.g.
+                      "John/PER Doe/PER" is one PER entity. An entity counts as correctly
+                      predicted if both its boundaries and its label are correct.
+                      Tokens with NO_NE_LABEL do not form entities.
+
+    Example usage:
+        evaluation = IncrementalEvaluation()
+        for correct_labels, predicted_labels in ...:
+            evaluation.update(correct_labels, predicted_labels)
+        print(evaluation.report())
+    """
+    def __init__(self):
+        """Initialize the counts (all zero)."""
+        self.token_tp = Counter()
+        self.token_fp = Counter()
+        self.token_fn = Counter()
+        self.entity_tp = Counter()
+        self.entity_fp = Counter()
+        self.entity_fn = Counter()
+        self.count_chains = 0
+
+    def update(self, correct_labels, predicted_labels):
+        """Adds the counts of one label chain (e.g. one window).
+        Args:
+            correct_labels: The correct labels of the tokens, list of strings.
+            predicted_labels: The predicted labels of the tokens, list of strings.
+        """
+        assert len(correct_labels) == len(predicted_labels)
+
+        for correct, predicted in zip(correct_labels, predicted_labels):
+            if correct == predicted:
+                self.token_tp[correct] += 1
+            else:
+                self.token_fn[correct] += 1
+                self.token_fp[predicted] += 1
+
+        correct_entities = set(get_entities(correct_labels))
+        predicted_entities = set(get_entities(predicted_labels))
+        for (label, _, _) in correct_entities & predicted_entities:
+            self.entity_tp[label] += 1
+        for (label, _, _) in correct_entities - predicted_entities:
+            self.entity_fn[label] += 1
+        for (label, _, _) in predicted_entities - correct_entities:
+            self.entity_fp[label] += 1
+
+        self.count_chains += 1
+
+    def merge(self, other):
+        """Adds the counts of another IncrementalEvaluation object to this one.
+        Args:
+            other: The other IncrementalEvaluation object.
+        """
+        self.token_tp.update(other.token_tp)
+        self.token_fp.update(other.token_fp)
+        self.token_fn.update(other.token_fn)
+        self.entity_tp.update(other.entity_tp)
+        self.entity_fp.update(other.entity_fp)
+        self.entity_fn.update(other.entity_fn)
+        self.count_chains += other.count_chains
+
+    def token_scores(self):
+        """Returns the token-level metrics.
+        Returns:
+            Dictionary mapping each label to a tuple (precision, recall, f1, support).
+        """
+        return compute_scores(self.token_tp, self.token_fp, self.token_fn)
+
+    def entity_scores(self):
+        """Returns the entity-level metrics.
+        Returns:
+            Dictionary mapping each label to a tuple (precision, recall, f1, support).
+        """
+        return compute_scores(self.entity_tp, self.entity_fp, self.entity_fn)
+
+    def report(self):
+        """Returns a report with the token-level and entity-level metrics.
+        Returns:
+            The report as string.
+        """
+        return "Token-level:\n%s\n\nEntity-level:\n%s" \
+               % (scores_to_report(self.token_scores()), scores_to_report(self.entity_scores()))
+
+def get_entities(labels):
+    """Extracts the entities from a label chain.
+    Consecutive tokens with the same label (other than NO_NE_LABEL) form one entity.
+
+    Args:
+        labels: The labels of the tokens, list of strings.
+    Returns:
+        List of tuples (label, index of first token, index after last token).
+    """
+    entities = []
+    start = None
+    for i, label in enumerate(labels + [cfg.NO_NE_LABEL]):
+        if start is not None and label != labels[start]:
+            entities.append((labels[start], start, i))
+            start = None
+        if start is None and label != cfg.NO_NE_LABEL and i < len(labels):
+            start = i
+    return entities
+
+def compute_scores(true_positives, false_positives, false_negatives):
+    """Computes precision, recall and F1 for each label from the counts of true positives,
+    false positives and false negatives.
+
+    Args:
+        true_positives: Counter of label to number of true positives.
+        false_positives: Counter of label to number of false positives.
+        false_negatives: Counter of label to number of false negatives.
+    Returns:
+        Dictionary mapping each label to a tuple (precision, recall, f1, support).
+    """
+    labels = set(true_positives.keys()) | set(false_positives.keys()) \
+             | set(false_negatives.keys())
+    result = dict()
+    for label in labels:
+        tp = true_positives[label]
+        fp = false_positives[label]
+        fn = false_negatives[label]
+        precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+        recall = tp / (tp + fn) if tp + fn > 0 else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+        result[label] = (precision, recall, f1, tp + fn)
+    return result
+
+def scores_to_report(scores):
+    """Formats scores as a report, similar to scikit-learn's classification_report().
+
+    Args:
+        scores: Dictionary mapping each label to a tuple (precision, recall, f1, support).
+    Returns:
+        The report as string.
+    """
+    labels = sorted(scores.keys(), key=lambda tag: tag.split('-', 1)[::-1])
+    width = max([len(label) for label in labels] + [len("avg / total")])
+    lines = ["%s  %9s %9s %9s %9s" % (" " * width, "precision", "recall", "f1-score", "support"),
+             ""]
+    for label in labels:
+        precision, recall, f1, support = scores[label]
+        lines.append("%*s  %9.2f %9.2f %9.2f %9d" % (width, label, precision, recall, f1, support))
+
+    # averages weighted by support
+    total = sum([scores[label][3] for label in labels])
+    averages = [sum([scores[label][i] * scores[label][3] for label in labels]) / total \
+                if total > 0 else 0.0 for i in range(3)]
+    lines.append("")
+    lines.append("%*s  %9.2f %9.2f %9.2f %9d" \
+                 % (width, "avg / total", averages[0], averages[1], averages[2], total))
+    return "\n".join(lines)
+
+def bio_classification_report(y_true, y_pred):
+    """
+    Classification report for a list of BIO-encoded sequences.
+    It computes token-level metrics.
+
+    Args:
+        y_true: True labels, list of lists of strings (one list per window).
+        y_pred: Predicted labels, list of lists of strings (one list per window).
+    Returns:
+        classification report as string
+    """
+    evaluation = IncrementalEvaluation()
+    for correct_labels, predicted_labels in zip(y_true, y_pred):
+        evaluation.update(correct_labels, predicted_labels)
+    return scores_to_report(evaluation.token_scores())
+
+def bio_classification_scores(y_true, y_pred):
+    """Computes the same token-level metrics as bio_classification_report(), but returns them
+    as numbers instead of a formatted string, e.g. to collect them in a table.
+
+    Args:
+        y_true: True labels, list of lists of strings (one list per window).
+        y_pred: Predicted labels, list of lists of strings (one list per window).
+    Returns:
+        Dictionary mapping each label to a tuple (precision, recall, f1, support).
+    """
+    evaluation = IncrementalEvaluation()
+    for correct_labels, predicted_labels in zip(y_true, y_pred):
+        evaluation.update(correct_labels, predicted_labels)
+    return evaluation.token_scores()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Helper functions to train and test CRF models on already featurized windows.
+These are used by scripts that train more than one model per run, e.g. sweep.py."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+import pycrfsuite
+
+from model.crf import CrfTrainer, open_tagger
+
+def train_model(examples, model_filepath, algorithm="lbfgs", params=None, verbose=False,
+                engine="crfsuite", workers=1):
+    """Trains a CRF model on example pairs and saves it to a file.
+
+    Args:
+        examples: Pairs of (feature_values_lists, labels), as generated by generate_examples().
+        model_filepath: Filepath under which to save the trained model.
+        algorithm: Name of the crfsuite training algorithm, e.g. "lbfgs" or "l2sgd".
+            (Default is "lbfgs".)
+        params: Optional dictionary of crfsuite training parameters, e.g. {"c1": 0.1}.
+        verbose: Whether crfsuite should output its training messages. (Default is False.)
+        engine: "crfsuite" (pycrfsuite) or "numpy" (CrfTrainer). The numpy engine supports the
+            algorithms "lbfgs" and "adagrad". (Default is "crfsuite".)
+        workers: Number of processes that compute the gradient, numpy engine only.
+            (Default is 1.)
+    Returns:
+        Tuple (training time in seconds, size of the saved model in bytes).
+    """
+    if engine == "numpy":
+        trainer = CrfTrainer(algorithm=algorithm, workers=workers, verbose=verbose)
+    else:
+        trainer = pycrfsuite.Trainer(verbose=verbose)
+        trainer.select(algorithm)
+    if params:
+        trainer.set_params(params)
+    for feature_values_lists, labels in examples:
+        trainer.append(feature_values_lists, labels)
+
+    start = time.time()
+    trainer.train(model_filepath)
+    train_time = time.time() - start
+
+    return train_time, os.path.getsize(model_filepath)
+
+def tag_examples(model_filepath, examples):
+    """Tags example pairs with a trained CRF model.
+
+    Args:
+        model_filepath: Filepath of the trained model.
+        examples: Pairs of (feature_values_lists, labels), as generated by generate_examples().
+    Returns:
+        Tuple (correct label chains, predicted label chains), each a list of lists of strings.
+    """
+    tagger = open_tagger(model_filepath)
+
+    correct_label_chains = []
+    predicted_label_chains = []
+    for feature_values_lists, labels in examples:
+        correct_label_chains.append(labels)
+        predicted_label_chains.append(tagger.tag(feature_values_lists))
+
+    tagger.close()
+    return correct_label_chains, predicted_label_chains
+
+def split_to_folds(items, count_folds):
+    """Splits a list into count_folds parts for k-fold cross validation.
+
+    Args:
+        items: The list to split, e.g. a list of Window objects.
+        count_folds: Number of folds (k).
+    Returns:
+        List of tuples (train items, test items), one tuple per fold.
+    """
+    assert count_folds >= 2
+
+    result = []
+    fold_size = len(items) // count_folds
+    for fold_idx in range(count_folds):
+        start = fold_idx * fold_size
+        # the last fold gets the remaining items
+        end = len(items) if fold_idx == count_folds - 1 else start + fold_size
+        result.append((items[:start] + items[end:], items[start:end]))
+    return result
+
+def weighted_f1(scores, ignore_labels=None):
+    """Computes the support-weighted average F1 score over several labels.
+
+    Args:
+        scores: Dictionary of label to (precision, recall, f1, support), as returned by
+            bio_classification_scores().
+        ignore_labels: Optional list of labels to exclude, e.g. ["O"].
+    Returns:
+        The weighted F1 score (float), or 0.0 if no label has any support.
+    """
+    ignore_labels = ignore_labels if ignore_labels is not None else []
+    sum_f1 = 0.0
+    sum_support = 0
+    for label, (_, _, f1, support) in scores.items():
+        if label not in ignore_labels:
+            sum_f1 += f1 * support
+            sum_support += support
+    return sum_f1 / sum_support if sum_support > 0 else 0.0
@@ -6,11 +6,14 @@ Contains:
     2. A method to create all feature generators.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+import math
+import os
 import re
 
 from model.brown import BrownClusters
-from model.gazetteer import Gazetteer
+from model.gazetteer import Gazetteer, MultiTokenGazetteer
 from model.lda import LdaWrapper
+from model.memory import MemoryMonitor
 from model.pos import PosTagger
 from model.unigrams import Unigrams
 from model.w2v import W2VClusters
@@ -18,7 +21,7 @@ from model.w2v import W2VClusters
 # All capitalized constants come from this file
 import config as cfg
 
-def create_features(verbose=True):
+def create_features(verbose=True, names=None, monitor=None):
     """This method creates all feature generators.
     The feature generators will be used to convert windows of tokens to their string features.
 
@@ -26,6 +29,11 @@ def create_features(verbose=True):
 
     Args:
         verbose: Whether to output messages.
+        names: Optional list of class names of the feature generators to create, e.g. the cheap
+            feature generators of the cascade (CASCADE_CHEAP_FEATURES). The LDA and the POS
+            tagger are then only loaded if they are needed. (Default is None, create all.)
+        monitor: Optional MemoryMonitor (see memory.py) that records the memory usage of each
+            loaded resource. (Default is None.)
     Returns:
         List of feature generators
     """
@@ -38,51 +46,76 @@ def create_features(verbose=True):
         if verbose:
             print(msg)
 
+    monitor = monitor if monitor is not None else MemoryMonitor()
+
     # Load the most common unigrams. These will be used as features.
     print_if_verbose("Loading top N unigrams...")
-    ug_all_top = Unigrams(cfg.UNIGRAMS_FILEPATH, skip_first_n=cfg.UNIGRAMS_SKIP_FIRST_N,
-                          max_count_words=cfg.UNIGRAMS_MAX_COUNT_WORDS)
-
-    # Load all unigrams. These will be used to create the Gazetteer.
-    print_if_verbose("Loading all unigrams...")
-    ug_all = Unigrams(cfg.UNIGRAMS_FILEPATH)
-
-    # Load all unigrams of person names (PER). These will be used to create the Gazetteer.
-    print_if_verbose("Loading person name unigrams...")
-    ug_names = Unigrams(cfg.UNIGRAMS_PERSON_FILEPATH)
-
-    # Create the gazetteer. The gazetteer will contain all names from ug_names that have a higher
-    # frequency among those names than among all unigrams (from ug_all).
-    print_if_verbose("Creating gazetteer...")
-    gaz = Gazetteer(ug_names, ug_all)
-
-    # Unset ug_all and ug_names because we don't need them any more and they need quite a bit of
-    # RAM.
-    ug_all = None
-    ug_names = None
+    with monitor.measure("unigrams (top N)", kind="resource"):
+        ug_all_top = Unigrams(cfg.UNIGRAMS_FILEPATH, skip_first_n=cfg.UNIGRAMS_SKIP_FIRST_N,
+                              max_count_words=cfg.UNIGRAMS_MAX_COUNT_WORDS)
+
+    with monitor.measure("gazetteer", kind="resource"):
+        # Load all unigrams. These will be used to create the Gazetteer.
+        print_if_verbose("Loading all unigrams...")
+        ug_all = Unigrams(cfg.UNIGRAMS_FILEPATH)
+
+        # Load all unigrams of person names (PER). These will be used to create the Gazetteer.
+        print_if_verbose("Loading person name unigrams...")
+        ug_names = Unigrams(cfg.UNIGRAMS_PERSON_FILEPATH)
+
+        # Create the gazetteer. The gazetteer will contain all names from ug_names that have a
+        # higher frequency among those names than among all unigrams (from ug_all).
+        print_if_verbose("Creating gazetteer...")
+        gaz = Gazetteer(ug_names, ug_all)
+
+        # Unset ug_all and ug_names because we don't need them any more and they need quite a
+        # bit of RAM.
+        ug_all = None
+        ug_names = None
+
+    # Load the multi-token gazetteer (names of all labels), see preprocessing/build_gazetteer.py
+    mt_gaz = None
+    if cfg.MULTI_TOKEN_GAZETTEER and (names is None or "MultiTokenGazetteerFeature" in names):
+        if not os.path.isfile(cfg.GAZETTEER_FILEPATH):
+            raise Exception("Multi-token gazetteer not found at '%s'. Create it via " \
+                            "preprocessing/build_gazetteer.py or set MULTI_TOKEN_GAZETTEER " \
+                            "to False." % (cfg.GAZETTEER_FILEPATH))
+        print_if_verbose("Loading multi-token gazetteer...")
+        with monitor.measure("multi-token gazetteer", kind="resource"):
+            mt_gaz = MultiTokenGazetteer(cfg.GAZETTEER_FILEPATH)
 
     # Load the mapping of word to brown cluster and word to brown cluster bitchain
     print_if_verbose("Loading brown clusters...")
-    brown = BrownClusters(cfg.BROWN_CLUSTERS_FILEPATH)
+    with monitor.measure("brown clusters", kind="resource"):
+        brown = BrownClusters(cfg.BROWN_CLUSTERS_FILEPATH)
 
     # Load the mapping of word to word2vec cluster
     print_if_verbose("Loading W2V clusters...")
-    w2vc = W2VClusters(cfg.W2V_CLUSTERS_FILEPATH)
+    with monitor.measure("w2v clusters", kind="resource"):
+        w2vc = W2VClusters(cfg.W2V_CLUSTERS_FILEPATH)
 
     # Load the wrapper for the gensim LDA
-    print_if_verbose("Loading LDA...")
-    lda = LdaWrapper(cfg.LDA_MODEL_FILEPATH, cfg.LDA_DICTIONARY_FILEPATH,
-                     cache_filepath=cfg.LDA_CACHE_FILEPATH)
+    lda = None
+    if names is None or "LDATopicFeature" in names:
+        print_if_verbose("Loading LDA...")
+        with monitor.measure("lda", kind="resource"):
+            lda = LdaWrapper(cfg.LDA_MODEL_FILEPATH, cfg.LDA_DICTIONARY_FILEPATH,
+                             cache_filepath=cfg.LDA_CACHE_FILEPATH)
 
     # Load the wrapper for the stanford POS tagger
-    print_if_verbose("Loading POS-Tagger...")
-    pos = PosTagger(cfg.STANFORD_POS_JAR_FILEPATH, cfg.STANFORD_MODEL_FILEPATH,
-                    cache_filepath=cfg.POS_TAGGER_CACHE_FILEPATH)
+    pos = None
+    if names is None or "POSTagFeature" in names:
+        print_if_verbose("Loading POS-Tagger...")
+        with monitor.measure("pos tagger", kind="resource"):
+            pos = PosTagger(cfg.STANFORD_POS_JAR_FILEPATH, cfg.STANFORD_MODEL_FILEPATH,
+                            cache_filepath=cfg.POS_TAGGER_CACHE_FILEPATH,
+                            engine=cfg.POS_TAGGER_ENGINE,
+                            perceptron_model_filepath=cfg.POS_PERCEPTRON_MODEL_FILEPATH)
 
     # create feature generators
     result = [
         StartsWithUppercaseFeature(),
-        TokenLengthFeature(),
+        TokenLengthFeature(encoding=cfg.NUMERIC_FEATURE_ENCODING),
         ContainsDigitsFeature(),
         ContainsPunctuationFeature(),
         OnlyDigitsFeature(),
@@ -91,14 +124,63 @@ def create_features(verbose=True):
         BrownClusterFeature(brown),
         BrownClusterBitsFeature(brown),
         GazetteerFeature(gaz),
+        MultiTokenGazetteerFeature(mt_gaz) if mt_gaz is not None else None,
         WordPatternFeature(),
-        UnigramRankFeature(ug_all_top),
+        UnigramRankFeature(ug_all_top, encoding=cfg.NUMERIC_FEATURE_ENCODING),
         PrefixFeature(),
         SuffixFeature(),
         POSTagFeature(pos),
         LDATopicFeature(lda, cfg.LDA_WINDOW_LEFT_SIZE, cfg.LDA_WINDOW_LEFT_SIZE)
     ]
 
+    result = [feature for feature in result if feature is not None]
+    if names is not None:
+        result = [feature for feature in result if feature.__class__.__name__ in names]
+
+    return result
+
+def get_resource_filepaths():
+    """Returns the files of all resources that create_features() may load (unigrams, gazetteer,
+    clusters, LDA, POS tagger), e.g. to notice that features generated earlier are outdated
+    because one of these resources was generated again.
+    Returns:
+        List of filepaths and glob patterns (see get_files_fingerprint() in model/cache.py).
+    """
+    return [cfg.UNIGRAMS_FILEPATH, cfg.UNIGRAMS_PERSON_FILEPATH, cfg.GAZETTEER_FILEPATH,
+            cfg.BROWN_CLUSTERS_FILEPATH, cfg.W2V_CLUSTERS_FILEPATH,
+            cfg.LDA_MODEL_FILEPATH + "*", cfg.LDA_DICTIONARY_FILEPATH,
+            cfg.STANFORD_POS_JAR_FILEPATH, cfg.STANFORD_MODEL_FILEPATH,
+            cfg.POS_PERCEPTRON_MODEL_FILEPATH]
+
+def log2_bucket(value):
+    """Returns the log2-bucket of a positive integer, i.e. 0 for 1, 1 for 2-3, 2 for 4-7, ...
+    Args:
+        value: The integer (>= 1).
+    Returns:
+        The bucket (integer).
+    """
+    return int(math.floor(math.log(max(value, 1), 2) + 1e-9))
+
+def convert_windows_per_word(windows, word_to_feature_values):
+    """Converts several windows with a feature generator whose feature values only depend on the
+    word of each token. Every distinct word is only looked up once per call.
+    Args:
+        windows: List of Window objects.
+        word_to_feature_values: Function that converts a word to its list of feature values.
+    Returns:
+        List with one list of lists of features per window (see convert_window()).
+    """
+    word_to_values = dict()
+    result = []
+    for window in windows:
+        window_result = []
+        for token in window.tokens:
+            values = word_to_values.get(token.word)
+            if values is None:
+                values = word_to_feature_values(token.word)
+                word_to_values[token.word] = values
+            window_result.append(list(values))
+        result.append(window_result)
     return result
 
 class StartsWithUppercaseFeature(object):
@@ -124,13 +206,21 @@ class StartsWithUppercaseFeature(object):
 
 class TokenLengthFeature(object):
     """Generates a feature that describes the character length of a token."""
-    def __init__(self, max_length=30):
+    def __init__(self, max_length=30, encoding="categorical"):
         """Instantiates a new object of this feature generator.
         Args:
             max_length: The max length to return in the generated features, e.g. if set to 30 you
                 will never get a "l=31" result, only "l=30" for a token with length >= 30.
-        """
+            encoding: How to encode the length, see NUMERIC_FEATURE_ENCODING:
+                "categorical": One feature per length, e.g. "l=7".
+                "numeric": One weighted feature ("l", length/max_length).
+                "buckets": One feature per log2-bucket of the length, e.g. "l=b2" for
+                    lengths 4 to 7.
+                (Default is "categorical".)
+        """
+        assert encoding in ["categorical", "numeric", "buckets"]
         self.max_length = max_length
+        self.encoding = encoding
 
     def convert_window(self, window):
         """Converts a Window object into a list of lists of features, where features are strings.
@@ -140,11 +230,17 @@ class TokenLengthFeature(object):
             List of lists of features.
             One list of features for each token.
             Each list can contain any number of features (including 0).
-            Each feature is a string.
+            Each feature is a string or, for the "numeric" encoding, a tuple (name, weight).
         """
         result = []
         for token in window.tokens:
-            result.append(["l=%d" % (min(len(token.word), self.max_length))])
+            length = min(len(token.word), self.max_length)
+            if self.encoding == "numeric":
+                result.append([("l", length / self.max_length)])
+            elif self.encoding == "buckets":
+                result.append(["l=b%d" % (log2_bucket(length))])
+            else:
+                result.append(["l=%d" % (length)])
         return result
 
 class ContainsDigitsFeature(object):
@@ -260,6 +356,16 @@ class W2VClusterFeature(object):
             result.append(["w2v=%d" % (self.token_to_cluster(token))])
         return result
 
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        return convert_windows_per_word(
+            windows, lambda word: ["w2v=%d" % (self.w2v_clusters.get_cluster_of(word, -1))])
+
     def token_to_cluster(self, token):
         """Converts a token/word to its cluster index among the word2vec clusters.
         Args:
@@ -295,6 +401,16 @@ class BrownClusterFeature(object):
             result.append(["bc=%d" % (self.token_to_cluster(token))])
         return result
 
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        return convert_windows_per_word(
+            windows, lambda word: ["bc=%d" % (self.brown_clusters.get_cluster_of(word, -1))])
+
     def token_to_cluster(self, token):
         """Converts a token/word to its cluster index among the brown clusters.
         Args:
@@ -330,6 +446,16 @@ class BrownClusterBitsFeature(object):
             result.append(["bcb=%s" % (self.token_to_bitchain(token)[0:7])])
         return result
 
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        return convert_windows_per_word(
+            windows, lambda word: ["bcb=%s" % (self.brown_clusters.get_bitchain_of(word, "")[0:7])])
+
     def token_to_bitchain(self, token):
         """Converts a token/word to its brown cluster bitchain among the brown clusters.
         Args:
@@ -365,6 +491,16 @@ class GazetteerFeature(object):
             result.append(["g=%d" % (int(self.is_in_gazetteer(token)))])
         return result
 
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        return convert_windows_per_word(
+            windows, lambda word: ["g=%d" % (int(self.gazetteer.contains(word)))])
+
     def is_in_gazetteer(self, token):
         """Returns True if the token/word appears in the gazetteer.
         Args:
@@ -374,6 +510,38 @@ class GazetteerFeature(object):
         """
         return self.gazetteer.contains(token.word)
 
+class MultiTokenGazetteerFeature(object):
+    """Generates features that describe whether a token is part of a name in the multi-token
+    gazetteer, for each label and position (B = first token of the name, I = other tokens).
+    E.g. for "Ang Lee" the token "Ang" gets "gaz_PER=B" and the token "Lee" gets "gaz_PER=I".
+    """
+    def __init__(self, gazetteer):
+        """Instantiates a new object of this feature generator.
+        Args:
+            gazetteer: An instance of MultiTokenGazetteer as defined in gazetteer.py that finds
+                all names in a window.
+        """
+        self.gazetteer = gazetteer
+
+    def convert_window(self, window):
+        """Converts a Window object into a list of lists of features, where features are strings.
+        Args:
+            window: The Window object (defined in datasets.py) to use.
+        Returns:
+            List of lists of features.
+            One list of features for each token.
+            Each list can contain any number of features (including 0).
+            Each feature is a string.
+        """
+        result = [set() for _ in window.tokens]
+        matches = self.gazetteer.find_matches([token.word for token in window.tokens])
+        for start, end, labels in matches:
+            for label in labels:
+                result[start].add("gaz_%s=B" % (label))
+                for i in range(start + 1, end):
+                    result[i].add("gaz_%s=I" % (label))
+        return [sorted(token_features) for token_features in result]
+
 class WordPatternFeature(object):
     """Generates a feature that describes the word pattern of a feature.
     A word pattern is a rough representation of the word, examples:
@@ -449,13 +617,24 @@ class UnigramRankFeature(object):
     """Generates a feature that describes the rank of the word among a list of unigrams, ordered
     descending, i.e. the most common word would have the rank 1.
     """
-    def __init__(self, unigrams):
+    def __init__(self, unigrams, encoding="categorical"):
         """Instantiates a new object of this feature generator.
         Args:
             unigrams: An instance of Unigrams as defined in unigrams.py that can be queried
                 to estimate the rank of a word among all unigrams.
-        """
+            encoding: How to encode the rank, see NUMERIC_FEATURE_ENCODING:
+                "categorical": One feature per rank, e.g. "ng1=57".
+                "numeric": One weighted feature ("ng1", 1 - log(rank)/log(count words + 1)),
+                    i.e. 1.0 for the most common word and close to 0 for the rarest ones.
+                "buckets": One feature per log2-bucket of the rank, e.g. "ng1=b5" for the
+                    ranks 32 to 63.
+                Words that are not among the unigrams always get the feature "ng1=-1".
+                (Default is "categorical".)
+        """
+        assert encoding in ["categorical", "numeric", "buckets"]
         self.unigrams = unigrams
+        self.encoding = encoding
+        self.log_count_words = math.log(len(unigrams.word_to_rank) + 1)
 
     def convert_window(self, window):
         """Converts a Window object into a list of lists of features, where features are strings.
@@ -465,13 +644,39 @@ class UnigramRankFeature(object):
             List of lists of features.
             One list of features for each token.
             Each list can contain any number of features (including 0).
-            Each feature is a string.
+            Each feature is a string or, for the "numeric" encoding, a tuple (name, weight).
         """
         result = []
         for token in window.tokens:
-            result.append(["ng1=%d" % (self.token_to_rank(token))])
+            result.append(self.rank_to_feature_values(self.token_to_rank(token)))
         return result
 
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        return convert_windows_per_word(
+            windows, lambda word: self.rank_to_feature_values(self.unigrams.get_rank_of(word, -1)))
+
+    def rank_to_feature_values(self, rank):
+        """Converts a unigram rank to the list of feature values of its token.
+        Args:
+            rank: The rank (integer), -1 for unknown words.
+        Returns:
+            List with one feature value.
+        """
+        if rank < 1:
+            return ["ng1=-1"]
+        elif self.encoding == "numeric":
+            return [("ng1", 1 - math.log(rank) / self.log_count_words)]
+        elif self.encoding == "buckets":
+            return ["ng1=b%d" % (log2_bucket(rank))]
+        else:
+            return ["ng1=%d" % (rank)]
+
     def token_to_rank(self, token):
         """Converts a token/word to its unigram rank.
         Args:
@@ -546,9 +751,31 @@ class POSTagFeature(object):
             Each list can contain any number of features (including 0).
             Each feature is a string.
         """
-        pos_tags = self.stanford_pos_tag(window)
+        return self.pos_tags_to_features(window, self.stanford_pos_tag(window))
+
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        All windows that are not in the cache are POS-tagged with a single call of the tagger.
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        pos_tags_lists = self.pos_tagger.tag_many([[token.word for token in window.tokens] \
+                                                   for window in windows])
+        return [self.pos_tags_to_features(window, pos_tags) \
+                for window, pos_tags in zip(windows, pos_tags_lists)]
+
+    def pos_tags_to_features(self, window, pos_tags):
+        """Converts the POS tags of a window to lists of features.
+        Args:
+            window: The Window object that was POS-tagged.
+            pos_tags: The result of the POS tagger, i.e. list of tuples (word, POS tag).
+        Returns:
+            List of lists of features, one per token.
+        """
         result = []
-        
+
         # catch stupid problems with stanford POS tagger and unicode characters
         if len(pos_tags) == len(window.tokens):
             # _ is the word
@@ -607,19 +834,56 @@ class LDATopicFeature(object):
             Each list can contain any number of features (including 0).
             Each feature is a string.
         """
+        return [self.topics_to_features(self.get_topics(text)) \
+                for text in self.window_to_texts(window)]
+
+    def convert_windows(self, windows):
+        """Converts several Window objects at once, see convert_window().
+        The topics of all text windows (of all tokens) that are not in the cache are inferred
+        with a single call of the LDA.
+        Args:
+            windows: List of Window objects.
+        Returns:
+            List with one list of lists of features per window.
+        """
+        texts_per_window = [self.window_to_texts(window) for window in windows]
+        topics = self.lda_wrapper.get_topics_many([text for texts in texts_per_window \
+                                                   for text in texts])
         result = []
-        for i, token in enumerate(window.tokens):
-            token_features = []
+        start = 0
+        for texts in texts_per_window:
+            result.append([self.topics_to_features(token_topics) \
+                           for token_topics in topics[start:start+len(texts)]])
+            start += len(texts)
+        return result
+
+    def window_to_texts(self, window):
+        """Converts a window to the small text windows around each of its tokens.
+        Args:
+            window: The Window object.
+        Returns:
+            List of strings, one per token.
+        """
+        texts = []
+        for i in range(len(window.tokens)):
             window_start = max(0, i - self.window_left_size)
             window_end = min(len(window.tokens), i + self.window_right_size + 1)
             window_tokens = window.tokens[window_start:window_end]
-            text = " ".join([token.word for token in window_tokens])
-            topics = self.get_topics(text)
-            for (topic_idx, prob) in topics:
-                if prob > self.prob_threshold:
-                    token_features.append("lda_%d=%s" % (topic_idx, "1"))
-            result.append(token_features)
-        return result
+            texts.append(" ".join([token.word for token in window_tokens]))
+        return texts
+
+    def topics_to_features(self, topics):
+        """Converts the LDA topics of a token's text window to a list of features.
+        Args:
+            topics: List of tuples of form (topic index, probability).
+        Returns:
+            List of features, e.g. ["lda_15=1"].
+        """
+        token_features = []
+        for (topic_idx, prob) in topics:
+            if prob > self.prob_threshold:
+                token_features.append("lda_%d=%s" % (topic_idx, "1"))
+        return token_features
 
     def get_topics(self, text):
         """Converts a small text window (string) to its LDA topics.
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
-"""Class encapsulating a Gazetteer.
-A Gazetteer contains a set of words that are names (e.g. names of people)."""
+"""Classes encapsulating gazetteers.
+A Gazetteer contains a set of words that are names (e.g. names of people).
+A MultiTokenGazetteer contains names of several tokens (e.g. "Ang Lee") for every label and finds
+all of them in a sequence of words in one pass (Aho-Corasick automaton over tokens)."""
 from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import mmap
+import zlib
+from collections import deque
+import numpy as np
 
 class Gazetteer(object):
     """Class encapsulating a Gazetteer.
@@ -46,3 +53,280 @@ class Gazetteer(object):
             True if the word is contained in the Gazetteer, False otherwise.
         """
         return word in self.gazetteer
+
+class MultiTokenGazetteer(object):
+    """Gazetteer of names that consist of one or more tokens, each one belonging to one or more
+    labels (e.g. "Ang Lee" -> PER, "New York" -> LOC and ORG).
+
+    The names are stored as an Aho-Corasick automaton over tokens, which finds all names in a
+    sequence of words (including overlapping ones) in a single pass. The automaton consists only
+    of flat arrays (see build()), which are saved in one file and loaded via mmap, i.e. loading
+    is instant and several processes share the same memory pages.
+
+    Arrays:
+        vocab_bytes, vocab_offsets: The UTF-8 encoded words of all names, concatenated.
+        vocab_table: Hash table (open addressing, crc32) of word -> word id + 1 (0 = empty).
+        goto_keys, goto_values: Hash table of (node * count words + word id) -> child node,
+            i.e. the edges of the token trie (goto_keys is -1 for empty slots).
+        fail: Per node the node of the longest proper suffix that is also in the trie.
+        output: Per node the nearest node (the node itself or one along the fail links) at which
+            a name ends, -1 if there is none.
+        next_output: Per node the nearest node at which a name ends, following only the fail
+            links (i.e. excluding the node itself), -1 if there is none.
+        depth: Per node its number of tokens, i.e. the length of the name ending there.
+        label_masks: Per node a bitmask of the labels of the name ending there (0 = no name).
+    """
+    ARRAY_NAMES = ["vocab_bytes", "vocab_offsets", "vocab_table", "goto_keys", "goto_values",
+                   "fail", "output", "next_output", "depth", "label_masks"]
+
+    def __init__(self, filepath=None):
+        """Initializes an empty gazetteer, optionally loaded from a file.
+        Args:
+            filepath: Optional filepath to a file saved via save().
+        """
+        self.labels = []
+        self.arrays = None
+        self._mmap = None
+        if filepath is not None:
+            self.load(filepath)
+
+    def build(self, entries, labels):
+        """Builds the automaton from a list of names.
+        Args:
+            entries: Dictionary of name (tuple of words) -> list of labels.
+            labels: List of all labels (at most 64), e.g. cfg.LABELS.
+        """
+        assert len(labels) <= 64
+        self.labels = list(labels)
+        label_to_bit = dict([(label, 1 << i) for i, label in enumerate(self.labels)])
+
+        vocab = sorted(set([word for name in entries for word in name]))
+        word_to_id = dict([(word, i) for i, word in enumerate(vocab)])
+
+        # token trie as dictionaries, node 0 is the root
+        children = [dict()]
+        depth = [0]
+        label_masks = [0]
+        for name, name_labels in entries.items():
+            node = 0
+            for word in name:
+                word_id = word_to_id[word]
+                if word_id not in children[node]:
+                    children[node][word_id] = len(children)
+                    children.append(dict())
+                    depth.append(depth[node] + 1)
+                    label_masks.append(0)
+                node = children[node][word_id]
+            for label in name_labels:
+                label_masks[node] |= label_to_bit[label]
+
+        # fail and output links via breadth first search
+        count_nodes = len(children)
+        fail = [0] * count_nodes
+        output = [-1] * count_nodes
+        next_output = [-1] * count_nodes
+        queue = deque([0])
+        while len(queue) > 0:
+            node = queue.popleft()
+            if node != 0:
+                next_output[node] = output[fail[node]]
+            output[node] = node if label_masks[node] != 0 else next_output[node]
+            for word_id, child in children[node].items():
+                if node != 0:
+                    state = fail[node]
+                    while state != 0 and word_id not in children[state]:
+                        state = fail[state]
+                    fail[child] = children[state].get(word_id, 0)
+                queue.append(child)
+
+        vocab_encoded = [word.encode("utf-8") for word in vocab]
+        vocab_offsets = np.zeros((len(vocab) + 1,), dtype=np.int64)
+        vocab_offsets[1:] = np.cumsum([len(word) for word in vocab_encoded])
+        vocab_table = np.zeros((get_table_size(len(vocab)),), dtype=np.int32)
+        for word_id, word in enumerate(vocab_encoded):
+            slot = zlib.crc32(word) & (len(vocab_table) - 1)
+            while vocab_table[slot] != 0:
+                slot = (slot + 1) & (len(vocab_table) - 1)
+            vocab_table[slot] = word_id + 1
+
+        count_edges = sum([len(node_children) for node_children in children])
+        goto_keys = np.full((get_table_size(count_edges),), -1, dtype=np.int64)
+        goto_values = np.zeros((len(goto_keys),), dtype=np.int32)
+        for node, node_children in enumerate(children):
+            for word_id, child in node_children.items():
+                key = node * len(vocab) + word_id
+                slot = hash_int(key, len(goto_keys))
+                while goto_keys[slot] != -1:
+                    slot = (slot + 1) & (len(goto_keys) - 1)
+                goto_keys[slot] = key
+                goto_values[slot] = child
+
+        self.arrays = {
+            "vocab_bytes": np.frombuffer(b"".join(vocab_encoded) or b"\0", dtype=np.uint8),
+            "vocab_offsets": vocab_offsets,
+            "vocab_table": vocab_table,
+            "goto_keys": goto_keys,
+            "goto_values": goto_values,
+            "fail": np.array(fail, dtype=np.int32),
+            "output": np.array(output, dtype=np.int32),
+            "next_output": np.array(next_output, dtype=np.int32),
+            "depth": np.array(depth, dtype=np.int32),
+            "label_masks": np.array(label_masks, dtype=np.uint64)
+        }
+        self._init_shortcuts()
+
+    def save(self, filepath):
+        """Saves the automaton to a file.
+        The file starts with one line of JSON (labels and the dtype, offset and length of each
+        array), followed by the raw arrays (each one aligned to 8 bytes).
+
+        Args:
+            filepath: Filepath of the file.
+        """
+        header = {"labels": self.labels, "arrays": dict()}
+        offset = 0
+        for name in self.ARRAY_NAMES:
+            array = self.arrays[name]
+            header["arrays"][name] = {"dtype": array.dtype.str, "offset": offset,
+                                      "count": len(array)}
+            offset += (array.nbytes + 7) // 8 * 8
+        header_line = json.dumps(header).encode("utf-8") + b"\n"
+        # the arrays start at a multiple of 8 bytes as well
+        header_line += b" " * ((8 - len(header_line) % 8) % 8)
+
+        with open(filepath, "wb") as handle:
+            handle.write(header_line)
+            for name in self.ARRAY_NAMES:
+                array = self.arrays[name]
+                handle.write(array.tobytes())
+                handle.write(b"\0" * ((array.nbytes + 7) // 8 * 8 - array.nbytes))
+
+    def load(self, filepath):
+        """Loads an automaton from a file (saved via save()) via mmap.
+        Args:
+            filepath: Filepath of the file.
+        """
+        with open(filepath, "rb") as handle:
+            header_line = handle.readline()
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length = len(header_line) + (8 - len(header_line) % 8) % 8
+        header = json.loads(header_line.decode("utf-8"))
+        self.labels = header["labels"]
+        self.arrays = dict()
+        for name in self.ARRAY_NAMES:
+            spec = header["arrays"][name]
+            self.arrays[name] = np.frombuffer(self._mmap, dtype=np.dtype(str(spec["dtype"])),
+                                              count=spec["count"],
+                                              offset=header_length + spec["offset"])
+        self._init_shortcuts()
+
+    def _init_shortcuts(self):
+        """Sets attributes that are used in every call of find_matches()."""
+        self._count_words = len(self.arrays["vocab_offsets"]) - 1
+        self._vocab_mask = len(self.arrays["vocab_table"]) - 1
+        self._goto_size = len(self.arrays["goto_keys"])
+
+    def count_names(self):
+        """Returns the number of names in the gazetteer.
+        Returns:
+            Number of names (integer).
+        """
+        return int(np.count_nonzero(self.arrays["label_masks"]))
+
+    def get_word_id(self, word):
+        """Returns the id of a word in the automaton's vocabulary.
+        Args:
+            word: The word (string).
+        Returns:
+            The id (integer) or -1 if no name contains the word.
+        """
+        encoded = word.encode("utf-8")
+        vocab_table = self.arrays["vocab_table"]
+        vocab_offsets = self.arrays["vocab_offsets"]
+        vocab_bytes = self.arrays["vocab_bytes"]
+        slot = zlib.crc32(encoded) & self._vocab_mask
+        while True:
+            word_id = int(vocab_table[slot]) - 1
+            if word_id < 0:
+                return -1
+            start, end = int(vocab_offsets[word_id]), int(vocab_offsets[word_id + 1])
+            if end - start == len(encoded) and vocab_bytes[start:end].tobytes() == encoded:
+                return word_id
+            slot = (slot + 1) & self._vocab_mask
+
+    def get_child(self, node, word_id):
+        """Returns the child of a trie node for a word.
+        Args:
+            node: The node (integer).
+            word_id: The id of the word.
+        Returns:
+            The child node or -1 if there is no such edge.
+        """
+        goto_keys = self.arrays["goto_keys"]
+        key = node * self._count_words + word_id
+        slot = hash_int(key, self._goto_size)
+        while True:
+            slot_key = int(goto_keys[slot])
+            if slot_key == key:
+                return int(self.arrays["goto_values"][slot])
+            elif slot_key == -1:
+                return -1
+            slot = (slot + 1) & (self._goto_size - 1)
+
+    def find_matches(self, words):
+        """Finds all names (including overlapping ones) in a sequence of words in one pass.
+        Args:
+            words: List of words (strings).
+        Returns:
+            List of tuples (start, end, labels), where words[start:end] is a name and labels
+            is the list of its labels.
+        """
+        fail = self.arrays["fail"]
+        output = self.arrays["output"]
+        next_output = self.arrays["next_output"]
+        depth = self.arrays["depth"]
+        label_masks = self.arrays["label_masks"]
+        matches = []
+        state = 0
+        for i, word in enumerate(words):
+            word_id = self.get_word_id(word)
+            if word_id < 0:
+                # no name contains this word, i.e. no name can continue through it
+                state = 0
+                continue
+            child = self.get_child(state, word_id)
+            while child < 0 and state != 0:
+                state = int(fail[state])
+                child = self.get_child(state, word_id)
+            state = max(child, 0)
+
+            node = int(output[state])
+            while node >= 0:
+                mask = int(label_masks[node])
+                matches.append((i + 1 - int(depth[node]), i + 1,
+                                [label for j, label in enumerate(self.labels) if mask & (1 << j)]))
+                node = int(next_output[node])
+        return matches
+
+def get_table_size(count_entries):
+    """Returns the size of a hash table for a number of entries (a power of two, at most half
+    full).
+    Args:
+        count_entries: Number of entries.
+    Returns:
+        The size (integer).
+    """
+    size = 1
+    while size < 2 * max(count_entries, 1):
+        size *= 2
+    return size
+
+def hash_int(key, table_size):
+    """Returns the slot of an integer key in a hash table (multiplicative hashing).
+    Args:
+        key: The key (non-negative integer).
+        table_size: Size of the table (power of two).
+    Returns:
+        The slot (integer).
+    """
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32 & (table_size - 1)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Class to map attributes (feature values) to a fixed number of hash buckets (feature hashing)."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import json
+import zlib
+
+# start value of the crc32 that decided the sign of an attribute in hashing files without a
+# "sign_hash" entry (sign_hash "crc32"). As crc32 is affine, this sign is the same for all
+# attributes of the same length in a bucket (if count_buckets is a power of two), i.e. colliding
+# attributes never cancel each other out. New models use md5 instead.
+SIGN_HASH_SEED = 0x5bd1e995
+
+class AttributeHasher(object):
+    """Replaces the attributes of examples by hash buckets, so that the number of distinct
+    attributes (and thereby the memory usage of the trainer and the size of the model) is bounded
+    by the number of buckets, no matter how large the corpus is.
+
+    An attribute such as "-3:pf=Joh" is mapped to the bucket "h<N>" with
+    N = crc32(attribute) % count_buckets. In the signed scheme, a second hash decides whether the
+    attribute adds +1 or -1 to its bucket, so that colliding attributes cancel each other out on
+    average instead of always adding up. The buckets of a token are then returned as a dictionary
+    of bucket name to value (which pycrfsuite accepts as weighted attributes). crc32 and md5 are
+    used, because python's hash() differs between processes and runs. The sign must not be
+    derived from crc32 as well: crc32 is affine, so its bits are determined by the bucket for
+    attributes of the same length.
+
+    Example usage:
+        hasher = AttributeHasher(count_buckets=2**20, signed=True)
+        hashed = hasher.hash_example(feature_values_lists)
+    """
+    def __init__(self, count_buckets=2**20, signed=True):
+        """Initialize the hasher.
+        Args:
+            count_buckets: Number of hash buckets, i.e. the maximum number of distinct attributes.
+            signed: Whether to use the signed scheme (see above). Without it, every attribute adds
+                +1 to its bucket. (Default is True.)
+        """
+        assert count_buckets > 0
+        self.count_buckets = count_buckets
+        self.signed = signed
+        # hash function of the sign, "md5" or "crc32" (only for models hashed with older versions)
+        self.sign_hash = "md5"
+
+    def hash_attribute(self, attribute):
+        """Maps a single attribute to its bucket.
+        Args:
+            attribute: The attribute, e.g. "-3:pf=Joh".
+        Returns:
+            Tuple (bucket name, value), e.g. ("h1234", -1.0).
+        """
+        data = attribute.encode("utf-8")
+        bucket = (zlib.crc32(data) & 0xffffffff) % self.count_buckets
+        value = 1.0
+        if self.signed and self.get_sign_bit(data):
+            value = -1.0
+        return ("h%d" % (bucket), value)
+
+    def get_sign_bit(self, data):
+        """Returns the bit that decides the sign of an attribute (1 means -1.0).
+        Args:
+            data: The attribute, encoded as utf-8.
+        Returns:
+            0 or 1.
+        """
+        if self.sign_hash == "crc32":
+            return zlib.crc32(data, SIGN_HASH_SEED) & 1
+        return bytearray(hashlib.md5(data).digest())[0] & 1
+
+    def count_collisions(self, attributes):
+        """Counts the pairs of attributes of the same length that fall into the same bucket and how
+        many of them have opposite signs (and therefore cancel each other out). With independent
+        signs, this should be about half of the pairs. Pairs of the same length are counted,
+        because a sign that depends on the bucket (e.g. a second crc32) shows up only for them.
+        Args:
+            attributes: Iterable of distinct attributes.
+        Returns:
+            Tuple (number of colliding pairs, number of those with opposite signs).
+        """
+        # (bucket, length) -> [number of attributes with +1, number of attributes with -1]
+        signs = dict()
+        for attribute in attributes:
+            bucket, value = self.hash_attribute(attribute)
+            counts = signs.setdefault((bucket, len(attribute.encode("utf-8"))), [0, 0])
+            counts[0 if value > 0 else 1] += 1
+        count_pairs = 0
+        count_opposite = 0
+        for count_positive, count_negative in signs.values():
+            count = count_positive + count_negative
+            count_pairs += count * (count - 1) // 2
+            count_opposite += count_positive * count_negative
+        return (count_pairs, count_opposite)
+
+    def hash_attributes(self, feature_values):
+        """Maps the attributes of a single token to buckets.
+        Attributes that fall into the same bucket are summed up. Buckets whose values cancel each
+        other out (signed scheme) are removed.
+
+        Args:
+            feature_values: List of attributes of the token or dictionary of attribute to weight
+                (weighted attributes, their weights are multiplied with the bucket values).
+        Returns:
+            Dictionary of bucket name to value.
+        """
+        if isinstance(feature_values, dict):
+            weighted = feature_values.items()
+        else:
+            weighted = [(attribute, 1.0) for attribute in feature_values]
+
+        buckets = dict()
+        for attribute, weight in weighted:
+            bucket, value = self.hash_attribute(attribute)
+            buckets[bucket] = buckets.get(bucket, 0.0) + value * weight
+        return dict([(bucket, value) for bucket, value in buckets.items() if value != 0])
+
+    def hash_example(self, feature_values_lists):
+        """Maps the attributes of all tokens of an example to buckets.
+        Args:
+            feature_values_lists: List of lists of attributes (one list per token), as generated
+                by generate_examples().
+        Returns:
+            List of dictionaries of bucket name to value (one dictionary per token).
+        """
+        return [self.hash_attributes(feature_values) for feature_values in feature_values_lists]
+
+    def save(self, filepath):
+        """Saves the settings of the hasher to a file, so that the same hashing can be applied
+        during tagging.
+        Args:
+            filepath: Filepath of the file to write.
+        """
+        with open(filepath, "w") as handle:
+            json.dump({"count_buckets": self.count_buckets, "signed": self.signed,
+                       "sign_hash": self.sign_hash}, handle)
+
+    def load(self, filepath):
+        """Loads the settings of the hasher from a file, as written by save().
+        Args:
+            filepath: Filepath of the file to read.
+        """
+        with open(filepath, "r") as handle:
+            settings = json.load(handle)
+        self.count_buckets = settings["count_buckets"]
+        self.signed = settings["signed"]
+        self.sign_hash = settings.get("sign_hash", "crc32")
+
+def get_hashing_filepath(identifier):
+    """Returns the filepath under which the hashing settings of a model are saved.
+    Args:
+        identifier: Identifier of the model, as used in train.py and test.py.
+    Returns:
+        Filepath (string).
+    """
+    return "%s.hashing" % (identifier)
@@ -1,29 +1,35 @@
 # -*- coding: utf-8 -*-
 """Class that wraps a previously trained gensim LDA."""
 from __future__ import absolute_import, division, print_function, unicode_literals
-import random
-import shelve
 import gensim
 from gensim.models.ldamulticore import LdaMulticore
 
+from model.cache import ShelveCache, get_files_fingerprint
+
 class LdaWrapper(object):
     """Class that wraps a previously trained gensim LDA.
 
     This class uses a shelve cache to store generated results. This speeds up the generation
     of training examples, if the identical corpus, window sizes etc. are used.
+
+    The wrapper can be shared between threads. Accesses to the cache are synchronized (see
+    ShelveCache), while the inference happens outside of the lock.
     """
     def __init__(self, lda_filepath, dictionary_filepath, cache_filepath=None):
         """Initialize the LDA wrapper.
         Args:
             lda_filepath: Filepath to the trained LDA model.
             dictionary_filepath: Filepath to the dictionary of the LDA.
-            cache_filepath: Optional filepath to a shelve cache for the LDA results.
+            cache_filepath: Optional filepath to a shelve cache for the LDA results. The cache is
+                emptied when the LDA model or its dictionary changed.
         """
         self.lda = LdaMulticore.load(lda_filepath)
         self.dictionary = gensim.corpora.dictionary.Dictionary.load(dictionary_filepath)
-        self.cache_synch_prob = 2 # in percent, 1 to 100
         self.cache_filepath = cache_filepath
-        self.cache = shelve.open(cache_filepath) if cache_filepath is not None else None
+        self.cache = None
+        if cache_filepath is not None:
+            fingerprint = get_files_fingerprint([lda_filepath + "*", dictionary_filepath])
+            self.cache = ShelveCache(cache_filepath, fingerprint=fingerprint)
 
     def get_topics(self, text):
         """Returns the topics of a small string text window.
@@ -36,17 +42,40 @@ class LdaWrapper(object):
             return self.get_topics_uncached(text)
         else:
             _hash = str(hash(text))
+            topics = self.cache.get(_hash)
+            if topics is not None:
+                return topics
+
+            topics = self.get_topics_uncached(text)
+            self.cache.add([(_hash, topics)])
+            return topics
 
-            if self.cache.has_key(_hash):
-                return self.cache[_hash]
+    def get_topics_many(self, texts):
+        """Returns the topics of several small string text windows.
+        The topics of all texts that are not in the cache are inferred at once.
+
+        Args:
+            texts: List of small text windows (strings).
+        Returns:
+            List of lists of tuples of form (topic index, probability), one per text.
+        """
+        results = dict()
+        uncached = []
+        cached = self.cache.get_many([str(hash(text)) for text in texts]) \
+                 if self.cache is not None else dict()
+        for text in set(texts):
+            if str(hash(text)) in cached:
+                results[text] = cached[str(hash(text))]
             else:
-                topics = self.get_topics_uncached(text)
+                uncached.append(text)
 
-                self.cache[_hash] = topics
-                if random.randint(1, 100) <= self.cache_synch_prob:
-                    self.synchronize_cache()
+        if len(uncached) > 0:
+            for text, topics in zip(uncached, self.get_topics_many_uncached(uncached)):
+                results[text] = topics
+            if self.cache is not None:
+                self.cache.add([(str(hash(text)), results[text]) for text in uncached])
 
-                return topics
+        return [results[text] for text in texts]
 
     def get_topics_uncached(self, text):
         """Returns the topics of a small string text window without querying the cache.
@@ -58,6 +87,27 @@ class LdaWrapper(object):
         tokens = text.lower().split(" ")
         return self.lda[self.dictionary.doc2bow(tokens)]
 
+    def get_topics_many_uncached(self, texts):
+        """Returns the topics of several small string text windows without querying the cache.
+        Runs the LDA's inference once on all texts instead of once per text.
+
+        Args:
+            texts: List of small text windows (strings).
+        Returns:
+            List of lists of tuples of form (topic index, probability), one per text.
+        """
+        bows = [self.dictionary.doc2bow(text.lower().split(" ")) for text in texts]
+        gamma, _ = self.lda.inference(bows)
+        # same normalization and filtering as self.lda[bow]
+        minimum_probability = getattr(self.lda, "minimum_probability", 0.01)
+        results = []
+        for row in gamma:
+            topic_dist = row / row.sum()
+            results.append([(topic_idx, topic_value) for topic_idx, topic_value \
+                            in enumerate(topic_dist) if topic_value >= minimum_probability])
+        return results
+
     def synchronize_cache(self):
         """Synchronizes the shelve cache on the HDD with the version in the RAM."""
-        self.cache.sync()
+        if self.cache is not None:
+            self.cache.synchronize()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Measurement of the memory usage per pipeline stage and per loaded resource, and a buffer that
+spills to disk when the memory usage exceeds a budget.
+
+Example usage:
+    monitor = MemoryMonitor(budget_mb=cfg.MEMORY_BUDGET_MB)
+    with monitor.measure("brown clusters", kind="resource"):
+        brown = BrownClusters(cfg.BROWN_CLUSTERS_FILEPATH)
+    ...
+    windows = SpillingBuffer(budget_mb=cfg.MEMORY_BUDGET_MB)
+    windows.extend(load_windows(...))
+    for window in windows:
+        ...
+    windows.close()
+    print(monitor.report())
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import pickle
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from model.profiling import stage
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+# All capitalized constants come from this file
+import config as cfg
+
+class MemoryMonitor(object):
+    """Records the memory usage of named stages (e.g. "featurize windows") and resources
+    (e.g. "unigrams").
+
+    For each stage the monitor records the resident set size (RSS) of the process before and
+    after it and the peak RSS of the process up to its end. If tracemalloc is available and
+    activated, it also records how much memory python allocated during the stage (including the
+    peak, which is more precise than the RSS, but slows down allocations).
+    """
+    def __init__(self, budget_mb=None, trace=False):
+        """Initialize the monitor.
+        Args:
+            budget_mb: Optional memory budget in MB. Stages that exceeded it are marked in the
+                report. (Default is None.)
+            trace: Whether to trace the allocations with tracemalloc (only python 3).
+                (Default is False.)
+        """
+        self.budget_mb = budget_mb
+        self.trace = trace and tracemalloc is not None
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.records = []
+
+    @contextmanager
+    def measure(self, name, kind="stage"):
+        """Context manager that records the memory usage of the code inside of it.
+        The code is also marked as a stage for the profiler (see profiling.py), resources as
+        "load <name>".
+        Args:
+            name: Name of the stage or resource.
+            kind: "stage" or "resource". (Default is "stage".)
+        """
+        rss_before = get_rss_mb()
+        traced_before = None
+        if self.trace:
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        with stage(name if kind == "stage" else "load %s" % (name)):
+            yield
+        record = {"kind": kind, "name": name, "seconds": time.time() - start,
+                  "rss_before_mb": rss_before, "rss_after_mb": get_rss_mb(),
+                  "peak_rss_mb": get_peak_rss_mb(), "traced_mb": None, "traced_peak_mb": None}
+        if self.trace:
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            record["traced_mb"] = (traced - traced_before) / (1024 * 1024)
+            record["traced_peak_mb"] = (traced_peak - traced_before) / (1024 * 1024)
+        self.records.append(record)
+
+    def report(self):
+        """Returns a (tab-separated) table of the memory usage of all recorded stages and
+        resources.
+        Returns:
+            The table as string.
+        """
+        header = ["kind", "name", "seconds", "rss_delta_mb", "rss_after_mb", "peak_rss_mb"]
+        if self.trace:
+            header.extend(["traced_mb", "traced_peak_mb"])
+        lines = ["\t".join(header)]
+        for record in self.records:
+            row = [record["kind"], record["name"], "%.1f" % (record["seconds"]),
+                   "%+.1f" % (record["rss_after_mb"] - record["rss_before_mb"]),
+                   "%.1f" % (record["rss_after_mb"]), "%.1f" % (record["peak_rss_mb"])]
+            if self.trace:
+                row.extend(["%.1f" % (record["traced_mb"]), "%.1f" % (record["traced_peak_mb"])])
+            if self.budget_mb is not None and record["peak_rss_mb"] > self.budget_mb:
+                row.append("(over budget of %d MB)" % (self.budget_mb))
+            lines.append("\t".join(row))
+        return "\n".join(lines)
+
+class SpillingBuffer(object):
+    """List-like buffer that moves its items to a temporary file on disk whenever the memory
+    usage of the process exceeds a budget.
+
+    The items are pickled in chunks. Iterating over the buffer first reads the spilled chunks
+    (in the order in which they were added) and then the items that are still in RAM, i.e. the
+    order of the items is preserved. The buffer can be iterated several times.
+    """
+    def __init__(self, budget_mb=None, dirpath=None, check_every=100):
+        """Initialize an empty buffer.
+        Args:
+            budget_mb: Memory budget (RSS of the process) in MB. Without a budget the buffer is
+                a plain list. (Default is None.)
+            dirpath: Directory of the temporary file. (Default is None, the system's temporary
+                directory.)
+            check_every: Number of added items after which the RSS is checked again.
+                (Default is 100.)
+        """
+        self.budget_mb = budget_mb
+        self.dirpath = dirpath
+        self.check_every = check_every
+        self.items = []
+        self.filepath = None
+        self.count_spilled = 0
+        self.count_chunks = 0
+
+    def append(self, item):
+        """Adds an item to the buffer.
+        Args:
+            item: The item (must be picklable).
+        """
+        self.items.append(item)
+        if self.budget_mb is not None and len(self.items) % self.check_every == 0 \
+                and get_rss_mb() > self.budget_mb:
+            self.spill()
+
+    def extend(self, items):
+        """Adds several items to the buffer.
+        Args:
+            items: Iterable of items.
+        """
+        for item in items:
+            self.append(item)
+
+    def spill(self):
+        """Moves all items that are currently in RAM to the temporary file."""
+        if len(self.items) == 0:
+            return
+        if self.filepath is None:
+            handle, self.filepath = tempfile.mkstemp(prefix="ner-crf-spill-", suffix=".pickle",
+                                                     dir=self.dirpath)
+            os.close(handle)
+        with open(self.filepath, "ab") as handle:
+            pickle.dump(self.items, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self.count_spilled += len(self.items)
+        self.count_chunks += 1
+        self.items = []
+
+    def close(self):
+        """Removes the items and the temporary file."""
+        if self.filepath is not None and os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+        self.filepath = None
+        self.items = []
+        self.count_spilled = 0
+        self.count_chunks = 0
+
+    def __len__(self):
+        return self.count_spilled + len(self.items)
+
+    def __iter__(self):
+        if self.filepath is not None:
+            with open(self.filepath, "rb") as handle:
+                for _ in range(self.count_chunks):
+                    for item in pickle.load(handle):
+                        yield item
+        for item in self.items:
+            yield item
+
+def get_rss_mb():
+    """Returns the current resident set size (RSS) of this process.
+    Falls back to the peak RSS if the current RSS can't be read (i.e. not on linux).
+    Returns:
+        RSS in MB (float).
+    """
+    try:
+        with open("/proc/self/statm", "r") as handle:
+            pages = int(handle.read().split()[1])
+        return pages * os.sysconf(str("SC_PAGE_SIZE")) / (1024 * 1024)
+    except (IOError, OSError, ValueError):
+        return get_peak_rss_mb()
+
+def get_peak_rss_mb():
+    """Returns the peak resident set size (RSS) of this process so far.
+    Returns:
+        Peak RSS in MB (float).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def create_memory_monitor():
+    """Creates a MemoryMonitor with the settings in config.py (MEMORY_*).
+    Returns:
+        MemoryMonitor
+    """
+    return MemoryMonitor(budget_mb=cfg.MEMORY_BUDGET_MB, trace=cfg.MEMORY_TRACEMALLOC)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Monitoring of the CRF training: Metrics per iteration, a JSON log and early stopping based on
+the F1 score on holdout windows.
+
+crfsuite evaluates the model on the holdout windows (group 1) after every iteration if they are
+appended to the trainer with group=1 and train() is called with holdout=1. The MonitoredTrainer
+collects these scores (and loss, active features, time) via pycrfsuite's on_iteration() hook.
+
+crfsuite cannot be told to stop early and save the current model. Early stopping therefore
+aborts the training once the holdout F1 did not improve for some iterations and then trains
+again with max_iterations set to the best iteration. As L-BFGS is deterministic, this results in
+the model of the best iteration, while all iterations after the plateau are skipped.
+
+Example usage:
+    trainer = MonitoredTrainer(log_filepath="my_experiment.training.json", patience=10)
+    trainer.append(feature_values_lists, labels, 0) # training window
+    trainer.append(feature_values_lists, labels, 1) # holdout window
+    trainer.train_monitored("my_experiment", holdout=1)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import pickle
+import time
+import pycrfsuite
+
+from model.cache import get_files_fingerprint
+from model.datasets import load_windows, load_articles, generate_examples
+from model.dedup import create_deduplicator
+from model.experiments import weighted_f1
+from model.features import get_resource_filepaths
+
+# All capitalized constants come from this file
+import config as cfg
+
+# types of the attributes of feature generators that count as settings, see
+# get_feature_settings()
+SETTING_TYPES = (bool, int, float, type(""), type(b""), type(None))
+
+class EarlyStopping(Exception):
+    """Raised in on_iteration() to abort the training of crfsuite."""
+    pass
+
+class MonitoredTrainer(pycrfsuite.Trainer):
+    """pycrfsuite.Trainer that records metrics per iteration in a JSON log and optionally stops
+    the training when the F1 score on the holdout windows does not improve any more.
+
+    Notice that pycrfsuite only calls on_iteration() if verbose is True."""
+    def __init__(self, log_filepath=None, patience=None, min_delta=0.0, log_interval=10.0,
+                 **kwargs):
+        """Initialize the trainer.
+        Args:
+            log_filepath: Optional filepath of the JSON log, written during and after the
+                training.
+            patience: Number of iterations without an improvement of the holdout F1 score after
+                which to stop the training. None deactivates early stopping. (Default is None.)
+            min_delta: Minimum increase of the holdout F1 score that counts as an improvement.
+                (Default is 0.0.)
+            log_interval: Minimum number of seconds between two writes of the JSON log during
+                the training. The log contains all iterations so far, so writing it after every
+                iteration would slow down long trainings. (Default is 10.0.)
+            **kwargs: Arguments for pycrfsuite.Trainer, e.g. verbose=True.
+        """
+        kwargs["verbose"] = True
+        super(MonitoredTrainer, self).__init__(**kwargs)
+        self.log_filepath = log_filepath
+        self.patience = patience
+        self.min_delta = min_delta
+        self.log_interval = log_interval
+        self.last_log_write = None
+        self.iterations = []
+        self.run = 0
+        self.run_start = None
+        self.best_f1 = None
+        self.best_iteration = None
+        self.stopped_at = None
+
+    def train_monitored(self, model_filepath, holdout=-1):
+        """Trains the model, with early stopping if a patience was set and holdout windows
+        are used.
+        Args:
+            model_filepath: Filepath under which to save the trained model.
+            holdout: The group of the holdout windows or -1 to not use any. (Default is -1.)
+        """
+        try:
+            self.start_run()
+            self.train(model_filepath, holdout=holdout)
+        except EarlyStopping:
+            self.stopped_at = self.iterations[-1]["iteration"]
+            print("Holdout F1 did not improve for %d iterations, stopped at iteration %d. " \
+                  "Training again up to the best iteration %d (F1 %.4f)..." \
+                  % (self.patience, self.stopped_at, self.best_iteration, self.best_f1))
+            self.set_params({"max_iterations": self.best_iteration})
+            self.start_run()
+            self.train(model_filepath, holdout=holdout)
+        self.write_log()
+
+    def start_run(self):
+        """Resets the state of the early stopping before a call of train()."""
+        self.run += 1
+        self.run_start = time.time()
+        self.best_f1 = None
+        self.best_iteration = None
+
+    def on_iteration(self, log, info):
+        """Called by pycrfsuite after every iteration.
+        Records the metrics of the iteration and raises EarlyStopping if the holdout F1 score
+        did not improve for the last patience iterations (only in the first run).
+
+        Args:
+            log: The log messages of the iteration.
+            info: Dictionary of metrics, as parsed by pycrfsuite's log parser.
+        """
+        entry = {"run": self.run,
+                 "iteration": info["num"],
+                 "loss": info.get("loss"),
+                 "active_features": info.get("active_features"),
+                 "feature_norm": info.get("feature_norm"),
+                 "error_norm": info.get("error_norm"),
+                 "seconds": info.get("time"),
+                 "elapsed_seconds": time.time() - self.run_start}
+
+        if "scores" in info:
+            scores = dict([(label, (score.precision, score.recall, score.f1, score.ref)) \
+                           for label, score in info["scores"].items()])
+            entry["holdout_scores"] = scores
+            entry["holdout_f1"] = weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])
+            if self.best_f1 is None or entry["holdout_f1"] > self.best_f1 + self.min_delta:
+                self.best_f1 = entry["holdout_f1"]
+                self.best_iteration = entry["iteration"]
+            print("Iteration %d: holdout F1 %.4f (best %.4f at iteration %d)" \
+                  % (entry["iteration"], entry["holdout_f1"], self.best_f1, self.best_iteration))
+
+        self.iterations.append(entry)
+        if self.last_log_write is None or time.time() - self.last_log_write >= self.log_interval:
+            self.write_log()
+
+        if self.patience is not None and self.run == 1 and self.best_iteration is not None \
+           and entry["iteration"] - self.best_iteration >= self.patience:
+            raise EarlyStopping()
+
+    def write_log(self):
+        """Writes all recorded metrics to the JSON log (if a log filepath was set)."""
+        if self.log_filepath is None:
+            return
+        with open(self.log_filepath, "w") as handle:
+            json.dump(self.get_log_content(), handle, indent=2, sort_keys=True)
+        self.last_log_write = time.time()
+
+    def get_log_content(self):
+        """Returns the content of the JSON log.
+        Returns:
+            Dictionary.
+        """
+        return {"params": self.get_params(),
+                "patience": self.patience,
+                "min_delta": self.min_delta,
+                "stopped_at": self.stopped_at,
+                "best_iteration": self.best_iteration,
+                "best_holdout_f1": self.best_f1,
+                "iterations": self.iterations}
+
+def get_training_log_filepath(identifier):
+    """Returns the filepath of the JSON training log of a model.
+    Args:
+        identifier: Identifier of the model, as used in train.py and test.py.
+    Returns:
+        Filepath (string).
+    """
+    return "%s.training.json" % (identifier)
+
+def load_holdout_examples(feature_generators, nb_skip, nb_append,
+                          cache_filepath=cfg.HOLDOUT_CACHE_FILEPATH):
+    """Loads the featurized holdout windows, from the cache if possible.
+    The cache is only used if it was created with the same corpus, windows, deduplication and
+    feature generators (including their settings, e.g. NUMERIC_FEATURE_ENCODING) and if none of
+    the resources of the feature generators (LDA, clusters, unigrams, ...) changed since then.
+    If near-duplicates are dropped (DEDUP_ARTICLES, DEDUP_WINDOWS), the windows are counted after
+    dropping them, with a new deduplicator, in the same way as in train.py. The holdout windows
+    therefore continue the stream of training windows and duplicates of training (and test)
+    windows are dropped from them.
+
+    Args:
+        feature_generators: The feature generators, as returned by create_features().
+        nb_skip: Number of windows before the holdout windows (after dropping near-duplicates).
+        nb_append: Number of holdout windows.
+        cache_filepath: Filepath of the cache (pickle file). None deactivates the cache.
+            (Default is HOLDOUT_CACHE_FILEPATH.)
+    Returns:
+        List of pairs (feature_values_lists, labels), as generated by generate_examples().
+    """
+    key = {"articles_filepath": cfg.ARTICLES_FILEPATH, "window_size": cfg.WINDOW_SIZE,
+           "nb_skip": nb_skip, "nb_append": nb_append,
+           "skipchain": [cfg.SKIPCHAIN_LEFT, cfg.SKIPCHAIN_RIGHT],
+           "dedup": [cfg.DEDUP_ARTICLES, cfg.DEDUP_WINDOWS, cfg.DEDUP_THRESHOLD,
+                     cfg.DEDUP_NUM_PERMUTATIONS],
+           "features": [get_feature_settings(feature) for feature in feature_generators],
+           "resources": get_files_fingerprint(get_resource_filepaths())}
+
+    if cache_filepath is not None and os.path.isfile(cache_filepath):
+        with open(cache_filepath, "rb") as handle:
+            cached = pickle.load(handle)
+        if cached["key"] == key:
+            return cached["examples"]
+
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           feature_generators, only_labeled_windows=True,
+                           nb_skip=nb_skip, nb_append=nb_append,
+                           deduplicator=create_deduplicator())
+    examples = list(generate_examples(windows, nb_append=nb_append, verbose=False))
+    if cache_filepath is not None:
+        with open(cache_filepath, "wb") as handle:
+            pickle.dump({"key": key, "examples": examples}, handle, protocol=2)
+    return examples
+
+def get_feature_settings(feature):
+    """Returns the settings of a feature generator, i.e. its class name and all of its attributes
+    with simple values (e.g. encoding, max_length, window sizes). Loaded resources (unigrams,
+    clusters, taggers, ...) are not included, see get_resource_filepaths() instead.
+    Args:
+        feature: The feature generator.
+    Returns:
+        List [class name, sorted list of [attribute, value]].
+    """
+    settings = [[name, value] for name, value in sorted(vars(feature).items()) \
+                if isinstance(value, SETTING_TYPES)]
+    return [feature.__class__.__name__, settings]
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Averaged perceptron POS tagger in pure python.
+
+The tagger is trained on sentences that were already POS-tagged by another tagger (usually the
+Stanford POS tagger, whose results are stored in the shelve cache of PosTagger). It then uses the
+same tagset, but runs in-process without a JVM. Use PosTagger(..., engine="perceptron") to let
+the POSTagFeature use it.
+
+The algorithm follows the well-known greedy averaged perceptron tagger (as e.g. in textblob-aptagger
+and nltk's PerceptronTagger): Each token is classified from left to right, based on features of
+the surrounding words and the already predicted tags of the two previous words. Words that
+(almost) always got the same tag in the training data are tagged via a lookup table.
+
+Example usage:
+    tagger = AveragedPerceptronTagger()
+    tagger.train([[("Peter", "NE"), ("geht", "VVFIN"), (".", "$.")], ...])
+    tagger.save("pos.perceptron")
+    tags = tagger.tag(["Peter", "geht", "."])
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pickle
+import random
+from collections import defaultdict
+
+START = ["-START-", "-START2-"]
+END = ["-END-", "-END2-"]
+
+class AveragedPerceptronTagger(object):
+    """Greedy averaged perceptron POS tagger."""
+    def __init__(self, min_tagdict_freq=20, min_tagdict_ambiguity=0.97):
+        """Initialize an untrained tagger.
+        Args:
+            min_tagdict_freq: How often a word must appear in the training data to be added
+                to the lookup table of unambiguous words. (Default is 20.)
+            min_tagdict_ambiguity: Minimum fraction of the word's appearances that must have the
+                same tag for the word to be added to the lookup table. (Default is 0.97.)
+        """
+        self.min_tagdict_freq = min_tagdict_freq
+        self.min_tagdict_ambiguity = min_tagdict_ambiguity
+        # feature -> tag -> weight
+        self.weights = dict()
+        self.classes = set()
+        # word -> tag, for frequent and unambiguous words
+        self.tagdict = dict()
+
+        # helpers for the averaging during training
+        self._totals = defaultdict(float)
+        self._timestamps = defaultdict(int)
+        self._instances = 0
+
+    def tag(self, words):
+        """POS-tags a list of words.
+        Args:
+            words: List of strings.
+        Returns:
+            List of strings (POS tags), one per word.
+        """
+        context = START + [self.normalize(word) for word in words] + END
+        prev, prev2 = START
+        tags = []
+        for i, word in enumerate(words):
+            tag = self.tagdict.get(word)
+            if tag is None:
+                features = self.get_features(i, word, context, prev, prev2)
+                tag = self.predict(features)
+            tags.append(tag)
+            prev2 = prev
+            prev = tag
+        return tags
+
+    def predict(self, features):
+        """Predicts the tag of a single token.
+        Args:
+            features: Dictionary of feature name to value, as returned by get_features().
+        Returns:
+            The tag with the highest score (string).
+        """
+        scores = defaultdict(float)
+        for feature, value in features.items():
+            if value == 0 or feature not in self.weights:
+                continue
+            for tag, weight in self.weights[feature].items():
+                scores[tag] += value * weight
+        # sort by score and then by tag, so that ties are resolved deterministically
+        return max(self.classes, key=lambda tag: (scores[tag], tag))
+
+    def train(self, sentences, nb_iterations=5, seed=42, verbose=True):
+        """Trains the tagger.
+        Args:
+            sentences: List of sentences, each one a list of (word, tag) pairs.
+            nb_iterations: Number of passes over the training sentences. (Default is 5.)
+            seed: Seed for the shuffling of the sentences between iterations. (Default is 42.)
+            verbose: Whether to print the training accuracy after each iteration.
+                (Default is True.)
+        """
+        self.create_tagdict(sentences)
+        sentences = list(sentences)
+        rng = random.Random(seed)
+
+        for iteration in range(nb_iterations):
+            correct = 0
+            total = 0
+            for sentence in sentences:
+                words = [word for word, _ in sentence]
+                context = START + [self.normalize(word) for word in words] + END
+                prev, prev2 = START
+                for i, (word, tag) in enumerate(sentence):
+                    guess = self.tagdict.get(word)
+                    if guess is None:
+                        features = self.get_features(i, word, context, prev, prev2)
+                        guess = self.predict(features)
+                        self.update(tag, guess, features)
+                    prev2 = prev
+                    prev = guess
+                    correct += int(guess == tag)
+                    total += 1
+            rng.shuffle(sentences)
+            if verbose:
+                print("Iteration %d: %d of %d tokens correct (%.2f%%)" \
+                      % (iteration + 1, correct, total, 100 * correct / max(total, 1)))
+
+        self.average_weights()
+
+    def update(self, truth, guess, features):
+        """Updates the weights after the prediction of one token.
+        Args:
+            truth: The correct tag.
+            guess: The predicted tag.
+            features: The features of the token.
+        """
+        self._instances += 1
+        if truth == guess:
+            return
+        for feature in features:
+            weights = self.weights.setdefault(feature, dict())
+            self.update_weight(feature, truth, weights.get(truth, 0.0), 1.0)
+            self.update_weight(feature, guess, weights.get(guess, 0.0), -1.0)
+
+    def update_weight(self, feature, tag, weight, value):
+        """Changes a single weight and updates the sums needed for the averaging.
+        Args:
+            feature: The feature name.
+            tag: The tag.
+            weight: The current weight of (feature, tag).
+            value: The value to add to the weight.
+        """
+        key = (feature, tag)
+        self._totals[key] += (self._instances - self._timestamps[key]) * weight
+        self._timestamps[key] = self._instances
+        self.weights[feature][tag] = weight + value
+
+    def average_weights(self):
+        """Replaces each weight by its average over all training steps."""
+        for feature, weights in self.weights.items():
+            averaged = dict()
+            for tag, weight in weights.items():
+                key = (feature, tag)
+                total = self._totals[key] + (self._instances - self._timestamps[key]) * weight
+                average = round(total / max(self._instances, 1), 3)
+                if average != 0:
+                    averaged[tag] = average
+            self.weights[feature] = averaged
+        self._totals = defaultdict(float)
+        self._timestamps = defaultdict(int)
+
+    def create_tagdict(self, sentences):
+        """Creates the lookup table of frequent and unambiguous words and collects all tags.
+        Args:
+            sentences: List of sentences, each one a list of (word, tag) pairs.
+        """
+        counts = defaultdict(lambda: defaultdict(int))
+        for sentence in sentences:
+            for word, tag in sentence:
+                counts[word][tag] += 1
+                self.classes.add(tag)
+        for word, tag_counts in counts.items():
+            tag, count = max(tag_counts.items(), key=lambda item: (item[1], item[0]))
+            total = sum(tag_counts.values())
+            if total >= self.min_tagdict_freq and count / total >= self.min_tagdict_ambiguity:
+                self.tagdict[word] = tag
+
+    def normalize(self, word):
+        """Normalizes a word for the context features.
+        Args:
+            word: The word.
+        Returns:
+            The normalized word (numbers are replaced by placeholders).
+        """
+        if "-" in word and word[0] != "-":
+            return "!HYPHEN"
+        elif word.isdigit() and len(word) == 4:
+            return "!YEAR"
+        elif len(word) > 0 and word[0].isdigit():
+            return "!DIGITS"
+        else:
+            return word
+
+    def get_features(self, i, word, context, prev, prev2):
+        """Generates the features of a token.
+        Args:
+            i: Index of the token in the sentence.
+            word: The token (string).
+            context: The normalized words of the sentence, with two START and END tokens.
+            prev: The predicted tag of the previous token.
+            prev2: The predicted tag of the token before the previous one.
+        Returns:
+            Dictionary of feature name to value.
+        """
+        # index in context, which starts with two START tokens
+        i += len(START)
+        features = defaultdict(int)
+        def add(name, *args):
+            """Adds a feature."""
+            features[" ".join((name,) + tuple(args))] += 1
+
+        add("bias")
+        add("i suffix", word[-3:])
+        add("i pref1", word[:1])
+        add("i upper", str(word[:1].isupper()))
+        add("i-1 tag", prev)
+        add("i-2 tag", prev2)
+        add("i tag+i-2 tag", prev, prev2)
+        add("i word", context[i])
+        add("i-1 tag+i word", prev, context[i])
+        add("i-1 word", context[i-1])
+        add("i-1 suffix", context[i-1][-3:])
+        add("i-2 word", context[i-2])
+        add("i+1 word", context[i+1])
+        add("i+1 suffix", context[i+1][-3:])
+        add("i+2 word", context[i+2])
+        return features
+
+    def save(self, filepath):
+        """Saves the trained tagger to a file.
+        Args:
+            filepath: Filepath of the file to write.
+        """
+        with open(filepath, "wb") as handle:
+            pickle.dump((self.weights, self.tagdict, sorted(self.classes)), handle, protocol=2)
+
+    def load(self, filepath):
+        """Loads a trained tagger from a file, as written by save().
+        Args:
+            filepath: Filepath of the file to read.
+        """
+        with open(filepath, "rb") as handle:
+            self.weights, self.tagdict, classes = pickle.load(handle)
+        self.classes = set(classes)
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+Orchestrator that runs the stages of the workflow (collecting unigrams, building the gazetteer,
+training the LDA, training and testing the CRF) as a DAG and skips stages that are up to date.
+
+Each stage is a command (e.g. "python -m preprocessing.collect_unigrams") with
+    - input files (e.g. the corpus), identified by the hashes of their contents,
+    - config constants (e.g. LDA_COUNT_TOPICS), identified by their values,
+    - stages that it depends on, identified by the hashes of the contents of their outputs,
+    - output files (glob patterns).
+These are hashed to the key of the stage. A stage is up to date if it last finished
+successfully with the same key and its outputs did not change since then. A stage that
+produces the same outputs as before (e.g. the LDA dictionary after an unrelated config change)
+therefore doesn't cause its dependents to run again.
+
+The hashes of files are cached by filepath, size and modification time, so large files (e.g.
+the corpus) are only read again after they changed. Stages whose dependencies are finished run
+concurrently (up to jobs at the same time), each one as a separate process. The output of each
+stage is written to a log file. Optionally the outputs of every successful run are stored under
+their key (store_artifacts), so that going back to a previous config restores them instead of
+running the stage again.
+
+The state (keys, hashes of outputs and inputs, timings) is saved in a JSON file in the
+directory of the pipeline.
+
+Example usage:
+    unigrams = Stage("unigrams", [sys.executable, "-m", "preprocessing.collect_unigrams"],
+                     inputs=[cfg.ARTICLES_FILEPATH], outputs=[cfg.UNIGRAMS_FILEPATH])
+    pipeline = Pipeline([unigrams, ...], jobs=2)
+    pipeline.run()
+    print(pipeline.report())
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+try:
+    from queue import Queue
+except ImportError:
+    # python 2
+    from Queue import Queue
+
+# All capitalized constants come from this file
+import config as cfg
+
+# statuses of stages after run()
+STATUS_UP_TO_DATE = "up to date"
+STATUS_RESTORED = "restored"
+STATUS_FINISHED = "finished"
+STATUS_FAILED = "failed"
+STATUS_BLOCKED = "blocked"
+STATUS_STALE = "stale"
+
+class Stage(object):
+    """One stage of the pipeline."""
+    def __init__(self, name, command, inputs=None, config_names=None, outputs=None,
+                 depends=None):
+        """Initialize the stage.
+        Args:
+            name: Name of the stage.
+            command: The command to execute (list of strings, executed in the directory of
+                config.py).
+            inputs: List of filepaths, directories or glob patterns whose contents the outputs
+                depend on (e.g. the corpus). (Default is None, no input files.)
+            config_names: List of names of config constants that the outputs depend on. A name
+                that ends with "*" matches all constants with that prefix, e.g. "LDA_*". "*"
+                matches all constants except for the PIPELINE_* constants.
+                (Default is None, no constants.)
+            outputs: List of filepaths or glob patterns of the output files.
+                (Default is None, no output files, e.g. a test whose result is its log.)
+            depends: List of names of stages that must run before this one.
+                (Default is None, no dependencies.)
+        """
+        self.name = name
+        self.command = command
+        self.inputs = inputs if inputs is not None else []
+        self.config_names = config_names if config_names is not None else []
+        self.outputs = outputs if outputs is not None else []
+        self.depends = depends if depends is not None else []
+
+class Pipeline(object):
+    """Runs stages in the order of their dependencies and skips the ones that are up to date."""
+    def __init__(self, stages, dirpath=None, jobs=1, store_artifacts=None, verbose=True,
+                 profile_dirpath=None):
+        """Initialize the pipeline and load its state.
+        Args:
+            stages: List of Stage objects.
+            dirpath: Directory of the state, the logs and the stored artifacts.
+                (Default is None, which means PIPELINE_DIRPATH.)
+            jobs: Maximum number of stages to run at the same time. (Default is 1.)
+            store_artifacts: Whether to store the outputs of every successful run under its key.
+                (Default is None, which means PIPELINE_STORE_ARTIFACTS.)
+            verbose: Whether to print a message when a stage starts or ends. (Default is True.)
+            profile_dirpath: Optional directory in which the stages that run write their profiles
+                (each command is called with --profile=<profile_dirpath>/<stage>, see
+                profiling.py). This doesn't change the keys of the stages. (Default is None.)
+        """
+        self.stages = dict([(stage.name, stage) for stage in stages])
+        self.order = [stage.name for stage in stages]
+        for stage in stages:
+            for name in stage.depends:
+                assert name in self.stages, "Unknown stage '%s' (dependency of '%s')" \
+                                            % (name, stage.name)
+        self.dirpath = dirpath if dirpath is not None else cfg.PIPELINE_DIRPATH
+        self.jobs = max(jobs, 1)
+        self.store_artifacts = store_artifacts if store_artifacts is not None \
+                               else cfg.PIPELINE_STORE_ARTIFACTS
+        self.verbose = verbose
+        self.profile_dirpath = profile_dirpath
+        self.state_filepath = os.path.join(self.dirpath, "state.json")
+        self.state = {"stages": dict(), "files": dict()}
+        if os.path.isfile(self.state_filepath):
+            with open(self.state_filepath, "r") as handle:
+                self.state = json.load(handle)
+        # results of the last call of run(): name -> dictionary with status, reason and timings
+        self.results = dict()
+
+    def run(self, targets=None, force=None, dry_run=False):
+        """Runs all stages that are not up to date.
+        Args:
+            targets: Optional list of names of stages to run (together with their dependencies).
+                (Default is None, all stages.)
+            force: Optional list of names of stages to run even if they are up to date.
+            dry_run: Only determine which stages would run, without running any.
+                (Default is False.)
+        Returns:
+            True if no stage failed.
+        """
+        force = set(force if force is not None else [])
+        pending = self.get_required_stages(targets)
+        running = dict()
+        finished = Queue()
+        self.results = dict()
+
+        while len(pending) > 0 or len(running) > 0:
+            progress = False
+            for name in list(pending):
+                stage = self.stages[name]
+                statuses = [self.results[dep]["status"] if dep in self.results else None \
+                            for dep in stage.depends]
+                if None in statuses:
+                    continue
+                if STATUS_FAILED in statuses or STATUS_BLOCKED in statuses:
+                    self.results[name] = {"status": STATUS_BLOCKED,
+                                          "reason": "a dependency failed"}
+                elif STATUS_STALE in statuses:
+                    self.results[name] = {"status": STATUS_STALE,
+                                          "reason": "a dependency is stale"}
+                elif len(running) < self.jobs:
+                    start = time.time()
+                    key = self.get_key(stage)
+                    seconds_hashing = time.time() - start
+                    reason = "forced" if name in force else self.get_stale_reason(stage, key)
+                    self.results[name] = {"key": key, "reason": reason,
+                                          "seconds_hashing": seconds_hashing}
+                    if reason is None:
+                        self.results[name]["status"] = STATUS_UP_TO_DATE
+                    elif dry_run:
+                        self.results[name]["status"] = STATUS_STALE
+                    elif name not in force and self.restore_artifacts(stage, key):
+                        self.results[name]["status"] = STATUS_RESTORED
+                        self.record(stage, key, None)
+                    else:
+                        del self.results[name]
+                        running[name] = (key, seconds_hashing, reason)
+                        self.start_stage(stage, finished)
+                else:
+                    continue
+                pending.remove(name)
+                progress = True
+            if progress:
+                continue
+
+            # wait for the next running stage to finish
+            name, returncode, seconds = finished.get()
+            key, seconds_hashing, reason = running.pop(name)
+            self.results[name] = {"key": key, "reason": reason, "seconds_hashing": seconds_hashing,
+                                  "seconds": seconds}
+            if returncode == 0:
+                self.results[name]["status"] = STATUS_FINISHED
+                self.record(self.stages[name], key, seconds)
+                if self.store_artifacts:
+                    self.save_artifacts(self.stages[name], key)
+            else:
+                self.results[name]["status"] = STATUS_FAILED
+                # run it again next time
+                self.state["stages"].setdefault(name, dict()).pop("key", None)
+                self.state["stages"][name]["failed"] = True
+            self.save_state()
+            if self.verbose:
+                print("Stage '%s' %s after %.1f seconds (log: %s)." \
+                      % (name, self.results[name]["status"], seconds, self.get_log_filepath(name)))
+
+        self.save_state()
+        return STATUS_FAILED not in [result["status"] for result in self.results.values()]
+
+    def get_required_stages(self, targets=None):
+        """Returns the stages that are required to run some target stages.
+        Args:
+            targets: List of names of stages or None for all stages.
+        Returns:
+            List of names of stages (targets and all of their direct and indirect dependencies),
+            in the order in which the stages were added to the pipeline.
+        """
+        if targets is None:
+            return list(self.order)
+        required = set()
+        todo = list(targets)
+        while len(todo) > 0:
+            name = todo.pop()
+            assert name in self.stages, "Unknown stage '%s'" % (name)
+            if name not in required:
+                required.add(name)
+                todo.extend(self.stages[name].depends)
+        return [name for name in self.order if name in required]
+
+    def get_key(self, stage):
+        """Computes the key of a stage from its command, config constants, input files and the
+        outputs of its dependencies.
+        Args:
+            stage: The Stage object.
+        Returns:
+            Key (hex string).
+        """
+        return hash_string(json.dumps(self.get_key_parts(stage), sort_keys=True))
+
+    def get_stale_reason(self, stage, key):
+        """Returns why a stage has to run.
+        Args:
+            stage: The Stage object.
+            key: The current key of the stage (see get_key()).
+        Returns:
+            Reason (string) or None if the stage is up to date.
+        """
+        last = self.state["stages"].get(stage.name)
+        if last is None or "key" not in last:
+            return "last run failed" if last is not None and last.get("failed") \
+                   else "never finished"
+        if last["key"] != key:
+            parts = self.get_key_parts(stage)
+            changed = [part for part in sorted(parts.keys()) \
+                       if last.get("parts", dict()).get(part) != parts[part]]
+            return "changed: %s" % (", ".join(changed))
+        if last["outputs_hash"] != self.hash_paths(stage.outputs):
+            return "outputs were changed or removed"
+        return None
+
+    def get_key_parts(self, stage):
+        """Returns the hashes of the parts of a stage's key. They are saved in the state, to
+        explain later on why a stage is stale.
+        Args:
+            stage: The Stage object.
+        Returns:
+            Dictionary of part (command, config, inputs, depends) to hash.
+        """
+        return {"command": hash_string(json.dumps(stage.command)),
+                "config": hash_string(json.dumps(self.get_config_values(stage.config_names),
+                                                 sort_keys=True)),
+                "inputs": hash_string(json.dumps([self.hash_paths([path]) \
+                                                  for path in stage.inputs])),
+                "depends": hash_string(json.dumps([self.state["stages"][name].get("outputs_hash") \
+                                                   for name in stage.depends]))}
+
+    def get_config_values(self, config_names):
+        """Returns the values of config constants.
+        Args:
+            config_names: List of names, see Stage.
+        Returns:
+            Dictionary of name to value (as string).
+        """
+        all_names = [name for name in dir(cfg) if name.isupper()]
+        values = dict()
+        for pattern in config_names:
+            if pattern == "*":
+                names = [name for name in all_names if not name.startswith("PIPELINE_")]
+            elif pattern.endswith("*"):
+                names = [name for name in all_names if name.startswith(pattern[:-1])]
+            else:
+                names = [pattern]
+            for name in names:
+                values[name] = repr(getattr(cfg, name))
+        return values
+
+    def hash_paths(self, patterns):
+        """Hashes the contents of all files that match some filepaths, directories or glob
+        patterns.
+        Args:
+            patterns: List of filepaths, directories or glob patterns.
+        Returns:
+            Hash (hex string).
+        """
+        entries = []
+        for filepath in self.find_files(patterns):
+            entries.append([filepath, self.hash_file(filepath)])
+        return hash_string(json.dumps(entries))
+
+    def find_files(self, patterns):
+        """Returns all files that match some filepaths, directories or glob patterns.
+        Args:
+            patterns: List of filepaths, directories or glob patterns.
+        Returns:
+            Sorted list of filepaths.
+        """
+        filepaths = set()
+        for pattern in patterns:
+            for path in glob.glob(pattern):
+                if os.path.isdir(path):
+                    for dirpath, _, filenames in os.walk(path):
+                        filepaths.update([os.path.join(dirpath, name) for name in filenames])
+                else:
+                    filepaths.add(path)
+        return sorted(filepaths)
+
+    def hash_file(self, filepath):
+        """Hashes the content of a file. The hash is cached by filepath, size and modification
+        time.
+        Args:
+            filepath: Filepath of the file.
+        Returns:
+            Hash (hex string).
+        """
+        stat = os.stat(filepath)
+        cached = self.state["files"].get(filepath)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+            return cached[2]
+        sha1 = hashlib.sha1()
+        with open(filepath, "rb") as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b""):
+                sha1.update(block)
+        self.state["files"][filepath] = [stat.st_size, stat.st_mtime, sha1.hexdigest()]
+        return sha1.hexdigest()
+
+    def start_stage(self, stage, finished):
+        """Starts a stage in a separate thread, which runs its command and puts the tuple
+        (name, returncode, seconds) into a queue when it is finished.
+        Args:
+            stage: The Stage object.
+            finished: The Queue.
+        """
+        log_filepath = self.get_log_filepath(stage.name)
+        if not os.path.isdir(os.path.dirname(log_filepath)):
+            os.makedirs(os.path.dirname(log_filepath))
+        command = list(stage.command)
+        if self.profile_dirpath is not None:
+            command.append("--profile=%s" % (os.path.join(os.path.abspath(self.profile_dirpath),
+                                                          stage.name)))
+        if self.verbose:
+            print("Running stage '%s': %s" % (stage.name, " ".join(command)))
+
+        def run_command():
+            """Runs the command of the stage and reports its return code."""
+            start = time.time()
+            with open(log_filepath, "wb") as handle:
+                returncode = subprocess.call(command, stdout=handle,
+                                             stderr=subprocess.STDOUT,
+                                             cwd=os.path.dirname(os.path.abspath(cfg.__file__)))
+            finished.put((stage.name, returncode, time.time() - start))
+
+        thread = threading.Thread(target=run_command)
+        thread.daemon = True
+        thread.start()
+
+    def record(self, stage, key, seconds):
+        """Records a successful run (or restore) of a stage in the state.
+        Args:
+            stage: The Stage object.
+            key: The key of the stage.
+            seconds: Duration of the run or None if the outputs were restored.
+        """
+        last = self.state["stages"].get(stage.name, dict())
+        history = last.get("history", [])
+        history.append({"key": key, "seconds": seconds, "finished_at": time.time()})
+        self.state["stages"][stage.name] = {"key": key,
+                                            "parts": self.get_key_parts(stage),
+                                            "outputs_hash": self.hash_paths(stage.outputs),
+                                            "seconds": seconds if seconds is not None \
+                                                       else last.get("seconds"),
+                                            "history": history}
+
+    def get_log_filepath(self, name):
+        """Returns the filepath of the log file of a stage.
+        Args:
+            name: Name of the stage.
+        Returns:
+            Filepath (string).
+        """
+        return os.path.join(self.dirpath, "logs", "%s.log" % (name))
+
+    def get_artifacts_dirpath(self, name, key):
+        """Returns the directory in which the outputs of a run of a stage are stored.
+        Args:
+            name: Name of the stage.
+            key: Key of the run.
+        Returns:
+            Directory path (string).
+        """
+        return os.path.join(self.dirpath, "artifacts", name, key)
+
+    def save_artifacts(self, stage, key):
+        """Stores copies of the outputs and of the log of a stage under its key.
+        Args:
+            stage: The Stage object.
+            key: Key of the run.
+        """
+        dirpath = self.get_artifacts_dirpath(stage.name, key)
+        if os.path.isdir(dirpath):
+            shutil.rmtree(dirpath)
+        os.makedirs(dirpath)
+        manifest = []
+        for idx, filepath in enumerate(self.find_files(stage.outputs)):
+            stored = "%d_%s" % (idx, os.path.basename(filepath))
+            shutil.copy2(filepath, os.path.join(dirpath, stored))
+            manifest.append([filepath, stored])
+        shutil.copy2(self.get_log_filepath(stage.name), os.path.join(dirpath, "log"))
+        with open(os.path.join(dirpath, "manifest.json"), "w") as handle:
+            json.dump(manifest, handle)
+
+    def restore_artifacts(self, stage, key):
+        """Restores the outputs of a previous run of a stage with the same key (if stored).
+        Args:
+            stage: The Stage object.
+            key: The current key of the stage.
+        Returns:
+            True if the outputs were restored.
+        """
+        dirpath = self.get_artifacts_dirpath(stage.name, key)
+        manifest_filepath = os.path.join(dirpath, "manifest.json")
+        if not self.store_artifacts or not os.path.isfile(manifest_filepath):
+            return False
+        with open(manifest_filepath, "r") as handle:
+            manifest = json.load(handle)
+        for filepath in self.find_files(stage.outputs):
+            os.remove(filepath)
+        for filepath, stored in manifest:
+            if not os.path.isdir(os.path.dirname(os.path.abspath(filepath))):
+                os.makedirs(os.path.dirname(os.path.abspath(filepath)))
+            shutil.copy2(os.path.join(dirpath, stored), filepath)
+        log_filepath = self.get_log_filepath(stage.name)
+        if not os.path.isdir(os.path.dirname(log_filepath)):
+            os.makedirs(os.path.dirname(log_filepath))
+        shutil.copy2(os.path.join(dirpath, "log"), log_filepath)
+        if self.verbose:
+            print("Restored the outputs of stage '%s' from %s." % (stage.name, dirpath))
+        return True
+
+    def save_state(self):
+        """Saves the state to the JSON file."""
+        if not os.path.isdir(self.dirpath):
+            os.makedirs(self.dirpath)
+        with open(self.state_filepath, "w") as handle:
+            json.dump(self.state, handle, indent=2, sort_keys=True)
+
+    def report(self):
+        """Returns a table with the status and the timings of every stage of the last run().
+        Returns:
+            The table as (tab-separated) string.
+        """
+        lines = ["\t".join(["stage", "status", "reason", "seconds_hashing", "seconds",
+                            "seconds_last_run"])]
+        for name in self.order:
+            if name not in self.results:
+                continue
+            result = self.results[name]
+            last_seconds = self.state["stages"].get(name, dict()).get("seconds")
+            lines.append("\t".join([name, result["status"], result.get("reason") or "",
+                                    "%.1f" % (result.get("seconds_hashing", 0.0)),
+                                    "%.1f" % (result.get("seconds", 0.0)),
+                                    "%.1f" % (last_seconds) if last_seconds is not None \
+                                    else ""]))
+        return "\n".join(lines)
+
+def hash_string(text):
+    """Hashes a string.
+    Args:
+        text: The string.
+    Returns:
+        Hash (hex string).
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
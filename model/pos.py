@@ -1,18 +1,31 @@
 # -*- coding: utf-8 -*-
-"""Class that wraps the Stanford POS tagger."""
+"""Class that wraps the Stanford POS tagger (or the in-process averaged perceptron tagger)."""
 from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
 import nltk
-import shelve
-import random
+
+from model.cache import ShelveCache, get_files_fingerprint
+from model.perceptron_pos import AveragedPerceptronTagger
 
 class PosTagger(object):
     """Class that wraps the Stanford POS tagger.
 
     This class uses a shelve cache to store generated results. This speeds up the generation
     of training examples, if the identical corpus, window sizes etc. are used.
+
+    Alternatively, the class can use an averaged perceptron tagger (engine "perceptron"), which was
+    trained on the results of the Stanford POS tagger (see preprocessing/train_pos_perceptron.py).
+    It produces the same tagset, but runs in-process and is fast enough to not need the cache.
+
+    The tagger can be shared between threads. Accesses to the cache are synchronized (see
+    ShelveCache). Calls of the Stanford tagger are serialized by a lock, as nltk's
+    StanfordPOSTagger is not thread-safe: It stores the filepath of its temporary input file in
+    the instance and changes the global java options (config_java) during every call. Other
+    threads can run the LDA or the CRF while one thread waits for the Stanford tagger. The
+    perceptron tagger only reads its weights and is not locked.
     """
     def __init__(self, stanford_postagger_jar_filepath, stanford_model_filepath,
-                 cache_filepath=None):
+                 cache_filepath=None, engine="stanford", perceptron_model_filepath=None):
         """Initialize the Stanford POS tag wrapper.
         Args:
             stanford_postagger_jar_filepath: Filepath to the jar of the stanford tagger,
@@ -20,17 +33,36 @@ class PosTagger(object):
             stanford_model_filepath: Filepath to the used model for the pos tagger,
                 e.g. "/var/foo/bar/stanford-pos-tagger/models/german-fast.tagger".
             cache_filepath: Optional filepath to a shelve cache for the LDA results.
+                Only used by the engine "stanford". The cache is emptied when the jar or the
+                model of the stanford tagger changed.
+            engine: "stanford" or "perceptron". (Default is "stanford".)
+            perceptron_model_filepath: Filepath to the trained averaged perceptron tagger.
+                Only used by the engine "perceptron".
         """
+        assert engine in ["stanford", "perceptron"]
+        self.engine = engine
         self.max_string_length = 2000
         self.min_string_length = 1
+        # serializes the calls of the stanford tagger (see above)
+        self.tagger_lock = threading.Lock()
 
-        self.tagger = nltk.tag.stanford.StanfordPOSTagger(stanford_model_filepath,
-                                                          stanford_postagger_jar_filepath,
-                                                          encoding="utf-8")
+        if engine == "perceptron":
+            self.tagger = AveragedPerceptronTagger()
+            self.tagger.load(perceptron_model_filepath)
+            # the cache contains results of the stanford tagger, which must not be mixed
+            # with the results of the perceptron
+            cache_filepath = None
+        else:
+            self.tagger = nltk.tag.stanford.StanfordPOSTagger(stanford_model_filepath,
+                                                              stanford_postagger_jar_filepath,
+                                                              encoding="utf-8")
 
-        self.cache_synch_prob = 2 # in percent, 1 to 100
         self.cache_filepath = cache_filepath
-        self.cache = shelve.open(cache_filepath) if cache_filepath is not None else None
+        self.cache = None
+        if cache_filepath is not None:
+            fingerprint = get_files_fingerprint([stanford_postagger_jar_filepath,
+                                                 stanford_model_filepath])
+            self.cache = ShelveCache(cache_filepath, fingerprint=fingerprint)
 
     def tag(self, tokens):
         """Annotate a list of strings with their POS tags.
@@ -44,16 +76,42 @@ class PosTagger(object):
         else:
             text = " ".join(tokens)
             _hash = str(hash(text))
-            if self.cache.has_key(_hash):
-                return self.cache[_hash]
+            tagged = self.cache.get(_hash)
+            if tagged is not None:
+                return tagged
+
+            tagged = self.tag_uncached(tokens)
+            self.cache.add([(_hash, tagged)])
+            return tagged
+
+    def tag_many(self, tokens_lists):
+        """Annotate several lists of strings with their POS tags.
+        All lists that are not in the cache are tagged with a single call of the stanford tagger,
+        i.e. the JVM is only started once for all of them.
+
+        Args:
+            tokens_lists: List of lists of strings.
+        Returns:
+            List of lists of strings (POS tags), one per list of strings.
+        """
+        results = [None] * len(tokens_lists)
+        hashes = [str(hash(" ".join(tokens))) for tokens in tokens_lists]
+        cached = self.cache.get_many(hashes) if self.cache is not None else dict()
+        uncached = []
+        for i, _hash in enumerate(hashes):
+            if _hash in cached:
+                results[i] = cached[_hash]
             else:
-                tagged = self.tag_uncached(tokens)
+                uncached.append(i)
 
-                self.cache[_hash] = tagged
-                if random.randint(1, 100) <= self.cache_synch_prob:
-                    self.synchronize_cache()
+        if len(uncached) > 0:
+            tagged_lists = self.tag_many_uncached([tokens_lists[i] for i in uncached])
+            for i, tagged in zip(uncached, tagged_lists):
+                results[i] = tagged
+            if self.cache is not None:
+                self.cache.add([(hashes[i], results[i]) for i in uncached])
 
-                return tagged
+        return results
 
     def tag_uncached(self, tokens):
         """Annotate a list of strings with their POS tags without querying the cache.
@@ -62,6 +120,10 @@ class PosTagger(object):
         Returns:
             List of strings (POS tags)
         """
+        if self.engine == "perceptron":
+            # same output format as nltk's stanford tagger: pairs of (word, tag)
+            return list(zip(tokens, self.tagger.tag(tokens)))
+
         # length of each word + count of required whitespaces between each word
         # max() to avoid -1 if the list of tokens in empty
         total_length = sum([len(token) for token in tokens]) + (max(len(tokens) - 1, 0))
@@ -72,8 +134,37 @@ class PosTagger(object):
             raise Exception("String to POS-tag is too short (%d vs min "\
                             "%d)." % (total_length, self.min_string_length))
 
-        return self.tagger.tag(tokens)
+        with self.tagger_lock:
+            return self.tagger.tag(tokens)
+
+    def tag_many_uncached(self, tokens_lists):
+        """Annotate several lists of strings with their POS tags without querying the cache.
+        Args:
+            tokens_lists: List of lists of strings.
+        Returns:
+            List of lists of strings (POS tags), one per list of strings.
+        """
+        if self.engine == "perceptron":
+            return [self.tag_uncached(tokens) for tokens in tokens_lists]
+
+        for tokens in tokens_lists:
+            total_length = sum([len(token) for token in tokens]) + (max(len(tokens) - 1, 0))
+            if total_length >= self.max_string_length:
+                raise Exception("String to POS-tag is too long (%d vs max " \
+                                "%d)." % (total_length, self.max_string_length))
+            elif total_length < self.min_string_length:
+                raise Exception("String to POS-tag is too short (%d vs min "\
+                                "%d)." % (total_length, self.min_string_length))
+
+        with self.tagger_lock:
+            tagged_lists = self.tagger.tag_sents(tokens_lists)
+            if len(tagged_lists) != len(tokens_lists):
+                # the tagger split or merged some sentences, the results can't be assigned to the
+                # lists of tokens anymore
+                return [self.tagger.tag(tokens) for tokens in tokens_lists]
+            return tagged_lists
 
     def synchronize_cache(self):
         """Synchronizes the shelve cache on the HDD with the version in the RAM."""
-        self.cache.sync()
+        if self.cache is not None:
+            self.cache.synchronize()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling of the entry points (train.py, test.py, the preprocessing scripts, ...) via their
+--profile option.
+
+Two profilers run at the same time:
+    - cProfile (deterministic, main thread only). Its results are saved as
+      "<prefix>.pstats", which can be inspected via "python -m pstats <prefix>.pstats" or
+      tools like snakeviz.
+    - A sampling profiler, which records the stacks of all threads every PROFILE_INTERVAL
+      seconds. Its results are saved as "<prefix>.collapsed" (one line per stack with the
+      number of samples, frames separated by semicolons), the input format of flamegraph.pl
+      and speedscope.
+The code of the pipeline marks its stages via stage(), e.g. the loading of each resource,
+the parsing of the corpus, the featurization with each feature generator, the appending of
+examples to the trainer and the training. Stages appear as frames "[stage] <name>" at the roots
+of the sampled stacks and their (inclusive) wall-clock times are written to
+"<prefix>.stages.tsv". stage() does nothing while no profiler is active.
+
+Example usage:
+    parser = argparse.ArgumentParser()
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    with profile(args.profile, "train"):
+        with stage("load windows"):
+            ...
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# All capitalized constants come from this file
+import config as cfg
+
+# the active Profiler (at most one per process)
+_PROFILER = None
+
+class Profiler(object):
+    """Runs cProfile and a sampling profiler and records the time per stage."""
+    def __init__(self, output_prefix, interval=None):
+        """Initialize the profiler.
+        Args:
+            output_prefix: Prefix of the filepaths of the results, e.g. "profiles/train" for
+                "profiles/train.pstats".
+            interval: Seconds between two samples of the sampling profiler.
+                (Default is None, which means PROFILE_INTERVAL.)
+        """
+        self.output_prefix = output_prefix
+        self.interval = interval if interval is not None else cfg.PROFILE_INTERVAL
+        self.cprofile = cProfile.Profile()
+        # thread id -> list of the names of the stages that the thread is currently in
+        self.stages = dict()
+        # stage path (names joined by " > ") -> [count, seconds]
+        self.stage_times = dict()
+        # collapsed stack -> number of samples
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.start_time = None
+        self.seconds = None
+
+    def start(self):
+        """Starts both profilers."""
+        self.start_time = time.time()
+        self.sampler = threading.Thread(target=self.sample_loop)
+        self.sampler.daemon = True
+        self.sampler.start()
+        self.cprofile.enable()
+
+    def stop(self):
+        """Stops both profilers."""
+        self.cprofile.disable()
+        self.stopped.set()
+        self.sampler.join()
+        self.seconds = time.time() - self.start_time
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager that marks the code inside of it as a stage of the calling thread.
+        Args:
+            name: Name of the stage.
+        """
+        stack = self.stages.setdefault(threading.current_thread().ident, [])
+        stack.append(name)
+        path = " > ".join(stack)
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            stack.pop()
+            with self.lock:
+                entry = self.stage_times.setdefault(path, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def sample_loop(self):
+        """Records the stacks of all other threads until the profiler is stopped."""
+        own_ident = threading.current_thread().ident
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                                                  code.co_firstlineno))
+                    frame = frame.f_back
+                frames.reverse()
+                stages = ["[stage] %s" % (name) for name in self.stages.get(ident, [])]
+                self.samples[";".join(stages + frames)] += 1
+
+    def save(self):
+        """Writes the results to <prefix>.pstats, <prefix>.collapsed and <prefix>.stages.tsv.
+        Returns:
+            List of the written filepaths.
+        """
+        dirpath = os.path.dirname(self.output_prefix)
+        if len(dirpath) > 0 and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        filepaths = ["%s.pstats" % (self.output_prefix), "%s.collapsed" % (self.output_prefix),
+                     "%s.stages.tsv" % (self.output_prefix)]
+        self.cprofile.dump_stats(filepaths[0])
+        with io.open(filepaths[1], "w", encoding="utf-8") as handle:
+            for stack, count in sorted(self.samples.items()):
+                handle.write("%s %d\n" % (stack, count))
+        with io.open(filepaths[2], "w", encoding="utf-8") as handle:
+            handle.write(self.report_stages() + "\n")
+        return filepaths
+
+    def report_stages(self):
+        """Returns the time per stage.
+        Returns:
+            The (tab-separated) table as string, one row per stage path.
+        """
+        total = max(self.seconds if self.seconds is not None else time.time() - self.start_time,
+                    1e-9)
+        lines = ["\t".join(["stage", "count", "seconds", "share_of_total"])]
+        for path, (count, seconds) in sorted(self.stage_times.items()):
+            lines.append("\t".join([path, str(count), "%.2f" % (seconds),
+                                    "%.1f%%" % (100 * seconds / total)]))
+        lines.append("\t".join(["(total)", "1", "%.2f" % (total), "100.0%"]))
+        return "\n".join(lines)
+
+    def report_functions(self, count_functions=25):
+        """Returns the functions with the highest cumulative time, according to cProfile.
+        Args:
+            count_functions: Number of functions to list. (Default is 25.)
+        Returns:
+            The table as string.
+        """
+        stream = io.StringIO() if sys.version_info[0] >= 3 else io.BytesIO()
+        stats = pstats.Stats(self.cprofile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(count_functions)
+        return stream.getvalue()
+
+class _NoStage(object):
+    """Context manager of stage() while no profiler is active."""
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NO_STAGE = _NoStage()
+
+def stage(name):
+    """Marks the code inside of the returned context manager as a stage (if a profiler is
+    active).
+    Args:
+        name: Name of the stage, e.g. "load windows".
+    Returns:
+        Context manager.
+    """
+    if _PROFILER is None:
+        return _NO_STAGE
+    return _PROFILER.stage(name)
+
+def iterate_in_stage(iterable, name):
+    """Attributes the time that an iterable (e.g. a generator that parses the corpus) needs to
+    produce its elements to a stage (if a profiler is active).
+    Args:
+        iterable: The iterable.
+        name: Name of the stage.
+    Returns:
+        Generator of the elements of the iterable (or the iterable itself if no profiler is
+        active).
+    """
+    if _PROFILER is None:
+        return iterable
+
+    def generate():
+        """Yields the elements of the iterable, each one produced inside of the stage."""
+        iterator = iter(iterable)
+        while True:
+            with stage(name):
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    return
+            yield element
+    return generate()
+
+@contextmanager
+def profile(output_prefix, name):
+    """Context manager that profiles the code inside of it, if an output prefix is set.
+    The results are written to files and summarized on stderr at the end.
+    Args:
+        output_prefix: Value of the --profile option: None to not profile, an empty string to
+            write the results to PROFILE_DIRPATH/<name>-<time> or a prefix of the filepaths
+            of the results.
+        name: Name of the entry point, e.g. "train".
+    """
+    global _PROFILER
+    if output_prefix is None:
+        yield
+        return
+    if len(output_prefix) == 0:
+        output_prefix = os.path.join(cfg.PROFILE_DIRPATH,
+                                     "%s-%s" % (name, time.strftime("%Y%m%d-%H%M%S")))
+    assert _PROFILER is None, "Only one profiler can be active at a time."
+    _PROFILER = Profiler(output_prefix)
+    _PROFILER.start()
+    try:
+        with stage(name):
+            yield
+    finally:
+        profiler = _PROFILER
+        profiler.stop()
+        _PROFILER = None
+        filepaths = profiler.save()
+        sys.stderr.write("Time per stage:\n%s\n" % (profiler.report_stages()))
+        sys.stderr.write("Slowest functions (cumulative, main thread):\n%s\n" \
+                         % (profiler.report_functions()))
+        sys.stderr.write("Profile written to: %s\n" % (", ".join(filepaths)))
+
+def add_profile_argument(parser):
+    """Adds the --profile option to the parser of an entry point.
+    Args:
+        parser: The argparse.ArgumentParser.
+    """
+    parser.add_argument("--profile", required=False, nargs="?", const="", default=None,
+                        help="Profile the run with cProfile and a sampling profiler. The " \
+                             "results (.pstats, .collapsed for flamegraphs and the time per " \
+                             "stage) are written to the given filepath prefix or, without a " \
+                             "value, to PROFILE_DIRPATH.")
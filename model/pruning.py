@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Class to remove rare attributes (feature values) from the examples before training."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import re
+from collections import Counter
+
+class AttributePruner(object):
+    """Removes rare attributes from chains of feature values.
+
+    An attribute is a single feature value of a token including its skipchain offset,
+    e.g. "-3:pf=Joh". Usage is two-pass: First count() is called for every training example,
+    then fit() decides which attributes are frequent enough to be kept. After that prune() can be
+    used to remove all other attributes, both during training and tagging.
+
+    Example usage:
+        pruner = AttributePruner(min_freq=2, min_freq_per_feature={"pf": 5})
+        for feature_values_lists, labels in examples:
+            pruner.count(feature_values_lists)
+        pruner.fit()
+        pruned = pruner.prune(feature_values_lists)
+    """
+    def __init__(self, min_freq=1, min_freq_per_feature=None, min_freq_per_offset=None):
+        """Initialize the pruner.
+        Args:
+            min_freq: How often an attribute must appear at least to be kept.
+            min_freq_per_feature: Optional dictionary of feature name to minimum frequency,
+                e.g. {"pf": 5, "lda": 3}. The feature name is the part of the attribute before
+                the "=" without any topic/cluster index, e.g. "pf" for "-3:pf=Joh" or "lda" for
+                "0:lda_15=1".
+            min_freq_per_offset: Optional dictionary of skipchain offset to minimum frequency,
+                e.g. {-5: 3, 5: 3}.
+        """
+        self.min_freq = min_freq
+        self.min_freq_per_feature = min_freq_per_feature if min_freq_per_feature else dict()
+        self.min_freq_per_offset = min_freq_per_offset if min_freq_per_offset else dict()
+        self.regexp_feature_index = re.compile(r"_[0-9]+$")
+        self.counts = Counter()
+        self.vocabulary = None
+
+    def is_active(self):
+        """Returns whether this pruner would remove any attributes at all.
+        Returns:
+            True if any threshold is above 1, False otherwise.
+        """
+        thresholds = [self.min_freq] + list(self.min_freq_per_feature.values()) \
+                     + list(self.min_freq_per_offset.values())
+        return max(thresholds) > 1
+
+    def count(self, feature_values_lists):
+        """Counts the attributes of one example (first pass).
+        Args:
+            feature_values_lists: List of lists of attributes (one list per token), as generated
+                by generate_examples(). Tokens with weighted attributes are dictionaries of
+                attribute to weight.
+        """
+        for feature_values in feature_values_lists:
+            # count the attributes of weighted items (dictionaries), not their weights
+            self.counts.update(list(feature_values))
+
+    def fit(self):
+        """Decides which attributes to keep, based on the counts collected by count().
+        The counts are freed afterwards."""
+        self.vocabulary = set([attribute for attribute, count in self.counts.items() \
+                                         if count >= self.get_threshold(attribute)])
+        self.counts = Counter()
+
+    def get_threshold(self, attribute):
+        """Returns the minimum frequency of an attribute.
+        If several thresholds apply to the attribute (global, per feature, per offset),
+        the highest one is used.
+
+        Args:
+            attribute: The attribute, e.g. "-3:pf=Joh".
+        Returns:
+            Minimum frequency (integer).
+        """
+        offset, feature_value = attribute.split(":", 1)
+        feature_name = self.regexp_feature_index.sub("", feature_value.split("=", 1)[0])
+        return max(self.min_freq,
+                   self.min_freq_per_feature.get(feature_name, 0),
+                   self.min_freq_per_offset.get(int(offset), 0))
+
+    def prune(self, feature_values_lists):
+        """Removes all attributes that were not frequent enough from an example.
+        Args:
+            feature_values_lists: List of lists of attributes (one list per token). Tokens with
+                weighted attributes are dictionaries of attribute to weight.
+        Returns:
+            List of lists of attributes (one list per token, dictionaries stay dictionaries).
+        """
+        assert self.vocabulary is not None, "fit() or load() must be called before prune()"
+        vocabulary = self.vocabulary
+        result = []
+        for feature_values in feature_values_lists:
+            if isinstance(feature_values, dict):
+                result.append(dict([(attribute, value) \
+                                    for attribute, value in feature_values.items() \
+                                    if attribute in vocabulary]))
+            else:
+                result.append([attribute for attribute in feature_values \
+                               if attribute in vocabulary])
+        return result
+
+    def count_attributes(self):
+        """Returns the number of distinct attributes that were counted or kept.
+        Returns:
+            Number of counted attributes before fit() and number of kept attributes after fit().
+        """
+        return len(self.counts) if self.vocabulary is None else len(self.vocabulary)
+
+    def save(self, filepath):
+        """Saves the kept attributes to a file (one attribute per line).
+        Args:
+            filepath: Filepath of the file to write.
+        """
+        with open(filepath, "w") as handle:
+            for attribute in sorted(self.vocabulary):
+                handle.write(attribute.encode("utf-8"))
+                handle.write("\n")
+
+    def load(self, filepath):
+        """Loads the kept attributes from a file, as written by save().
+        Args:
+            filepath: Filepath of the file to read.
+        """
+        self.vocabulary = set()
+        with open(filepath, "r") as handle:
+            for line in handle:
+                attribute = line.decode("utf-8").rstrip("\n")
+                if len(attribute) > 0:
+                    self.vocabulary.add(attribute)
+
+def get_attributes_filepath(identifier):
+    """Returns the filepath under which the kept attributes of a model are saved.
+    Args:
+        identifier: Identifier of the model, as used in train.py and test.py.
+    Returns:
+        Filepath (string).
+    """
+    return "%s.attributes" % (identifier)
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""Readers for the different corpus file formats.
+
+All readers stream their input, i.e. they never load a whole file into RAM. Files may be
+compressed (gzip, bz2, xz; recognized by their file extension) and a reader may get a glob
+pattern instead of a single filepath (e.g. "/var/corpus/shard-*.txt.gz") to read several
+shards one after the other.
+
+Each reader yields the articles/documents of its corpus as strings in the format of the main
+corpus, i.e. one string per article with labeled words in the form word/LABEL.
+Use load_articles() in datasets.py to get Article objects instead.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import bz2
+import glob
+import gzip
+import json
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# All capitalized constants come from this file
+import config as cfg
+
+# number of bytes that the background thread reads (and decompresses) at once
+PREFETCH_BLOCK_SIZE = 16 * 1024 * 1024
+
+# maximum number of blocks that the background thread reads in advance
+PREFETCH_QUEUE_SIZE = 4
+
+def create_reader(filepath, corpus_format=None):
+    """Creates a reader for a corpus file.
+
+    Args:
+        filepath: Filepath or glob pattern of the corpus file(s).
+        corpus_format: One of "plain" (one article per line, see ARTICLES_FILEPATH), "germeval",
+            "conll" or "jsonl". (Default is None, which means that the format is guessed from
+            the file extension: ".tsv" is germeval, ".conll" is conll, ".jsonl" is jsonl
+            and everything else is plain.)
+    Returns:
+        Reader object, i.e. an iterable of article strings.
+    """
+    if corpus_format is None:
+        corpus_format = guess_format(filepath)
+
+    if corpus_format == "plain":
+        return PlainReader(filepath)
+    elif corpus_format == "germeval":
+        return GermevalReader(filepath)
+    elif corpus_format == "conll":
+        return ConllReader(filepath)
+    elif corpus_format == "jsonl":
+        return JsonlReader(filepath)
+    else:
+        raise Exception("Unknown corpus format '%s'." % (corpus_format))
+
+def guess_format(filepath):
+    """Guesses the format of a corpus file from its file extension.
+    Args:
+        filepath: Filepath or glob pattern of the corpus file(s).
+    Returns:
+        One of "plain", "germeval", "conll" or "jsonl".
+    """
+    name = filepath.lower()
+    for extension in [".gz", ".bz2", ".xz"]:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+
+    if name.endswith(".tsv"):
+        return "germeval"
+    elif name.endswith(".conll"):
+        return "conll"
+    elif name.endswith(".jsonl"):
+        return "jsonl"
+    else:
+        return "plain"
+
+def expand_filepaths(filepath):
+    """Expands a glob pattern to the list of matching filepaths (sorted by name).
+    Args:
+        filepath: Filepath or glob pattern, e.g. "/var/corpus/shard-*.txt.gz".
+    Returns:
+        List of filepaths.
+    """
+    if not glob.has_magic(filepath):
+        return [filepath]
+
+    filepaths = sorted(glob.glob(filepath))
+    if len(filepaths) == 0:
+        raise Exception("No files found that match '%s'." % (filepath))
+    return filepaths
+
+def open_file(filepath):
+    """Opens a (possibly compressed) file for binary reading.
+    The compression is recognized by the file extension (.gz, .bz2, .xz).
+
+    Args:
+        filepath: The filepath of the file.
+    Returns:
+        File handle.
+    """
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, "rb")
+    elif filepath.endswith(".bz2"):
+        return bz2.BZ2File(filepath, "rb")
+    elif filepath.endswith(".xz"):
+        if lzma is None:
+            raise Exception("Reading .xz files requires the lzma module " \
+                            "(on python 2: pip install backports.lzma).")
+        return lzma.LZMAFile(filepath, "rb")
+    else:
+        return open(filepath, "rb")
+
+def read_lines(filepath, prefetch=True):
+    """Reads the lines of one or more (possibly compressed) files as unicode strings.
+
+    Args:
+        filepath: Filepath or glob pattern of the file(s).
+        prefetch: Whether to read (and decompress) the files in a background thread.
+            (Default is True.)
+    Returns:
+        Generator of lines (without line breaks).
+    """
+    for single_filepath in expand_filepaths(filepath):
+        if prefetch:
+            lines = PrefetchingLineIterator(single_filepath)
+        else:
+            lines = open_file(single_filepath)
+        try:
+            for line in lines:
+                yield line.decode("utf-8").rstrip("\r\n")
+        finally:
+            lines.close()
+
+class PrefetchingLineIterator(object):
+    """Iterates over the lines of a (possibly compressed) file, while a background thread
+    reads and decompresses large blocks of the file in advance.
+    This lets the file I/O and decompression overlap with the processing of the lines
+    (e.g. the featurization)."""
+    def __init__(self, filepath, block_size=PREFETCH_BLOCK_SIZE, queue_size=PREFETCH_QUEUE_SIZE):
+        """Opens the file and starts the background thread.
+        Args:
+            filepath: The filepath of the file.
+            block_size: Number of bytes to read at once.
+            queue_size: Maximum number of blocks to read in advance.
+        """
+        self.handle = open_file(filepath)
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read_blocks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read_blocks(self):
+        """Reads blocks from the file until its end and puts them into the queue.
+        Runs in the background thread. An empty block signals the end of the file, an exception
+        object signals an error."""
+        try:
+            while not self.stopped.is_set():
+                block = self.handle.read(self.block_size)
+                self._put(block)
+                if len(block) == 0:
+                    break
+        except Exception as exc: # pylint: disable=broad-except
+            self._put(exc)
+
+    def _put(self, item):
+        """Puts an item into the queue, unless the iterator was closed in the meantime.
+        Args:
+            item: The item (block or exception).
+        """
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        """Iterates over the lines of the file.
+        Returns:
+            Generator of lines (byte strings including their line breaks).
+        """
+        remainder = b""
+        while True:
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if len(block) == 0:
+                break
+            lines = (remainder + block).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                yield line + b"\n"
+        if len(remainder) > 0:
+            yield remainder
+
+    def close(self):
+        """Stops the background thread and closes the file."""
+        self.stopped.set()
+        self.thread.join()
+        self.handle.close()
+
+class PlainReader(object):
+    """Reader for corpus files with one article/document per line (the format of the corpus at
+    ARTICLES_FILEPATH)."""
+    def __init__(self, filepath, prefetch=True):
+        """Initialize the reader.
+        Args:
+            filepath: Filepath or glob pattern of the corpus file(s).
+            prefetch: Whether to read the files in a background thread. (Default is True.)
+        """
+        self.filepath = filepath
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        """Iterates over the articles.
+        Returns:
+            Generator of article strings. Empty lines are skipped.
+        """
+        for line in read_lines(self.filepath, prefetch=self.prefetch):
+            line = line.strip()
+            if len(line) > 0:
+                yield line
+
+class ConllReader(object):
+    """Reader for tab-separated files with one token per line and an empty line after each
+    sentence (CoNLL format). Each sentence is returned as one article."""
+    def __init__(self, filepath, word_column=0, label_column=-1, comment_prefix="#",
+                 prefetch=True):
+        """Initialize the reader.
+        Args:
+            filepath: Filepath or glob pattern of the corpus file(s).
+            word_column: Index of the column containing the word. (Default is 0.)
+            label_column: Index of the column containing the label. (Default is -1, the last
+                column.)
+            comment_prefix: Lines starting with this prefix are ignored. (Default is "#".)
+            prefetch: Whether to read the files in a background thread. (Default is True.)
+        """
+        self.filepath = filepath
+        self.word_column = word_column
+        self.label_column = label_column
+        self.comment_prefix = comment_prefix
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        """Iterates over the sentences.
+        Returns:
+            Generator of article strings (one per sentence).
+        """
+        sentence = []
+        for line in read_lines(self.filepath, prefetch=self.prefetch):
+            line = line.strip()
+            if self.comment_prefix is not None and line.startswith(self.comment_prefix):
+                continue
+
+            if len(line) == 0:
+                if len(sentence) > 0:
+                    yield " ".join(sentence)
+                sentence = []
+            else:
+                columns = line.split("\t")
+                if self.is_sentence_start(columns) and len(sentence) > 0:
+                    yield " ".join(sentence)
+                    sentence = []
+                sentence.append(self.to_token(columns[self.word_column],
+                                              columns[self.label_column]))
+        if len(sentence) > 0:
+            yield " ".join(sentence)
+
+    def is_sentence_start(self, columns):
+        """Returns whether a line starts a new sentence (in addition to empty lines).
+        Args:
+            columns: The columns of the line.
+        Returns:
+            True if the line starts a new sentence, False otherwise.
+        """
+        return False
+
+    def to_token(self, word, label):
+        """Converts a word and its label to a token string in the form word/LABEL.
+        Labels which do not look like one of the labels in LABELS are dropped.
+
+        Args:
+            word: The word.
+            label: The label of the word, e.g. "B-PER" or "O".
+        Returns:
+            Token string, e.g. "John/B-PER" or "said".
+        """
+        # We don't check for full equality here, because that allows BIO tags (e.g. B-PER) to also
+        # be accepted. They will automatically be normalized by the Token objects (which will also
+        # throw away unnormalizable annotations).
+        if any([(config_label in label) for config_label in cfg.LABELS]):
+            return word + "/" + label
+        else:
+            return word
+
+class GermevalReader(ConllReader):
+    """Reader for the germeval 2014 NER corpus.
+    See https://sites.google.com/site/germeval2014ner/data ."""
+    def __init__(self, filepath, prefetch=True):
+        """Initialize the reader.
+        Args:
+            filepath: Filepath or glob pattern of the corpus file(s),
+                e.g. "/var/foo/NER-de-test.tsv".
+            prefetch: Whether to read the files in a background thread. (Default is True.)
+        """
+        # columns are: token number, word, tag1, tag2
+        # Notice that we ignore tag2 as tag1 is usually the more important one.
+        super(GermevalReader, self).__init__(filepath, word_column=1, label_column=2,
+                                             comment_prefix="#", prefetch=prefetch)
+
+    def is_sentence_start(self, columns):
+        """Returns whether a line starts a new sentence, i.e. whether its token number is 1.
+        Args:
+            columns: The columns of the line.
+        Returns:
+            True if the line starts a new sentence, False otherwise.
+        """
+        return int(columns[0]) == 1
+
+    def to_token(self, word, label):
+        """Converts a word and its germeval label to a token string in the form word/LABEL.
+        Args:
+            word: The word.
+            label: The germeval label of the word, e.g. "B-PER" or "B-LOCderiv".
+        Returns:
+            Token string, e.g. "John/B-PER" or "said".
+        """
+        # convert all labels containing OTH (OTHER) so MISC
+        if "OTH" in label:
+            label = "MISC"
+
+        if any([(bl_label in label) for bl_label in ["part", "deriv"]]):
+            return word
+        return super(GermevalReader, self).to_token(word, label)
+
+class JsonlReader(object):
+    """Reader for files with one JSON object per line. Each object is one article and must
+    either contain the key "text" (the article in the form of the main corpus, i.e. with labeled
+    words in the form word/LABEL) or the key "tokens" (list of words) with an optional key
+    "labels" (list of labels, one per word)."""
+    def __init__(self, filepath, prefetch=True):
+        """Initialize the reader.
+        Args:
+            filepath: Filepath or glob pattern of the corpus file(s).
+            prefetch: Whether to read the files in a background thread. (Default is True.)
+        """
+        self.filepath = filepath
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        """Iterates over the articles.
+        Returns:
+            Generator of article strings.
+        """
+        for line in read_lines(self.filepath, prefetch=self.prefetch):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            article = json.loads(line)
+            if "text" in article:
+                yield article["text"]
+            else:
+                tokens = article["tokens"]
+                labels = article.get("labels", [cfg.NO_NE_LABEL] * len(tokens))
+                yield " ".join([word if label == cfg.NO_NE_LABEL else word + "/" + label \
+                                for word, label in zip(tokens, labels)])
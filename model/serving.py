@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Tagging host that serves several CRF models with one set of loaded feature resources.
+
+Models that are trained on the same corpus resources (e.g. per-domain models or A/B variants)
+only differ in their weights and possibly in the subset of feature generators that they use
+(e.g. the cheap model of the cascade). The host loads the feature resources (unigrams, brown and
+w2v clusters, gazetteers, LDA, POS tagger) once, featurizes each request once per feature
+generator and then tags it with every requested model, each one getting the feature values of
+its own feature generators.
+
+Requests are routed to models either by name or via named routes (e.g. the route "news" could
+tag with the models "news_v1" and "news_v2" for an A/B comparison). The host counts requests,
+tokens and the time per model (see metrics and report()).
+
+Example usage:
+    host = TaggingHost()
+    host.add_model("news", "my_news_model")
+    host.add_model("news_cheap", "my_news_model_cheap", cfg.CASCADE_CHEAP_FEATURES)
+    host.add_route("default", ["news", "news_cheap"])
+    words, labels = host.tag("Angela Merkel besuchte gestern Paris .", route="default")
+    # labels == {"news": ["PER", "PER", "O", "O", "LOC", "O"], "news_cheap": [...]}
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import time
+from collections import Counter, OrderedDict
+
+from model.cascade import ModelTier
+from model.datasets import Article, Window, convert_windows, split_to_chunks
+from model.features import create_features
+
+# All capitalized constants come from this file
+import config as cfg
+
+class TaggingHost(object):
+    """Serves several models that share one set of feature generators."""
+    def __init__(self, feature_generators=None, window_size=None, verbose=True):
+        """Initialize the host and load the feature resources.
+        Args:
+            feature_generators: The feature generators to share between all models.
+                (Default is None, which means that they are created via create_features().)
+            window_size: Number of tokens per window into which requests are split.
+                (Default is None, which means WINDOW_SIZE.)
+            verbose: Whether to print messages while loading the resources. (Default is True.)
+        """
+        self.feature_generators = feature_generators if feature_generators is not None \
+                                  else create_features(verbose=verbose)
+        self.window_size = window_size if window_size is not None else cfg.WINDOW_SIZE
+        self.models = OrderedDict()
+        self.routes = dict()
+        # e.g. metrics["news"]["requests"] or metrics[None]["seconds_featurizing"] (host)
+        self.metrics = {None: Counter()}
+
+    def add_model(self, name, identifier, feature_names=None):
+        """Loads a trained model.
+        Args:
+            name: Name under which requests can be routed to the model.
+            identifier: Identifier of the model, as used in train.py.
+            feature_names: Class names of the feature generators that the model was trained
+                with, e.g. CASCADE_CHEAP_FEATURES for models trained with "train.py --cheap".
+                (Default is None, all feature generators of the host.)
+        """
+        assert name not in self.models
+        generators = [feature for feature in self.feature_generators \
+                      if feature_names is None or feature.__class__.__name__ in feature_names]
+        self.models[name] = ModelTier(identifier, generators)
+        self.metrics[name] = Counter()
+
+    def add_route(self, route, model_names):
+        """Adds a named route, i.e. a list of models that tag every request of that route.
+        Args:
+            route: Name of the route.
+            model_names: Names of the models (see add_model()).
+        """
+        self.check_model_names(model_names)
+        self.routes[route] = list(model_names)
+
+    def check_model_names(self, model_names):
+        """Raises an exception if one of the names does not belong to a model of the host.
+        Args:
+            model_names: List of names of models (see add_model()).
+        """
+        for name in model_names:
+            if name not in self.models:
+                raise Exception("Unknown model '%s', expected one of: %s" \
+                                % (name, ", ".join(sorted(self.models.keys()))))
+
+    def get_model_names(self, route=None, models=None):
+        """Returns the names of the models that have to tag a request.
+        Args:
+            route: Optional name of a route (see add_route()).
+            models: Optional list of names of models.
+        Returns:
+            List of model names. All models if neither route nor models are set.
+        """
+        if models is not None:
+            self.check_model_names(models)
+            return list(models)
+        if route is not None:
+            if route not in self.routes:
+                raise Exception("Unknown route '%s', expected one of: %s" \
+                                % (route, ", ".join(sorted(self.routes.keys()))))
+            return self.routes[route]
+        return list(self.models.keys())
+
+    def tag(self, text, route=None, models=None):
+        """Tags a text with several models.
+        Each feature generator that is used by at least one of the models is applied only once.
+
+        Args:
+            text: The text (string).
+            route: Optional name of a route (see add_route()).
+            models: Optional list of names of models (instead of route).
+        Returns:
+            Tuple (words, labels), where words is the list of words of the text and labels a
+            dictionary of model name -> list of labels (one per word).
+        """
+        model_names = self.get_model_names(route, models)
+        tokens = Article(text).tokens
+        windows = [Window(window_tokens) for window_tokens \
+                   in split_to_chunks(tokens, self.window_size)]
+
+        # featurize every window once per needed feature generator
+        start = time.time()
+        computed = dict()
+        for name in model_names:
+            for feature in self.models[name].feature_generators:
+                if id(feature) not in computed:
+                    computed[id(feature)] = convert_windows(feature, windows)
+        self.metrics[None]["requests"] += 1
+        self.metrics[None]["tokens"] += len(tokens)
+        self.metrics[None]["seconds_featurizing"] += time.time() - start
+
+        labels = dict()
+        for name in model_names:
+            start = time.time()
+            model = self.models[name]
+            labels[name] = []
+            for window_idx, window in enumerate(windows):
+                features_values = [computed[id(feature)][window_idx] \
+                                   for feature in model.feature_generators]
+                labels[name].extend(model.tagger.tag(model.to_example(window, features_values)))
+            self.metrics[name]["requests"] += 1
+            self.metrics[name]["tokens"] += len(tokens)
+            self.metrics[name]["seconds_tagging"] += time.time() - start
+
+        return ([token.word for token in tokens], labels)
+
+    def report(self):
+        """Returns the number of requests and tokens and the time spent per model.
+        Returns:
+            The report as (tab-separated) table.
+        """
+        lines = ["\t".join(["model", "requests", "tokens", "ms_per_request", "tokens_per_second"])]
+        host = self.metrics[None]
+        rows = [("(featurization)", host["requests"], host["tokens"],
+                 host["seconds_featurizing"])]
+        rows.extend([(name, self.metrics[name]["requests"], self.metrics[name]["tokens"],
+                      self.metrics[name]["seconds_tagging"]) for name in self.models])
+        for name, requests, tokens, seconds in rows:
+            lines.append("\t".join([name, str(requests), str(tokens),
+                                    "%.2f" % (1000 * seconds / max(requests, 1)),
+                                    "%.1f" % (tokens / max(seconds, 1e-9))]))
+        return "\n".join(lines)
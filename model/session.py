@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental tagging of documents that are edited a few words at a time.
+
+A DocumentSession splits a document into windows and keeps the feature values and the predicted
+labels of each window. An edit (replacing, inserting or deleting tokens) only invalidates the
+windows that overlap with it. The next call of update() (or of any method that returns labels)
+featurizes and tags only these windows again.
+
+All features of a token only depend on the tokens of its own window: the skip-chain features
+and the LDA's text windows are cut off at the window boundaries and the POS tagger and the CRF
+process one window at a time. Hence the windows that overlap with an edit are exactly the
+windows whose features or labels can change. To keep this set small, the windows of a session
+do not have a fixed size. Each edit is spliced into the windows that it overlaps with. A window
+that grows beyond twice the window size is split and a window that shrinks below half of it is
+merged with its neighbour. The cost of an edit is therefore proportional to the size of the
+edit (plus at most a few windows), not to the size of the document.
+
+Example usage:
+    model = ModelTier("my_experiment", create_features())
+    session = DocumentSession(model, text)
+    labels = session.get_labels()
+    session.replace(12, 14, "Angela Merkel")
+    labels = session.get_labels()
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+from collections import Counter
+
+from model.datasets import Article, Window, convert_windows
+
+# All capitalized constants come from this file
+import config as cfg
+
+class DocumentSession(object):
+    """A document that is tagged incrementally after each edit.
+
+    Tokens are addressed by their index in the whole document. The windows of the document are
+    stored in self.windows, together with the feature values (self.window_features, one entry
+    per feature generator) and the predicted labels (self.window_labels) of each window. Both
+    are None for windows that were changed since the last update().
+    """
+    def __init__(self, model, text="", window_size=None):
+        """Initialize a session and split the text into windows.
+        Args:
+            model: The ModelTier (see cascade.py) with the tagger, the feature generators and the
+                pruning/hashing of attributes of the model to use.
+            text: The initial content of the document. (Default is an empty document.)
+            window_size: The preferred number of tokens per window.
+                (Default is None, which means WINDOW_SIZE.)
+        """
+        self.model = model
+        self.window_size = window_size if window_size is not None else cfg.WINDOW_SIZE
+        self.windows = []
+        self.window_features = []
+        self.window_labels = []
+        # e.g. stats["windows_tagged"] = number of windows that were featurized and tagged
+        self.stats = Counter()
+        if len(text) > 0:
+            self.replace(0, 0, text)
+
+    def count_tokens(self):
+        """Returns the number of tokens in the document.
+        Returns:
+            Number of tokens (integer).
+        """
+        return sum([len(window.tokens) for window in self.windows])
+
+    def get_words(self):
+        """Returns the words of the document.
+        Returns:
+            List of strings.
+        """
+        return [token.word for window in self.windows for token in window.tokens]
+
+    def get_labels(self):
+        """Returns the predicted label of every token of the document. Windows that were changed
+        since the last call are featurized and tagged first.
+        Returns:
+            List of strings, one per token.
+        """
+        self.update()
+        return [label for labels in self.window_labels for label in labels]
+
+    def insert(self, position, text):
+        """Inserts text in front of a token.
+        Args:
+            position: Index of the token in front of which to insert the text (count_tokens() to
+                append it to the end of the document).
+            text: The text to insert.
+        """
+        self.replace(position, position, text)
+
+    def delete(self, start, end):
+        """Deletes tokens.
+        Args:
+            start: Index of the first token to delete.
+            end: Index after the last token to delete.
+        """
+        self.replace(start, end, "")
+
+    def replace(self, start, end, text):
+        """Replaces the tokens start to end (exclusive) with the tokens of a text. The affected
+        windows are only featurized and tagged again by the next update().
+        Args:
+            start: Index of the first token to replace.
+            end: Index after the last token to replace (same as start to only insert text).
+            text: The new text (may be empty to only delete tokens).
+        """
+        assert 0 <= start <= end <= self.count_tokens()
+        new_tokens = Article(text).tokens
+
+        # find the windows that overlap with the edit, text that is inserted between two windows
+        # goes into the window in front of it
+        if len(self.windows) == 0:
+            first, last = 0, -1
+            tokens = new_tokens
+        else:
+            if end > start:
+                first, first_start = self._find_window(start)
+                last, last_start = self._find_window(end - 1)
+            else:
+                first, first_start = self._find_window(max(start - 1, 0))
+                last, last_start = first, first_start
+            tokens = self.windows[first].tokens[:start - first_start] + new_tokens \
+                     + self.windows[last].tokens[end - last_start:]
+
+        # merge too small results with a neighbouring window
+        if len(tokens) < self.window_size // 2:
+            if last + 1 < len(self.windows):
+                last += 1
+                tokens = tokens + self.windows[last].tokens
+            elif first > 0:
+                first -= 1
+                tokens = self.windows[first].tokens + tokens
+
+        new_windows = [Window(window_tokens) for window_tokens in self._split(tokens)]
+        self.windows[first:last+1] = new_windows
+        self.window_features[first:last+1] = [None] * len(new_windows)
+        self.window_labels[first:last+1] = [None] * len(new_windows)
+        self.stats["edits"] += 1
+
+    def update(self):
+        """Featurizes and tags all windows that were changed since the last update.
+        Returns:
+            Number of windows that were featurized and tagged.
+        """
+        indices = [i for i, labels in enumerate(self.window_labels) if labels is None]
+        if len(indices) == 0:
+            return 0
+
+        windows = [self.windows[i] for i in indices]
+        features_values = [convert_windows(feature, windows) \
+                           for feature in self.model.feature_generators]
+        for block_idx, window_idx in enumerate(indices):
+            window = self.windows[window_idx]
+            window_features = [feature_values[block_idx] for feature_values in features_values]
+            self.window_features[window_idx] = window_features
+            self.window_labels[window_idx] = self.model.tagger.tag(
+                self.model.to_example(window, window_features))
+            self.stats["tokens_tagged"] += len(window.tokens)
+        self.stats["windows_tagged"] += len(indices)
+        return len(indices)
+
+    def _find_window(self, token_idx):
+        """Finds the window that contains a token.
+        Args:
+            token_idx: Index of the token in the document.
+        Returns:
+            Tuple (index of the window, index of the window's first token in the document).
+        """
+        window_start = 0
+        for i, window in enumerate(self.windows):
+            if token_idx < window_start + len(window.tokens):
+                return (i, window_start)
+            window_start += len(window.tokens)
+        raise Exception("Token %d is not in the document (%d tokens)." % (token_idx, window_start))
+
+    def _split(self, tokens):
+        """Splits tokens into windows of about window_size tokens, if there are more than
+        twice as many.
+        Args:
+            tokens: List of Token objects.
+        Returns:
+            List of lists of Token objects.
+        """
+        if len(tokens) == 0:
+            return []
+        if len(tokens) <= 2 * self.window_size:
+            return [tokens]
+        count_windows = (len(tokens) + self.window_size - 1) // self.window_size
+        bounds = [len(tokens) * i // count_windows for i in range(count_windows + 1)]
+        return [tokens[bounds[i]:bounds[i+1]] for i in range(count_windows)]
@@ -25,6 +25,7 @@ class Unigrams(object):
         """Resets this class, empties all ranking and count dictionaries."""
         self.word_to_rank = OrderedDict()
         self.word_to_count = OrderedDict()
+        self.sum_of_counts = 0
 
     def fill_from_file(self, filepath, skip_first_n=0, max_count_words=None):
         """Fills the dictionaries of this class from a file containing unigrams.
@@ -99,8 +100,6 @@ class Unigrams(object):
         assert labels is None or len(labels) > 0
 
         counts = Counter()
-        self.sum_of_counts = 0
-
         articles = load_articles(filepath, start_at=0)
         for i, article in enumerate(articles):
             words = [token.word for token in article.tokens \
@@ -109,8 +108,26 @@ class Unigrams(object):
             if verbose and i % 1000 == 0:
                 print("Article %d" % (i))
 
-        most_common = counts.most_common()
-        for i, (word, count) in enumerate(most_common):
+        self.clear()
+        self.add_counts(counts)
+
+    def add_counts(self, counts):
+        """Adds word counts (e.g. of new articles) to the counts of this object and recomputes
+        all ranks.
+
+        Words are ordered by descending count and words with the same count alphabetically, so
+        that adding the counts of several parts of a corpus one after the other results in the
+        same ranks as counting the whole corpus at once.
+
+        Args:
+            counts: Dictionary/Counter of word to count.
+        """
+        merged = Counter(self.word_to_count)
+        merged.update(counts)
+
+        self.clear()
+        ordered = sorted(merged.items(), key=lambda item: (-item[1], item[0]))
+        for i, (word, count) in enumerate(ordered):
             self.word_to_count[word] = count
             self.word_to_rank[word] = i + 1
             self.sum_of_counts += count
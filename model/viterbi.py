@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Batched Viterbi decoding with numpy.
+
+pycrfsuite.Tagger.tag() decodes one window at a time, which makes python overhead dominate when
+many short windows are tagged. The BatchTagger loads the weights of a trained model into a
+sparse (attribute x label) matrix and decodes many windows at once: Windows are bucketed by their
+length, the emission scores of a whole bucket are computed with one sparse matrix product and the
+Viterbi recursion runs vectorized over all windows of the bucket.
+
+The predicted labels are the same as the ones of pycrfsuite.Tagger.tag(): The emission scores are
+summed in the same order as in crfsuite and ties are resolved in the same way (the first maximum
+wins).
+
+Example usage:
+    tagger = load_batch_tagger("my_experiment")
+    label_chains = tagger.tag_batch([feature_values_lists1, feature_values_lists2, ...])
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import itertools
+import struct
+import numpy as np
+import pycrfsuite
+
+from model.crf import iterate_item, is_numpy_model
+
+try:
+    import scipy.sparse
+except ImportError:
+    # scipy is optional, it is only needed by the BatchTagger (e.g. test.py --batch_decoding)
+    scipy = None
+
+# one feature in the features chunk of a crfsuite model file (see crf1dm.c in crfsuite):
+# type (0 = state feature, 1 = transition), source id, destination id, weight
+CRFSUITE_FEATURE_DTYPE = np.dtype([("type", "<u4"), ("src", "<u4"), ("dst", "<u4"),
+                                   ("weight", "<f8")])
+
+def load_batch_tagger(model_filepath):
+    """Creates a BatchTagger for a trained model of either pycrfsuite or the numpy CRF
+    (see model/crf.py).
+
+    Args:
+        model_filepath: Filepath of the trained model.
+    Returns:
+        BatchTagger object.
+    """
+    check_scipy()
+    if is_numpy_model(model_filepath):
+        with open(model_filepath, "rb") as handle:
+            model = np.load(handle)
+            return BatchTagger(model["attributes"].tolist(), model["labels"].tolist(),
+                               scipy.sparse.csr_matrix(model["weights"]),
+                               model["transitions"])
+    else:
+        return load_crfsuite_batch_tagger(model_filepath)
+
+def load_crfsuite_batch_tagger(model_filepath):
+    """Creates a BatchTagger for a model trained by pycrfsuite.
+
+    The attribute and label ids are taken from pycrfsuite.Tagger.info(). The weights are read
+    directly from the features chunk of the model file, because the model dump behind info()
+    rounds them to six decimal places, which could change the predicted labels in case of
+    (near) ties.
+
+    Args:
+        model_filepath: Filepath of the trained crfsuite model.
+    Returns:
+        BatchTagger object.
+    """
+    check_scipy()
+    tagger = pycrfsuite.Tagger()
+    tagger.open(model_filepath)
+    info = tagger.info()
+    tagger.close()
+
+    labels = [None] * len(info.labels)
+    for label, label_id in info.labels.items():
+        labels[int(label_id)] = label
+    attributes = [None] * len(info.attributes)
+    for attribute, attribute_id in info.attributes.items():
+        attributes[int(attribute_id)] = attribute
+
+    features = read_crfsuite_features(model_filepath)
+    state = features[features["type"] == 0]
+    transition = features[features["type"] == 1]
+    weights = scipy.sparse.csr_matrix((state["weight"], (state["src"], state["dst"])),
+                                      shape=(len(attributes), len(labels)))
+    transitions = np.zeros((len(labels), len(labels)))
+    transitions[transition["src"], transition["dst"]] = transition["weight"]
+    return BatchTagger(attributes, labels, weights, transitions)
+
+def check_scipy():
+    """Raises an exception if scipy, which the BatchTagger needs, is not installed."""
+    if scipy is None:
+        raise Exception("Batch decoding requires scipy (pip install scipy).")
+
+def read_crfsuite_features(model_filepath):
+    """Reads the features (weights) of a crfsuite model file.
+
+    Args:
+        model_filepath: Filepath of the trained crfsuite model.
+    Returns:
+        numpy structured array with the fields type, src, dst and weight (one entry per feature).
+    """
+    with open(model_filepath, "rb") as handle:
+        content = handle.read()
+
+    # header: magic, size, type, version, count features, count labels, count attributes,
+    # offset of the features chunk, ...
+    if content[0:4] != b"lCRF" or content[8:12] != b"FOMC":
+        raise Exception("'%s' is not a crfsuite CRF model file." % (model_filepath))
+    offset_features = struct.unpack("<I", content[28:32])[0]
+    # features chunk: chunk id, size, count features, features
+    if content[offset_features:offset_features+4] != b"FEAT":
+        raise Exception("Missing features chunk in crfsuite model file '%s'." % (model_filepath))
+    count_features = struct.unpack("<I", content[offset_features+8:offset_features+12])[0]
+    return np.frombuffer(content, dtype=CRFSUITE_FEATURE_DTYPE, count=count_features,
+                         offset=offset_features + 12)
+
+class AttributeIds(dict):
+    """Dictionary of attribute name to attribute id, which returns -1 for unknown attributes.
+    (Unlike dict.get() this keeps the lookup in C when used via map().)"""
+    def __missing__(self, key):
+        """Returns the id of unknown attributes.
+        Args:
+            key: The attribute name.
+        Returns:
+            -1
+        """
+        return -1
+
+class BatchTagger(object):
+    """Decodes many sequences at once with a vectorized Viterbi algorithm."""
+    def __init__(self, attributes, labels, weights, transitions):
+        """Initialize the tagger.
+        Args:
+            attributes: List of attribute names (one per row of weights).
+            labels: List of labels (one per column of weights).
+            weights: Attribute weights, scipy sparse matrix of shape
+                (count attributes, count labels).
+            transitions: Transition weights, numpy array of shape (count labels, count labels).
+        """
+        self.attribute_to_id = AttributeIds([(name, idx) for idx, name in enumerate(attributes)])
+        self.label_names = list(labels)
+        self.weights = weights.tocsr()
+        self.transitions = np.asarray(transitions, dtype=np.float64)
+
+    def labels(self):
+        """Returns the labels of the model.
+        Returns:
+            List of strings.
+        """
+        return list(self.label_names)
+
+    def tag(self, xseq):
+        """Predicts the most probable label chain of one sequence.
+        Args:
+            xseq: List of items (one per token), each item either a list of attribute names or
+                a dictionary of attribute name to value. Unknown attributes are ignored.
+        Returns:
+            List of labels (strings).
+        """
+        return self.tag_batch([xseq])[0]
+
+    def tag_batch(self, xseqs):
+        """Predicts the most probable label chains of many sequences.
+        Args:
+            xseqs: List of sequences, each one a list of items as in tag().
+        Returns:
+            List of label chains (each a list of strings), in the same order as xseqs.
+        """
+        by_length = dict()
+        for idx, xseq in enumerate(xseqs):
+            by_length.setdefault(len(xseq), []).append(idx)
+
+        result = [None] * len(xseqs)
+        for length, indices in by_length.items():
+            if length == 0:
+                for idx in indices:
+                    result[idx] = []
+                continue
+
+            emissions = self.compute_emissions([xseqs[idx] for idx in indices], length)
+            paths = viterbi_batch(emissions, self.transitions)
+            for idx, path in zip(indices, paths):
+                result[idx] = [self.label_names[label_id] for label_id in path]
+        return result
+
+    def compute_emissions(self, xseqs, length):
+        """Computes the emission (state) scores of sequences of the same length.
+        Args:
+            xseqs: List of sequences, each one a list of items as in tag().
+            length: The length of each sequence.
+        Returns:
+            numpy array of shape (count sequences, length, count labels).
+        """
+        items = [item for xseq in xseqs for item in xseq]
+        if any([isinstance(item, dict) for item in items]):
+            indices = []
+            values = []
+            lengths = []
+            for item in items:
+                pairs = list(iterate_item(item))
+                indices.extend([self.attribute_to_id[name] for name, _ in pairs])
+                values.extend([value for _, value in pairs])
+                lengths.append(len(pairs))
+            indices = np.asarray(indices, dtype=np.int32)
+            values = np.asarray(values, dtype=np.float64)
+        else:
+            # fast path for the common case of unweighted attributes (value 1.0)
+            lengths = [len(item) for item in items]
+            indices = np.fromiter(map(self.attribute_to_id.__getitem__,
+                                      itertools.chain.from_iterable(items)),
+                                  dtype=np.int32, count=sum(lengths))
+            values = np.ones(len(indices), dtype=np.float64)
+        indptr = np.zeros(len(items) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+
+        # remove the unknown attributes (id -1) and shift the row pointers accordingly
+        known = indices >= 0
+        if not np.all(known):
+            indptr = np.concatenate([[0], np.cumsum(known)])[indptr]
+            indices = indices[known]
+            values = values[known]
+
+        # the attributes of each token stay in their original order, so that the scores are
+        # summed in the same order as in crfsuite
+        matrix = scipy.sparse.csr_matrix((values, indices, indptr),
+                                         shape=(len(xseqs) * length, self.weights.shape[0]))
+        emissions = matrix.dot(self.weights).toarray()
+        return emissions.reshape(len(xseqs), length, len(self.label_names))
+
+def viterbi_batch(emissions, transitions):
+    """Finds the most probable label chains of several sequences of the same length.
+    Ties are resolved in favor of the lowest label id (like crfsuite).
+
+    Args:
+        emissions: Emission scores, numpy array of shape (count sequences, length, count labels).
+        transitions: Transition weights, numpy array of shape (count labels, count labels).
+    Returns:
+        numpy array of label ids with shape (count sequences, length).
+    """
+    count_sequences, length, count_labels = emissions.shape
+    backpointers = np.zeros((count_sequences, length, count_labels), dtype=np.int32)
+    scores = emissions[:, 0]
+    for t in range(1, length):
+        # candidates[b, i, j]: score of label i at t-1 followed by label j at t
+        candidates = scores[:, :, np.newaxis] + transitions
+        backpointers[:, t] = np.argmax(candidates, axis=1)
+        scores = np.max(candidates, axis=1) + emissions[:, t]
+
+    paths = np.zeros((count_sequences, length), dtype=np.int32)
+    paths[:, length-1] = np.argmax(scores, axis=1)
+    sequence_indices = np.arange(count_sequences)
+    for t in range(length - 1, 0, -1):
+        paths[:, t-1] = backpointers[sequence_indices, t, paths[:, t]]
+    return paths
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Class to remember how much of an append-only corpus was already processed (watermark), so
+that preprocessing steps can later process only the new articles and merge their counts into
+their previous results."""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import zlib
+from collections import OrderedDict
+
+from model.datasets import Article, is_binary_corpus
+from model.readers import expand_filepaths, guess_format, open_file
+
+# number of bytes before the watermark that are checksummed to detect rewritten corpus files
+TAIL_CHECKSUM_SIZE = 4096
+
+COMPRESSED_EXTENSIONS = [".gz", ".bz2", ".xz"]
+
+class CorpusWatermark(object):
+    """Watermark of a corpus in the plain format (one article per line, see ARTICLES_FILEPATH).
+
+    For each corpus file (or shard, if the corpus is a glob pattern) the watermark contains the
+    byte offset and number of lines up to which the file was processed, as well as a checksum of
+    the bytes right before that offset. New articles are then read starting at that offset.
+    Uncompressed files may grow (articles appended at their end), compressed files are always
+    processed as a whole and must not change afterwards (new articles must go into new shards).
+
+    Incremental runs only process complete lines (ending with a line break), so that an article
+    that is being written while the corpus is read is picked up completely by the next run.
+    Complete runs also process a last line without a line break, like load_articles(). The
+    watermark then remembers that this line was unterminated. If the file grew afterwards, the
+    line may have been incomplete, so the watermark becomes invalid (and a complete run is
+    necessary) instead of counting the rest of the line as a separate article.
+
+    Example usage:
+        watermark = CorpusWatermark()
+        watermark.load("unigrams.txt.watermark")
+        if watermark.is_valid_for(cfg.ARTICLES_FILEPATH)[0]:
+            for article in watermark.iterate_new_articles(cfg.ARTICLES_FILEPATH):
+                ...
+            watermark.save("unigrams.txt.watermark")
+    """
+    def __init__(self):
+        """Initialize an empty watermark (nothing processed yet)."""
+        self.files = OrderedDict()
+        self.count_articles = 0
+
+    def is_valid_for(self, corpus_filepath):
+        """Checks whether the corpus still contains everything that was processed so far,
+        i.e. whether the corpus was only appended to since the watermark was saved.
+
+        Args:
+            corpus_filepath: Filepath or glob pattern of the corpus.
+        Returns:
+            Tuple (valid, reason), where reason explains why the watermark is invalid
+            (None if it is valid).
+        """
+        if not is_watermark_supported(corpus_filepath):
+            return (False, "Watermarks are only supported for corpora in the plain format.")
+
+        current_filepaths = set(expand_filepaths(corpus_filepath))
+        for filepath, state in self.files.items():
+            if filepath not in current_filepaths or not os.path.isfile(filepath):
+                return (False, "Corpus file '%s' was removed." % (filepath))
+            size = os.path.getsize(filepath)
+            if size < state["offset"] or (is_compressed(filepath) and size != state["offset"]):
+                return (False, "Corpus file '%s' was changed." % (filepath))
+            if compute_tail_checksum(filepath, state["offset"]) != state["tail_checksum"]:
+                return (False, "Corpus file '%s' was changed." % (filepath))
+            if state.get("unterminated", False) and size > state["offset"]:
+                return (False, "Corpus file '%s' grew after its last line, which had no line " \
+                               "break, was processed." % (filepath))
+        return (True, None)
+
+    def iterate_new_articles(self, corpus_filepath, max_articles=None,
+                             include_incomplete_line=False):
+        """Reads the articles after the watermark and moves the watermark accordingly.
+
+        Args:
+            corpus_filepath: Filepath or glob pattern of the corpus.
+            max_articles: Maximum number of articles to process in total (including the articles
+                of previous runs) or None for no maximum. (Default is None.)
+            include_incomplete_line: Whether to also process the last line of a file if it does
+                not end with a line break. Complete (non-incremental) runs set this, so that
+                they process every article of the corpus. (Default is False, leave it for the
+                next run.)
+        Returns:
+            Generator of Article objects.
+        """
+        for filepath in expand_filepaths(corpus_filepath):
+            if filepath in self.files and is_compressed(filepath):
+                # compressed files are always processed completely
+                continue
+
+            state = self.files.get(filepath, {"offset": 0, "count_lines": 0})
+            compressed = is_compressed(filepath)
+            handle = open_file(filepath)
+            try:
+                if not compressed:
+                    handle.seek(state["offset"])
+                for line in handle:
+                    if not compressed and not include_incomplete_line \
+                       and not line.endswith(b"\n"):
+                        # incomplete last line, it will be processed by the next run
+                        break
+                    text = line.decode("utf-8").strip()
+                    if len(text) > 0 and max_articles is not None \
+                       and self.count_articles >= max_articles:
+                        return
+                    state["offset"] += len(line)
+                    state["count_lines"] += 1
+                    state["unterminated"] = not compressed and not line.endswith(b"\n")
+                    if len(text) > 0:
+                        self.count_articles += 1
+                        yield Article(text)
+                if compressed:
+                    state["offset"] = os.path.getsize(filepath)
+            finally:
+                handle.close()
+                state["tail_checksum"] = compute_tail_checksum(filepath, state["offset"])
+                self.files[filepath] = state
+
+    def save(self, filepath):
+        """Saves the watermark to a JSON file.
+        Args:
+            filepath: Filepath of the file to write.
+        """
+        with open(filepath, "w") as handle:
+            json.dump({"count_articles": self.count_articles,
+                       "files": [dict([("filepath", path)] + list(state.items())) \
+                                 for path, state in self.files.items()]},
+                      handle, indent=2)
+
+    def load(self, filepath):
+        """Loads the watermark from a JSON file, as written by save().
+        Args:
+            filepath: Filepath of the file to read.
+        """
+        with open(filepath, "r") as handle:
+            content = json.load(handle)
+        self.count_articles = content["count_articles"]
+        self.files = OrderedDict()
+        for state in content["files"]:
+            state = dict(state)
+            self.files[state.pop("filepath")] = state
+
+def is_watermark_supported(corpus_filepath):
+    """Returns whether watermarks can be used for a corpus.
+    Args:
+        corpus_filepath: Filepath or glob pattern of the corpus.
+    Returns:
+        True for corpora in the plain format, False otherwise (e.g. binary or jsonl corpora).
+    """
+    return not is_binary_corpus(corpus_filepath) and guess_format(corpus_filepath) == "plain"
+
+def is_compressed(filepath):
+    """Returns whether a corpus file is compressed (recognized by its file extension).
+    Args:
+        filepath: The filepath of the file.
+    Returns:
+        True if compressed, False otherwise.
+    """
+    return any([filepath.endswith(extension) for extension in COMPRESSED_EXTENSIONS])
+
+def compute_tail_checksum(filepath, offset):
+    """Computes the checksum of the TAIL_CHECKSUM_SIZE bytes before an offset of a file.
+    Args:
+        filepath: The filepath of the file.
+        offset: The byte offset.
+    Returns:
+        crc32 checksum (integer).
+    """
+    start = max(0, offset - TAIL_CHECKSUM_SIZE)
+    with open(filepath, "rb") as handle:
+        handle.seek(start)
+        return zlib.crc32(handle.read(offset - start)) & 0xffffffff
+
+def get_watermark_filepath(output_filepath):
+    """Returns the filepath of the watermark that belongs to the output of a preprocessing step.
+    Args:
+        output_filepath: Filepath of the output, e.g. UNIGRAMS_FILEPATH.
+    Returns:
+        Filepath (string).
+    """
+    return "%s.watermark" % (output_filepath)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the whole workflow (see "Usage" in the README) and skips all stages that are up to date
+(see model/pipeline.py). The stages and their dependencies:
+    unigrams (preprocessing/collect_unigrams)  --+
+    gazetteer (preprocessing/build_gazetteer)  --+--> train (train.py) --> test (test.py)
+    lda_dict --> lda_train (preprocessing/lda) --+
+The first three stages are independent of each other and run concurrently with --jobs > 1.
+The caches of the LDA and of the POS tagger are emptied automatically when the LDA model (or the
+Stanford tagger) changed, see model/cache.py.
+A stage runs again if its command, its input files (e.g. the corpus, the clusters or the POS
+tagger), the config constants that it depends on or the outputs of the stages before it changed.
+The training and the test depend on all config constants.
+The log of each stage is written to PIPELINE_DIRPATH/logs/<stage>.log, the test results are in
+the log of the test stage.
+With --profile every stage that runs is profiled (see model/profiling.py) and writes its results
+to <directory>/<stage>.*, by default to PROFILE_DIRPATH/pipeline-<time>/. Combine it with
+--force to profile stages that are up to date.
+
+Usage example:
+    python pipeline.py --identifier="my_experiment"
+    python pipeline.py --identifier="my_experiment" --jobs=3 --dry_run
+    python pipeline.py --identifier="my_experiment" --stages=lda_train --force=lda_train
+    python pipeline.py --identifier="my_experiment" --stages=train --force=train --profile
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import os
+import random
+import sys
+import time
+
+from model.pipeline import Pipeline, Stage
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# config constants that affect how the labels of the corpus are read (see Token), i.e. the
+# outputs of every stage that reads the corpus
+LABEL_CONFIG_NAMES = ["LABELS", "NO_NE_LABEL", "REMOVE_BIO_ENCODING"]
+
+def main():
+    """Parses the command line arguments and then runs the pipeline."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=True,
+                        help="A short name/identifier for your experiment, e.g. 'ex42b'.")
+    parser.add_argument("--jobs", required=False, default=cfg.PIPELINE_JOBS, type=int,
+                        help="Maximum number of stages that run at the same time.")
+    parser.add_argument("--stages", required=False, default=None,
+                        help="Comma-separated names of the stages to run (together with the " \
+                             "stages that they depend on), e.g. 'lda_train'. " \
+                             "Default is all stages.")
+    parser.add_argument("--force", required=False, default="",
+                        help="Comma-separated names of stages to run even if they are up " \
+                             "to date.")
+    parser.add_argument("--dry_run", required=False, action="store_const", const=True,
+                        help="Only print which stages would run.")
+    parser.add_argument("--profile", required=False, nargs="?", const="", default=None,
+                        help="Profile the stages that run and write the results to the given " \
+                             "directory or, without a value, to PROFILE_DIRPATH.")
+    args = parser.parse_args()
+
+    profile_dirpath = args.profile
+    if profile_dirpath is not None and len(profile_dirpath) == 0:
+        profile_dirpath = os.path.join(cfg.PROFILE_DIRPATH,
+                                       "pipeline-%s" % (time.strftime("%Y%m%d-%H%M%S")))
+    pipeline = Pipeline(create_stages(args.identifier), jobs=args.jobs,
+                        profile_dirpath=profile_dirpath)
+    success = pipeline.run(targets=args.stages.split(",") if args.stages else None,
+                           force=[name for name in args.force.split(",") if len(name) > 0],
+                           dry_run=bool(args.dry_run))
+    print(pipeline.report())
+    if not success:
+        sys.exit(1)
+
+def create_stages(identifier):
+    """Creates the stages of the workflow.
+    Args:
+        identifier: Identifier of the CRF model to train and test.
+    Returns:
+        List of Stage objects.
+    """
+    python = sys.executable
+    corpus = [cfg.ARTICLES_FILEPATH]
+    # resources of the feature generators that are not generated by a stage
+    resources = [cfg.W2V_CLUSTERS_FILEPATH, cfg.BROWN_CLUSTERS_FILEPATH,
+                 cfg.STANFORD_POS_JAR_FILEPATH, cfg.STANFORD_MODEL_FILEPATH,
+                 cfg.POS_PERCEPTRON_MODEL_FILEPATH]
+    return [
+        Stage("unigrams", [python, "-m", "preprocessing.collect_unigrams"], inputs=corpus,
+              config_names=LABEL_CONFIG_NAMES,
+              outputs=[cfg.UNIGRAMS_FILEPATH + "*", cfg.UNIGRAMS_PERSON_FILEPATH + "*"]),
+        Stage("gazetteer", [python, "-m", "preprocessing.build_gazetteer"], inputs=corpus,
+              config_names=["GAZETTEER_*"] + LABEL_CONFIG_NAMES,
+              outputs=[cfg.GAZETTEER_FILEPATH]),
+        Stage("lda_dict", [python, "-m", "preprocessing.lda", "--dict"], inputs=corpus,
+              config_names=["LDA_WINDOW_*", "LDA_DICTIONARY_*", "DEDUP_*"] + LABEL_CONFIG_NAMES,
+              outputs=[cfg.LDA_DICTIONARY_FILEPATH + "*"]),
+        Stage("lda_train", [python, "-m", "preprocessing.lda", "--train"], inputs=corpus,
+              config_names=["LDA_*", "DEDUP_*"] + LABEL_CONFIG_NAMES,
+              outputs=[cfg.LDA_MODEL_FILEPATH + "*"], depends=["lda_dict"]),
+        Stage("train", [python, "train.py", "--identifier=%s" % (identifier)],
+              inputs=corpus + resources,
+              config_names=["*"], outputs=[identifier, identifier + ".*"],
+              depends=["unigrams", "gazetteer", "lda_train"]),
+        Stage("test", [python, "test.py", "--identifier=%s" % (identifier), "--mycorpus"],
+              inputs=corpus + resources, config_names=["*"], depends=["train"])
+    ]
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+    File to convert a corpus (see ARTICLES_FILEPATH) to a binary corpus.
+    The binary corpus contains a vocabulary and memory-mapped arrays of word ids, label ids and
+    article offsets (see write_binary_corpus() in model/datasets.py). Loading articles and windows
+    from it does not require any text parsing. To use it, set ARTICLES_FILEPATH to the created
+    directory.
+
+    Execute via:
+        python -m preprocessing/binarize_corpus --output="/var/corpus/annotated-fulltext.bin"
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+from model.datasets import load_articles, write_binary_corpus
+from model.profiling import add_profile_argument, profile
+
+# All capitalized constants come from this file
+import config as cfg
+
+def main():
+    """Main function, parses command line arguments and converts the corpus."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=False, default=cfg.ARTICLES_FILEPATH,
+                        help="Filepath of the corpus to convert (default: ARTICLES_FILEPATH).")
+    parser.add_argument("--output", required=True,
+                        help="Filepath of the directory in which to save the binary corpus.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "preprocessing.binarize_corpus"):
+        binarize_corpus(args)
+
+def binarize_corpus(args):
+    """Converts the corpus to the binary corpus.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    print("Converting corpus (%s) to binary corpus (%s)..." % (args.input, args.output))
+    write_binary_corpus(load_articles(args.input), args.output, verbose=True)
+
+    print("Finished.")
+
+# ---------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+    File to build the multi-token gazetteer (see MultiTokenGazetteer in model/gazetteer.py) from
+    the labeled corpus. It contains names of one or more tokens for every label in LABELS.
+
+    The script makes two passes over the corpus:
+        1. Collect all labeled names (sequences of up to GAZETTEER_MAX_TOKENS tokens with the same
+           label) and count how often each name appears with each label. Names that appear less
+           than GAZETTEER_MIN_COUNT times with a label are dropped.
+        2. Count how often each remaining name appears in the corpus at all (labeled or not).
+           A name is only kept for a label if at least GAZETTEER_MIN_LABEL_RATIO of its
+           appearances have that label.
+    The remaining names are saved as an automaton to GAZETTEER_FILEPATH.
+
+    Execute via:
+        python -m preprocessing/build_gazetteer
+        python -m preprocessing/build_gazetteer --max_articles=100000
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import itertools
+from collections import Counter
+from model.datasets import load_articles
+from model.gazetteer import MultiTokenGazetteer
+from model.profiling import add_profile_argument, profile
+
+# All capitalized constants come from this file
+import config as cfg
+
+def main():
+    """Main function. Builds the multi-token gazetteer, see documentation at the top."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_articles", required=False, default=None, type=int,
+                        help="Maximum number of articles to process (default: all).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "preprocessing.build_gazetteer"):
+        build_gazetteer(args)
+
+def build_gazetteer(args):
+    """Builds the multi-token gazetteer, see documentation at the top.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    print("Collecting labeled names...")
+    labeled_counts = Counter()
+    for article in iterate_articles(args.max_articles):
+        for name, label in get_labeled_names(article.tokens, cfg.GAZETTEER_MAX_TOKENS):
+            labeled_counts[(name, label)] += 1
+    candidates = dict()
+    for (name, label), count in labeled_counts.items():
+        if count >= cfg.GAZETTEER_MIN_COUNT:
+            candidates.setdefault(name, []).append(label)
+    print("Found %d names with at least %d appearances per label." \
+          % (len(candidates), cfg.GAZETTEER_MIN_COUNT))
+
+    print("Counting all appearances of the names...")
+    gazetteer = MultiTokenGazetteer()
+    gazetteer.build(candidates, cfg.LABELS)
+    total_counts = Counter()
+    for article in iterate_articles(args.max_articles):
+        words = [token.word for token in article.tokens]
+        for start, end, _ in gazetteer.find_matches(words):
+            total_counts[tuple(words[start:end])] += 1
+
+    entries = dict()
+    for name, labels in candidates.items():
+        kept = [label for label in labels \
+                if labeled_counts[(name, label)] >= cfg.GAZETTEER_MIN_LABEL_RATIO \
+                                                    * total_counts[name]]
+        if len(kept) > 0:
+            entries[name] = kept
+
+    gazetteer = MultiTokenGazetteer()
+    gazetteer.build(entries, cfg.LABELS)
+    gazetteer.save(cfg.GAZETTEER_FILEPATH)
+
+    label_counts = Counter([label for labels in entries.values() for label in labels])
+    print("Saved %d names (%s) to '%s'." \
+          % (len(entries), ", ".join(["%s: %d" % (label, label_counts[label]) \
+                                       for label in cfg.LABELS]),
+             cfg.GAZETTEER_FILEPATH))
+    print("Finished.")
+
+def iterate_articles(max_articles=None):
+    """Iterates over the articles of the corpus and prints the progress.
+    Args:
+        max_articles: Maximum number of articles or None for all.
+    Returns:
+        Generator of Article objects.
+    """
+    articles = itertools.islice(load_articles(cfg.ARTICLES_FILEPATH), max_articles)
+    for count_articles, article in enumerate(articles):
+        if count_articles % 10000 == 0:
+            print("Article %d" % (count_articles))
+        yield article
+
+def get_labeled_names(tokens, max_tokens):
+    """Extracts the labeled names from a list of tokens, i.e. the longest sequences of tokens
+    with the same label (other than NO_NE_LABEL).
+    Args:
+        tokens: List of Token objects.
+        max_tokens: Names with more tokens are ignored.
+    Returns:
+        List of tuples (name as tuple of words, label).
+    """
+    names = []
+    for label, group in itertools.groupby(tokens, key=lambda token: token.label):
+        if label == cfg.NO_NE_LABEL or label not in cfg.LABELS:
+            continue
+        words = tuple([token.word for token in group])
+        if len(words) <= max_tokens:
+            names.append((words, label))
+    return names
+
+# ---------------
+
+if __name__ == "__main__":
+    main()
@@ -9,31 +9,105 @@
         The foobird is a special species of birds. It's commonly found on mars.
         ...
 
+    With --incremental, only the articles that were appended to the corpus since the last run
+    are processed and their counts are added to the existing unigram files. The position up to
+    which the corpus was processed is saved next to UNIGRAMS_FILEPATH (see model/watermark.py).
+    The results are identical to collecting the unigrams from the whole corpus again. If the
+    corpus was changed in any other way than appending articles (or new shards), all unigrams
+    are collected again.
+
+    The gazetteer is generated from the unigram files when the features are created, so it is
+    automatically up to date after this script ran.
+
     Execute via:
         python -m preprocessing/collect_unigrams
+        python -m preprocessing/collect_unigrams --incremental
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import os
+from collections import Counter
+from model.datasets import load_articles
+from model.profiling import add_profile_argument, profile
 from model.unigrams import Unigrams
+from model.watermark import CorpusWatermark, get_watermark_filepath, is_watermark_supported
 
 # All capitalized constants come from this file
 import config as cfg
 
 def main():
     """Main function. Gathers all unigrams and name-unigrams, see documantation at the top."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", required=False, action="store_const", const=True,
+                        help="Only process the articles that were appended to the corpus since " \
+                             "the last run and add them to the existing unigram files.")
+    add_profile_argument(parser)
+    args = parser.parse_args()
 
-    # collect all unigrams (all labels, including "O")
-    print("Collecting unigrams...")
-    ug_all = Unigrams()
-    ug_all.fill_from_articles(cfg.ARTICLES_FILEPATH, verbose=True)
-    ug_all.write_to_file(cfg.UNIGRAMS_FILEPATH)
-    ug_all = None
+    with profile(args.profile, "preprocessing.collect_unigrams"):
+        collect_unigrams(args)
+
+def collect_unigrams(args):
+    """Gathers all unigrams and name-unigrams, see documentation at the top.
 
-    # collect only unigrams of label PER
-    print("Collecting person names (label=PER)...")
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    watermark_filepath = get_watermark_filepath(cfg.UNIGRAMS_FILEPATH)
+    ug_all = Unigrams()
     ug_names = Unigrams()
-    ug_names.fill_from_articles_labels(cfg.ARTICLES_FILEPATH, ["PER"], verbose=True)
+    watermark = None
+    if is_watermark_supported(cfg.ARTICLES_FILEPATH):
+        watermark = CorpusWatermark()
+
+    if args.incremental:
+        if watermark is None:
+            print("[Info] Watermarks are only supported for corpora in the plain format, " \
+                  "collecting all unigrams.")
+        elif not os.path.isfile(watermark_filepath) \
+                or not os.path.isfile(cfg.UNIGRAMS_FILEPATH) \
+                or not os.path.isfile(cfg.UNIGRAMS_PERSON_FILEPATH):
+            print("[Info] No previous run found, collecting all unigrams.")
+        else:
+            watermark.load(watermark_filepath)
+            valid, reason = watermark.is_valid_for(cfg.ARTICLES_FILEPATH)
+            if valid:
+                print("Loading unigrams of %d previously processed articles..." \
+                      % (watermark.count_articles))
+                ug_all.fill_from_file(cfg.UNIGRAMS_FILEPATH)
+                ug_names.fill_from_file(cfg.UNIGRAMS_PERSON_FILEPATH)
+            else:
+                print("[Info] %s Collecting all unigrams." % (reason))
+                watermark = CorpusWatermark()
+
+    if watermark is not None:
+        articles = watermark.iterate_new_articles(
+            cfg.ARTICLES_FILEPATH, include_incomplete_line=not args.incremental)
+    else:
+        articles = load_articles(cfg.ARTICLES_FILEPATH)
+
+    # collect all unigrams (all labels, including "O") and only unigrams of label PER
+    # in one pass over the articles
+    print("Collecting unigrams and person names (label=PER)...")
+    counts_all = Counter()
+    counts_names = Counter()
+    count_articles = 0
+    for article in articles:
+        counts_all.update([token.word for token in article.tokens])
+        counts_names.update([token.word for token in article.tokens if token.label == "PER"])
+        if count_articles % 1000 == 0:
+            print("Article %d" % (count_articles))
+        count_articles += 1
+    print("Processed %d new articles." % (count_articles))
+
+    ug_all.add_counts(counts_all)
+    ug_all.write_to_file(cfg.UNIGRAMS_FILEPATH)
+    ug_names.add_counts(counts_names)
     ug_names.write_to_file(cfg.UNIGRAMS_PERSON_FILEPATH)
 
+    if watermark is not None:
+        watermark.save(watermark_filepath)
+
     print("Finished.")
 
 # ---------------
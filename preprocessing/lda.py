@@ -3,6 +3,8 @@
     This file trains an LDA model based on small word windows (e.g. 11 words per window).
     Execute via:
         python -m preprocessing/lda --dict --train
+    Add the articles that were appended to the corpus since the last run to the dictionary via:
+        python -m preprocessing/lda --dict --incremental
     List topics of LDA via:
         python -m preprocessing/lda --topics
     Test on a sentence via:
@@ -12,7 +14,12 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import gensim
 from gensim.models.ldamulticore import LdaMulticore
 from model.datasets import load_articles, load_windows
+from model.dedup import create_deduplicator
+from model.profiling import add_profile_argument, profile
+from model.watermark import CorpusWatermark, get_watermark_filepath, is_watermark_supported
 import argparse
+import itertools
+import os
 
 # All capitalized constants (except for the few below) come from this file
 import config as cfg
@@ -30,6 +37,9 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--dict", required=False, action="store_const", const=True,
                         help="Create the LDA's dictionary (must happen before training).")
+    parser.add_argument("--incremental", required=False, action="store_const", const=True,
+                        help="With --dict: Only add the articles that were appended to the " \
+                             "corpus since the last run to the dictionary.")
     parser.add_argument("--train", required=False, action="store_const", const=True,
                         help="Train the LDA model.")
     parser.add_argument("--topics", required=False, action="store_const", const=True,
@@ -38,11 +48,21 @@ def main():
                         help="Test the trained LDA on a sentence provided via --sentence.")
     parser.add_argument("--sentence", required=False,
                         help="An example sentence to test the LDA model on.")
+    add_profile_argument(parser)
     args = parser.parse_args()
 
+    with profile(args.profile, "preprocessing.lda"):
+        run_actions(args)
+
+def run_actions(args):
+    """Performs the chosen actions: dict, train, topics and/or test.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
     # perform requested action
     if args.dict:
-        generate_dictionary()
+        generate_dictionary(incremental=bool(args.incremental))
     if args.train:
         train_lda()
     if args.topics:
@@ -53,35 +73,78 @@ def main():
     if not args.dict and not args.train and not args.topics and not args.test:
         print("No option chosen, choose --dict or --train or --topics or --test.")
 
-def generate_dictionary():
-    """Generate the dictionary/vocabulary used for the LDA."""
+def generate_dictionary(incremental=False):
+    """Generate the dictionary/vocabulary used for the LDA.
+
+    The unfiltered dictionary (including the rare words) is saved next to the filtered one
+    (LDA_DICTIONARY_FILEPATH + ".raw"), together with a watermark of the corpus. In incremental
+    mode only the articles that were appended to the corpus since the last run are added to the
+    unfiltered dictionary, which is then filtered again. This results in the same word
+    frequencies as generating the dictionary from the whole corpus again.
+
+    Args:
+        incremental: Whether to only add the new articles of the corpus to the dictionary of
+            the last run. (Default is False.)
+    """
     print("------------------")
     print("Generating LDA Dictionary")
     print("------------------")
 
+    raw_filepath = get_raw_dictionary_filepath()
+    watermark_filepath = get_watermark_filepath(cfg.LDA_DICTIONARY_FILEPATH)
+    dictionary = gensim.corpora.Dictionary()
+    watermark = None
+    if is_watermark_supported(cfg.ARTICLES_FILEPATH):
+        watermark = CorpusWatermark()
+
+    if incremental:
+        if watermark is None:
+            print("[Info] Watermarks are only supported for corpora in the plain format, " \
+                  "generating the whole dictionary.")
+        elif not os.path.isfile(watermark_filepath) or not os.path.isfile(raw_filepath):
+            print("[Info] No previous run found, generating the whole dictionary.")
+        else:
+            watermark.load(watermark_filepath)
+            valid, reason = watermark.is_valid_for(cfg.ARTICLES_FILEPATH)
+            if valid:
+                print("Loading dictionary of %d previously processed articles..." \
+                      % (watermark.count_articles))
+                dictionary = gensim.corpora.Dictionary.load(raw_filepath)
+            else:
+                print("[Info] %s Generating the whole dictionary." % (reason))
+                watermark = CorpusWatermark()
+
     # we generate the dictionary from the same corpus that is also used to find named entities
-    articles = load_articles(cfg.ARTICLES_FILEPATH)
+    if watermark is not None:
+        articles = watermark.iterate_new_articles(cfg.ARTICLES_FILEPATH,
+                                                  max_articles=COUNT_EXAMPLES_FOR_DICTIONARY,
+                                                  include_incomplete_line=not incremental)
+    else:
+        articles = itertools.islice(load_articles(cfg.ARTICLES_FILEPATH),
+                                    COUNT_EXAMPLES_FOR_DICTIONARY)
     articles_str = []
-    dictionary = gensim.corpora.Dictionary()
     update_every_n_articles = 1000
 
     # add words to the dictionary
+    # prune_at=None, because pruning depends on the order in which the articles are added and
+    # would make the incremental results differ from the results of a complete run
     for i, article in enumerate(articles):
         articles_str.append(article.get_content_as_string().lower().split(" "))
         if len(articles_str) >= update_every_n_articles:
             print("Updating (at article %d of max %d)..." % (i, COUNT_EXAMPLES_FOR_DICTIONARY))
-            dictionary.add_documents(articles_str)
+            dictionary.add_documents(articles_str, prune_at=None)
             articles_str = []
 
-        if i > COUNT_EXAMPLES_FOR_DICTIONARY:
-            print("Reached max of %d articles." % (COUNT_EXAMPLES_FOR_DICTIONARY,))
-            break
-
     if len(articles_str) > 0:
         print("Updating with remaining articles...")
-        dictionary.add_documents(articles_str)
+        dictionary.add_documents(articles_str, prune_at=None)
 
     print("Loaded %d unique words." % (len(dictionary.keys()),))
+    dictionary.save(raw_filepath)
+    if watermark is not None:
+        watermark.save(watermark_filepath)
+        if watermark.count_articles >= COUNT_EXAMPLES_FOR_DICTIONARY:
+            print("Reached max of %d articles." % (COUNT_EXAMPLES_FOR_DICTIONARY,))
 
     # filter some rare words to save space and computation time during training
     print("Filtering rare words...")
@@ -95,6 +158,14 @@ def generate_dictionary():
     print("Saving dictionary...")
     dictionary.save(cfg.LDA_DICTIONARY_FILEPATH)
 
+def get_raw_dictionary_filepath():
+    """Returns the filepath of the unfiltered dictionary (including rare words), which is needed
+    to add new articles to the dictionary later on.
+    Returns:
+        Filepath (string).
+    """
+    return "%s.raw" % (cfg.LDA_DICTIONARY_FILEPATH)
+
 def train_lda():
     """
     Train the LDA model.
@@ -123,8 +194,10 @@ def train_lda():
     print("Training...")
     examples = []
     update_every_n_windows = 25000
+    # optionally skip near-duplicate articles/windows (see DEDUP_ARTICLES, DEDUP_WINDOWS)
+    deduplicator = create_deduplicator()
     windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.LDA_WINDOW_SIZE,
-                           only_labeled_windows=True)
+                           only_labeled_windows=True, deduplicator=deduplicator)
     for i, window in enumerate(windows):
         tokens_str = [token.word.lower() for token in window.tokens]
         bow = dictionary.doc2bow(tokens_str) # each window as bag of words
@@ -144,6 +217,9 @@ def train_lda():
     #    print("Updating with remaining windows...")
     #    lda_model.update(examples)
 
+    if deduplicator is not None:
+        print(deduplicator.report())
+
     # save trained model to HDD
     print("Saving...")
     lda_model.save(cfg.LDA_MODEL_FILEPATH)
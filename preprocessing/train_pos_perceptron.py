@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    File to train the averaged perceptron POS tagger (model/perceptron_pos.py) on the results of
+    the Stanford POS tagger.
+    The training data are the POS-tagged windows in the cache of the Stanford tagger
+    (POS_TAGGER_CACHE_FILEPATH), which is filled by train.py/test.py. Optionally, additional
+    windows from the corpus can be tagged by the Stanford tagger (--sample).
+    A part of the tagged windows is held out to report how often the perceptron agrees with
+    the Stanford tagger.
+
+    After training, set POS_TAGGER_ENGINE to "perceptron" in config.py to use it.
+
+    Execute via:
+        python -m preprocessing/train_pos_perceptron
+        python -m preprocessing/train_pos_perceptron --sample=20000 --iterations=8
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import random
+import shelve
+import time
+from collections import Counter
+
+from model.cache import FINGERPRINT_KEY
+from model.datasets import load_windows, load_articles
+from model.perceptron_pos import AveragedPerceptronTagger
+from model.pos import PosTagger
+from model.profiling import add_profile_argument, profile
+
+# All capitalized constants come from this file
+import config as cfg
+
+def main():
+    """Main function, parses command line arguments, trains and evaluates the tagger."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache", required=False, default=cfg.POS_TAGGER_CACHE_FILEPATH,
+                        help="Filepath of the Stanford tagger's cache to train on " \
+                             "(default: POS_TAGGER_CACHE_FILEPATH).")
+    parser.add_argument("--sample", required=False, default=0, type=int,
+                        help="Number of additional windows from ARTICLES_FILEPATH to tag with " \
+                             "the Stanford tagger and train on (default: 0).")
+    parser.add_argument("--heldout", required=False, default=0.1, type=float,
+                        help="Fraction of the tagged windows to hold out for the agreement " \
+                             "report (default: 0.1).")
+    parser.add_argument("--iterations", required=False, default=5, type=int,
+                        help="Number of training iterations (default: 5).")
+    parser.add_argument("--output", required=False, default=cfg.POS_PERCEPTRON_MODEL_FILEPATH,
+                        help="Filepath to save the tagger to " \
+                             "(default: POS_PERCEPTRON_MODEL_FILEPATH).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "preprocessing.train_pos_perceptron"):
+        train_pos_perceptron(args)
+
+def train_pos_perceptron(args):
+    """Trains the averaged perceptron tagger and evaluates it against the stanford tagger.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    print("Loading tagged windows from cache (%s)..." % (args.cache))
+    sentences = load_cached_sentences(args.cache)
+    print("Loaded %d tagged windows." % (len(sentences)))
+    if args.sample > 0:
+        print("Tagging %d windows with the Stanford tagger..." % (args.sample))
+        sentences.extend(tag_sample(args.sample))
+
+    # the order of the cache is arbitrary, shuffle with a fixed seed to get a stable split
+    random.Random(42).shuffle(sentences)
+    count_heldout = int(len(sentences) * args.heldout)
+    heldout, train = sentences[:count_heldout], sentences[count_heldout:]
+
+    print("Training on %d windows..." % (len(train)))
+    tagger = AveragedPerceptronTagger()
+    tagger.train(train, nb_iterations=args.iterations)
+    tagger.save(args.output)
+    print("Saved tagger to %s." % (args.output))
+
+    if len(heldout) > 0:
+        print("Agreement with the Stanford tagger on %d held out windows:" % (len(heldout)))
+        print(agreement_report(tagger, heldout))
+
+def load_cached_sentences(cache_filepath):
+    """Loads the POS-tagged windows from the shelve cache of the Stanford tagger.
+    Args:
+        cache_filepath: Filepath of the shelve cache.
+    Returns:
+        List of sentences, each one a list of (word, tag) pairs.
+    """
+    cache = shelve.open(cache_filepath, flag="r")
+    sentences = []
+    for key in sorted(cache.keys()):
+        if key == FINGERPRINT_KEY:
+            continue
+        tagged = cache[key]
+        if len(tagged) > 0:
+            sentences.append([(word, tag) for word, tag in tagged])
+    cache.close()
+    return sentences
+
+def tag_sample(count_windows):
+    """POS-tags windows of the corpus (ARTICLES_FILEPATH) with the Stanford tagger.
+    The results are also added to the tagger's cache.
+
+    Args:
+        count_windows: Number of windows to tag.
+    Returns:
+        List of sentences, each one a list of (word, tag) pairs.
+    """
+    pos = PosTagger(cfg.STANFORD_POS_JAR_FILEPATH, cfg.STANFORD_MODEL_FILEPATH,
+                    cache_filepath=cfg.POS_TAGGER_CACHE_FILEPATH)
+    sentences = []
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           nb_append=count_windows)
+    for window in windows:
+        words = [token.word for token in window.tokens]
+        try:
+            tagged = pos.tag(words)
+        except Exception as exc: # pylint: disable=broad-except
+            print("[Info] Skipping window: %s" % (exc,))
+            continue
+        # the stanford tagger sometimes splits special unicode characters into several tokens
+        if len(tagged) == len(words):
+            sentences.append([(word, tag) for word, tag in tagged])
+            if len(sentences) % 1000 == 0:
+                print("Tagged %d of %d windows" % (len(sentences), count_windows))
+    pos.synchronize_cache()
+    return sentences
+
+def agreement_report(tagger, sentences):
+    """Compares the tags of the perceptron with the tags of the Stanford tagger.
+    Args:
+        tagger: The trained AveragedPerceptronTagger.
+        sentences: List of sentences tagged by the Stanford tagger, each one a list of
+            (word, tag) pairs.
+    Returns:
+        The report as string (overall agreement, agreement per tag, tagging speed).
+    """
+    correct = Counter()
+    total = Counter()
+    count_sentences_equal = 0
+    count_tokens = 0
+    start = time.time()
+    for sentence in sentences:
+        predicted = tagger.tag([word for word, _ in sentence])
+        count_tokens += len(sentence)
+        count_sentences_equal += int(predicted == [tag for _, tag in sentence])
+        for (_, tag), predicted_tag in zip(sentence, predicted):
+            total[tag] += 1
+            correct[tag] += int(tag == predicted_tag)
+    duration = time.time() - start
+
+    lines = ["Token agreement: %.2f%% (%d of %d tokens)" \
+             % (100 * sum(correct.values()) / max(count_tokens, 1), sum(correct.values()),
+                count_tokens),
+             "Window agreement: %.2f%% (all tokens equal)" \
+             % (100 * count_sentences_equal / max(len(sentences), 1)),
+             "Speed: %.0f tokens per second" % (count_tokens / max(duration, 1e-6)),
+             "",
+             "%-10s %9s %9s" % ("tag", "agreement", "support")]
+    for tag, count in total.most_common():
+        lines.append("%-10s %8.2f%% %9d" % (tag, 100 * correct[tag] / count, count))
+    return "\n".join(lines)
+
+# ---------------
+
+if __name__ == "__main__":
+    main()
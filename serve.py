@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Script that tags texts with several trained CRF models, which share one set of loaded feature
+resources (see model/serving.py).
+
+The script reads one JSON object per line from stdin and writes one JSON object per line to
+stdout. Each request contains the text and optionally a route or a list of models:
+    {"text": "Angela Merkel besuchte gestern Paris .", "route": "news"}
+    {"text": "...", "models": ["news", "web"]}
+    {"text": "..."}
+Requests without route and models are tagged with all models. Each response contains the words
+and the labels per model:
+    {"words": ["Angela", "Merkel", ...], "labels": {"news": ["PER", "PER", ...]}}
+At the end the number of requests and the time per model are written to stderr.
+
+Example usage:
+    python serve.py --model news=my_news_model --model web=my_web_model < requests.jsonl
+    python serve.py --model news=my_news_model --model news_cheap=my_news_model_cheap \
+                    --cheap news_cheap --route ab=news,news_cheap < requests.jsonl
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import io
+import json
+import random
+import sys
+
+from model.profiling import add_profile_argument, profile
+from model.serving import TaggingHost
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+def main():
+    """Parses the command line arguments, loads the models and then serves the requests."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, action="append",
+                        help="A model in the form name=identifier (can be used several times).")
+    parser.add_argument("--cheap", required=False, action="append", default=[],
+                        help="Name of a model that was trained with 'train.py --cheap', i.e. " \
+                             "only with CASCADE_CHEAP_FEATURES (can be used several times).")
+    parser.add_argument("--route", required=False, action="append", default=[],
+                        help="A route in the form route=model1,model2 (can be used several " \
+                             "times).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "serve"):
+        serve(args)
+
+def serve(args):
+    """Loads the models and then serves the requests.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    host = TaggingHost(verbose=False)
+    for model in args.model:
+        name, identifier = model.split("=", 1)
+        host.add_model(name, identifier,
+                       cfg.CASCADE_CHEAP_FEATURES if name in args.cheap else None)
+    for route in args.route:
+        name, model_names = route.split("=", 1)
+        host.add_route(name, model_names.split(","))
+
+    stdin = io.open(sys.stdin.fileno(), "r", encoding="utf-8")
+    for line in stdin:
+        if len(line.strip()) == 0:
+            continue
+        request = json.loads(line)
+        words, labels = host.tag(request["text"], route=request.get("route"),
+                                 models=request.get("models"))
+        print(json.dumps({"words": words, "labels": labels}))
+        sys.stdout.flush()
+
+    sys.stderr.write(host.report() + "\n")
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Script to train and test many CRF configurations at once (hyperparameter sweep), optionally
+via k-fold cross validation.
+The corpus is featurized only once. All configurations (and folds) are then trained and tested
+on the same featurized windows, each one in its own process.
+
+Example usage:
+    python sweep.py --identifier="sweep1" --c1="0,0.1,1.0" --c2="0.01,1.0"
+    python sweep.py --identifier="sweep2" --algorithms="lbfgs,l2sgd" --skipchain="5:5,2:2" --folds=5
+    python sweep.py --identifier="sweep3" --prune="1,2,5"
+
+Without --folds, each configuration is trained on the training windows and tested on the test
+windows (see COUNT_WINDOWS_TRAIN and COUNT_WINDOWS_TEST). The trained models are saved
+as "<identifier>.run<N>".
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import itertools
+import multiprocessing
+import pickle
+import random
+import os
+
+from model.datasets import load_windows, load_articles, generate_examples
+from model.evaluation import bio_classification_scores
+from model.experiments import train_model, tag_examples, split_to_folds, weighted_f1
+from model.profiling import add_profile_argument, profile
+from model.pruning import AttributePruner
+import model.features as features
+
+# All capitalized constants come from this file
+import config as cfg
+
+random.seed(42)
+
+# crfsuite parameters that are supported by each training algorithm
+# (feature.minfreq and max_iterations are supported by all algorithms)
+ALGORITHM_PARAMS = {
+    "lbfgs": ["c1", "c2"],
+    "l2sgd": ["c2"],
+    "ap": [],
+    "pa": [],
+    "arow": []
+}
+
+# The featurized windows. This is set once in the parent process before the worker processes
+# are started, so that the workers can access the windows without featurizing them again.
+_WINDOWS = None
+
+def main():
+    """Parses the command line arguments and then runs the sweep."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identifier", required=True,
+                        help="A short name/identifier for your sweep, e.g. 'sweep1'.")
+    parser.add_argument("--algorithms", required=False, default="lbfgs",
+                        help="Comma-separated list of crfsuite training algorithms, " \
+                             "e.g. 'lbfgs,l2sgd'.")
+    parser.add_argument("--c1", required=False, default=None,
+                        help="Comma-separated list of values for the L1 regularization.")
+    parser.add_argument("--c2", required=False, default=None,
+                        help="Comma-separated list of values for the L2 regularization.")
+    parser.add_argument("--minfreq", required=False, default=None,
+                        help="Comma-separated list of values for crfsuite's feature.minfreq.")
+    parser.add_argument("--prune", required=False, default=None,
+                        help="Comma-separated list of minimum attribute frequencies. Rarer " \
+                             "attributes are removed before training (see ATTRIBUTE_MIN_FREQ).")
+    parser.add_argument("--skipchain", required=False,
+                        default="%d:%d" % (cfg.SKIPCHAIN_LEFT, cfg.SKIPCHAIN_RIGHT),
+                        help="Comma-separated list of skipchain sizes in the form left:right, " \
+                             "e.g. '5:5,2:2'.")
+    parser.add_argument("--folds", required=False, default=0, type=int,
+                        help="Number of folds for k-fold cross validation. If not set, the " \
+                             "usual train/test split will be used.")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of configurations to train in parallel.")
+    parser.add_argument("--cache", required=False, default=None,
+                        help="Optional filepath to a file in which to save the featurized " \
+                             "windows. If the file exists, the windows will be loaded from it.")
+    parser.add_argument("--output", required=False, default=None,
+                        help="Optional filepath to a file to which to write the results table " \
+                             "(tab-separated).")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profile(args.profile, "sweep"):
+        sweep(args)
+
+def sweep(args):
+    """Featurizes the windows once and then trains and tests all configurations in parallel.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
+    global _WINDOWS
+    _WINDOWS = load_featurized_windows(args.cache)
+
+    runs = create_runs(args)
+    print("Running %d configurations in %d processes..." % (len(runs), args.workers))
+
+    pool = multiprocessing.Pool(processes=args.workers)
+    results = []
+    for result in pool.imap_unordered(run_configuration, runs):
+        print("Finished run %d (F1 %.4f)" % (result["run"], result["f1"]))
+        results.append(result)
+    pool.close()
+    pool.join()
+
+    results = sorted(results, key=lambda result: result["run"])
+    table = results_to_table(results)
+    print(table)
+    if args.folds >= 2:
+        print(folds_summary_to_table(results))
+
+    if args.output is not None:
+        with open(args.output, "w") as handle:
+            handle.write(table.encode("utf-8"))
+
+def load_featurized_windows(cache_filepath=None):
+    """Loads and featurizes all windows used by the sweep (test windows and training windows).
+
+    Args:
+        cache_filepath: Optional filepath of a file in which to save the featurized windows.
+            If the file already exists, the windows will be loaded from it instead.
+    Returns:
+        List of Window objects (with applied features).
+    """
+    if cache_filepath is not None and os.path.isfile(cache_filepath):
+        print("Loading featurized windows from cache (%s)..." % (cache_filepath))
+        with open(cache_filepath, "rb") as handle:
+            return pickle.load(handle)
+
+    # this may take a few minutes
+    print("Creating features...")
+    feature_generators = features.create_features()
+
+    # this may take a long while, especially because of the POS tagging
+    print("Loading windows...")
+    windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
+                           feature_generators, only_labeled_windows=True,
+                           nb_append=cfg.COUNT_WINDOWS_TEST + cfg.COUNT_WINDOWS_TRAIN)
+    windows = list(windows)
+    print("Loaded %d windows." % (len(windows)))
+
+    if cache_filepath is not None:
+        print("Saving featurized windows to cache (%s)..." % (cache_filepath))
+        with open(cache_filepath, "wb") as handle:
+            pickle.dump(windows, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return windows
+
+def create_runs(args):
+    """Creates one run description for each combination of configuration and fold.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    Returns:
+        List of dictionaries, one per run.
+    """
+    def parse_list(value, converter):
+        """Parses a comma-separated command line value, e.g. "0,0.1" to [0.0, 0.1].
+        Args:
+            value: The command line value or None.
+            converter: Function to convert each list element, e.g. float.
+        Returns:
+            List of converted values or [None] if the value was not set.
+        """
+        if value is None:
+            return [None]
+        return [converter(element.strip()) for element in value.split(",")]
+
+    algorithms = parse_list(args.algorithms, str)
+    for algorithm in algorithms:
+        if algorithm not in ALGORITHM_PARAMS:
+            raise Exception("Unknown training algorithm '%s', expected one of: %s" \
+                            % (algorithm, ", ".join(sorted(ALGORITHM_PARAMS.keys()))))
+
+    skipchains = parse_list(args.skipchain,
+                            lambda sc: tuple([int(size) for size in sc.split(":")]))
+    folds = range(args.folds) if args.folds >= 2 else [None]
+
+    runs = []
+    seen = set()
+    combinations = itertools.product(algorithms, parse_list(args.c1, float),
+                                     parse_list(args.c2, float), parse_list(args.minfreq, float),
+                                     parse_list(args.prune, int), skipchains)
+    for algorithm, c1, c2, minfreq, prune, skipchain in combinations:
+        # parameters that the algorithm does not support are dropped, which can lead to
+        # duplicate configurations (e.g. "ap" with different values for c1)
+        c1 = c1 if "c1" in ALGORITHM_PARAMS[algorithm] else None
+        c2 = c2 if "c2" in ALGORITHM_PARAMS[algorithm] else None
+        config_key = (algorithm, c1, c2, minfreq, prune, skipchain)
+        if config_key in seen:
+            continue
+        seen.add(config_key)
+
+        params = dict()
+        if c1 is not None:
+            params["c1"] = c1
+        if c2 is not None:
+            params["c2"] = c2
+        if minfreq is not None:
+            params["feature.minfreq"] = minfreq
+        if cfg.MAX_ITERATIONS is not None and cfg.MAX_ITERATIONS > 0:
+            params["max_iterations"] = cfg.MAX_ITERATIONS
+
+        for fold in folds:
+            runs.append({
+                "run": len(runs),
+                "model_filepath": "%s.run%03d" % (args.identifier, len(runs)),
+                "algorithm": algorithm,
+                "params": params,
+                "c1": c1,
+                "c2": c2,
+                "minfreq": minfreq,
+                "prune": prune,
+                "skipchain": skipchain,
+                "fold": fold,
+                "count_folds": args.folds
+            })
+    return runs
+
+def run_configuration(run):
+    """Trains and tests a single configuration.
+    This is executed in a worker process.
+
+    Args:
+        run: The run description, as generated by create_runs().
+    Returns:
+        The run description, extended by the keys "scores", "f1", "train_time", "model_size",
+        "count_attributes" and "count_attributes_kept".
+    """
+    if run["fold"] is None:
+        train_windows = _WINDOWS[cfg.COUNT_WINDOWS_TEST:]
+        test_windows = _WINDOWS[:cfg.COUNT_WINDOWS_TEST]
+    else:
+        train_windows, test_windows = split_to_folds(_WINDOWS, run["count_folds"])[run["fold"]]
+
+    skipchain_left, skipchain_right = run["skipchain"]
+
+    def examples_of(windows):
+        """Generates the (pruned) examples of a list of windows.
+        Args:
+            windows: List of Window objects.
+        Returns:
+            Generator of pairs (feature_values_lists, labels).
+        """
+        for feature_values_lists, labels in generate_examples(windows, verbose=False,
+                                                              skipchain_left=skipchain_left,
+                                                              skipchain_right=skipchain_right):
+            yield (pruner.prune(feature_values_lists), labels)
+
+    # count the attributes of the training windows (first pass), this is also done without
+    # pruning, so that the number of attributes can be compared between runs
+    pruner = AttributePruner(min_freq=run["prune"] if run["prune"] is not None else 1)
+    for feature_values_lists, _ in generate_examples(train_windows, verbose=False,
+                                                     skipchain_left=skipchain_left,
+                                                     skipchain_right=skipchain_right):
+        pruner.count(feature_values_lists)
+    count_attributes = pruner.count_attributes()
+    pruner.fit()
+
+    train_time, model_size = train_model(examples_of(train_windows), run["model_filepath"],
+                                         algorithm=run["algorithm"], params=run["params"])
+
+    test_examples = examples_of(test_windows)
+    correct_label_chains, predicted_label_chains = tag_examples(run["model_filepath"],
+                                                                test_examples)
+    scores = bio_classification_scores(correct_label_chains, predicted_label_chains)
+
+    result = dict(run)
+    result["scores"] = scores
+    result["f1"] = weighted_f1(scores, ignore_labels=[cfg.NO_NE_LABEL])
+    result["train_time"] = train_time
+    result["model_size"] = model_size
+    result["count_attributes"] = count_attributes
+    result["count_attributes_kept"] = pruner.count_attributes()
+    return result
+
+def format_value(value):
+    """Formats a parameter value for the results table.
+    Args:
+        value: The value, e.g. a float or None.
+    Returns:
+        string
+    """
+    if value is None:
+        return "-"
+    elif isinstance(value, tuple):
+        return ":".join([str(element) for element in value])
+    else:
+        return str(value)
+
+def results_to_table(results):
+    """Converts the results of all runs to a (tab-separated) table.
+
+    Args:
+        results: List of run descriptions, as returned by run_configuration().
+    Returns:
+        The table as a string.
+    """
+    header = ["run", "algorithm", "c1", "c2", "minfreq", "prune", "skipchain", "fold"] \
+             + ["f1_%s" % (label) for label in cfg.LABELS] \
+             + ["f1_avg", "attributes", "attributes_kept", "train_seconds", "model_mb"]
+    lines = ["\t".join(header)]
+    for result in results:
+        row = [str(result["run"]), result["algorithm"], format_value(result["c1"]),
+               format_value(result["c2"]), format_value(result["minfreq"]),
+               format_value(result["prune"]), format_value(result["skipchain"]),
+               format_value(result["fold"])]
+        for label in cfg.LABELS:
+            if label in result["scores"]:
+                row.append("%.4f" % (result["scores"][label][2]))
+            else:
+                row.append("-")
+        row.append("%.4f" % (result["f1"]))
+        row.append(str(result["count_attributes"]))
+        row.append(str(result["count_attributes_kept"]))
+        row.append("%.1f" % (result["train_time"]))
+        row.append("%.2f" % (result["model_size"] / (1024 * 1024)))
+        lines.append("\t".join(row))
+    return "\n".join(lines)
+
+def folds_summary_to_table(results):
+    """Averages the results of all folds of each configuration.
+
+    Args:
+        results: List of run descriptions, as returned by run_configuration().
+    Returns:
+        The table as a string.
+    """
+    groups = dict()
+    for result in results:
+        config_key = (result["algorithm"], result["c1"], result["c2"], result["minfreq"],
+                      result["prune"], result["skipchain"])
+        groups.setdefault(config_key, []).append(result)
+
+    header = ["algorithm", "c1", "c2", "minfreq", "prune", "skipchain", "folds", "f1_avg_mean",
+              "train_seconds_mean", "model_mb_mean"]
+    lines = ["\t".join(header)]
+    for config_key in sorted(groups.keys(), key=lambda key: groups[key][0]["run"]):
+        group = groups[config_key]
+        count = len(group)
+        row = [format_value(value) for value in config_key]
+        row.append(str(count))
+        row.append("%.4f" % (sum([result["f1"] for result in group]) / count))
+        row.append("%.1f" % (sum([result["train_time"] for result in group]) / count))
+        row.append("%.2f" % (sum([result["model_size"] for result in group]) / count \
+                             / (1024 * 1024)))
+        lines.append("\t".join(row))
+    return "\n".join(lines)
+
+# ----------------
+
+if __name__ == "__main__":
+    main()
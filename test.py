@@ -7,19 +7,32 @@ This file must be called with the same identifier that was used during training.
 Example usage:
     python test.py --identifier="my_experiment" --mycorpus
     python test.py --identifier="my_experiment" --germeval
+    python test.py --identifier="my_experiment" --cascade="my_experiment_cheap" --mycorpus
+    python test.py --identifier="my_experiment" --mycorpus --threads=4
 
 The first command tests on the corpus set in ARTICLES_FILEPATH.
 The second command tests on the germeval corpus, whichs path is defined in GERMEVAL_FILEPATH.
+The third command tests the cascade of a cheap and a full model (see model/cascade.py).
+The fourth command featurizes and tags the windows in 4 threads of one process instead of in
+worker processes (see model/concurrency.py).
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 import argparse
+import multiprocessing
+import os
 import random
-import pycrfsuite
-from itertools import chain
-from sklearn.metrics import classification_report
-from sklearn.preprocessing import LabelBinarizer
 
-from model.datasets import load_windows, load_articles, generate_examples, Article
+from model.datasets import load_windows, load_articles, generate_examples, split_to_chunks, \
+                           split_iterable_to_chunks
+from model.cascade import CascadeTagger
+from model.concurrency import ThreadedTagger
+from model.crf import open_tagger
+from model.evaluation import IncrementalEvaluation
+from model.profiling import add_profile_argument, profile, stage
+from model.viterbi import BatchTagger, load_batch_tagger
+from model.hashing import AttributeHasher, get_hashing_filepath
+from model.memory import create_memory_monitor
+from model.pruning import AttributePruner, get_attributes_filepath
 import model.features as features
 
 # All capitalized constants come from this file
@@ -27,6 +40,12 @@ import config as cfg
 
 random.seed(42)
 
+# number of windows that are featurized before they are sent to the worker processes for tagging
+TEST_BLOCK_SIZE = 1000
+
+# the tagger of a worker process, see init_tagger_worker()
+_TAGGER = None
+
 def main():
     """Main method to handle command line arguments and then call the testing methods."""
     parser = argparse.ArgumentParser()
@@ -37,8 +56,33 @@ def main():
                              "ARTICLES_FILEPATH.")
     parser.add_argument("--germeval", required=False, action="store_const", const=True,
                         help="Whether to test on the german eval 2014 corpus.")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of processes that tag the windows.")
+    parser.add_argument("--batch_decoding", required=False, action="store_const", const=True,
+                        help="Whether to tag whole chunks of windows at once with the numpy " \
+                             "Viterbi decoder (model/viterbi.py) instead of one window at a " \
+                             "time with pycrfsuite. The predicted labels are the same.")
+    parser.add_argument("--threads", required=False, default=0, type=int,
+                        help="Number of threads that featurize and tag the windows in this " \
+                             "process, sharing all loaded resources (see " \
+                             "model/concurrency.py). Default is 0, tag in --workers processes.")
+    parser.add_argument("--cascade", required=False, default=None,
+                        help="Identifier of a cheap model (trained via train.py --cheap). If " \
+                             "set, every window is tagged by the cheap model first and only " \
+                             "windows below CASCADE_THRESHOLD are featurized completely and " \
+                             "tagged by the model of --identifier (see model/cascade.py).")
+    add_profile_argument(parser)
     args = parser.parse_args()
 
+    with profile(args.profile, "test"):
+        run_tests(args)
+
+def run_tests(args):
+    """Tests the model on the corpus chosen via --mycorpus or --germeval.
+
+    Args:
+        args: Command line arguments as parsed by argparse.ArgumentParser.
+    """
     # test on corpus set in ARTICLES_FILEPATH
     if args.mycorpus:
         test_on_mycorpus(args)
@@ -56,8 +100,14 @@ def test_on_mycorpus(args):
         args: Command line arguments as parsed by argparse.ArgumentParser.
     """
     print("Testing on mycorpus (%s)..." % (cfg.ARTICLES_FILEPATH))
-    test_on_articles(args.identifier, load_articles(cfg.ARTICLES_FILEPATH),
-                     nb_append=cfg.COUNT_WINDOWS_TEST)
+    if args.cascade:
+        test_cascade_on_articles(args.cascade, args.identifier,
+                                 load_articles(cfg.ARTICLES_FILEPATH),
+                                 nb_append=cfg.COUNT_WINDOWS_TEST)
+    else:
+        test_on_articles(args.identifier, load_articles(cfg.ARTICLES_FILEPATH),
+                         nb_append=cfg.COUNT_WINDOWS_TEST, workers=args.workers,
+                         batch_decoding=bool(args.batch_decoding), threads=args.threads)
 
 def test_on_germeval(args):
     """Tests on the germeval corpus.
@@ -68,125 +118,220 @@ def test_on_germeval(args):
         args: Command line arguments as parsed by argparse.ArgumentParser.
     """
     print("Testing on germeval (%s)..." % (cfg.GERMEVAL_FILEPATH))
-    test_on_articles(args.identifier, load_germeval(cfg.GERMEVAL_FILEPATH))
-
-def test_on_articles(identifier, articles, nb_append=None):
+    if args.cascade:
+        test_cascade_on_articles(args.cascade, args.identifier,
+                                 load_germeval(cfg.GERMEVAL_FILEPATH))
+    else:
+        test_on_articles(args.identifier, load_germeval(cfg.GERMEVAL_FILEPATH),
+                         workers=args.workers, batch_decoding=bool(args.batch_decoding),
+                         threads=args.threads)
+
+def test_on_articles(identifier, articles, nb_append=None, workers=1, batch_decoding=False,
+                     threads=0):
     """Test a trained CRF model on a list of Article objects (annotated text).
 
-    Will print a full classification report by label (f1, precision, recall).
+    Will print a full classification report by label (f1, precision, recall), both on token-level
+    and on entity-level.
+
+    The windows are streamed: They are featurized in blocks in this process, while the previous
+    block is tagged by the worker processes. Only the counts needed for the metrics are kept,
+    so the memory usage does not depend on the number of tested windows. The memory usage of
+    each stage and each loaded resource is printed at the end.
 
     Args:
         identifier: Identifier of the trained model to be used.
         articles: A list of Article objects or a generator for such a list. May only contain
             one single Article object.
+        nb_append: How many windows to test on max or None if unlimited. (Default is None.)
+        workers: Number of worker processes that tag the windows. (Default is 1.)
+        batch_decoding: Whether to tag whole chunks of windows at once with the BatchTagger
+            (see model/viterbi.py). (Default is False.)
+        threads: Number of threads that featurize and tag the windows in this process instead
+            of the worker processes, see test_in_threads(). (Default is 0, use the workers.)
     """
-    print("Loading tagger...")
-    tagger = pycrfsuite.Tagger()
-    tagger.open(identifier)
+    # load the attributes that were kept during training (if rare attributes were removed)
+    pruner = None
+    if os.path.isfile(get_attributes_filepath(identifier)):
+        print("Loading attributes...")
+        pruner = AttributePruner()
+        pruner.load(get_attributes_filepath(identifier))
+
+    # load the hashing settings (if the attributes were hashed during training)
+    hasher = None
+    if os.path.isfile(get_hashing_filepath(identifier)):
+        hasher = AttributeHasher()
+        hasher.load(get_hashing_filepath(identifier))
+        print("Hashing attributes into %d buckets..." % (hasher.count_buckets))
 
     # create feature generators
     # this may take a while
+    monitor = create_memory_monitor()
     print("Creating features...")
-    feature_generators = features.create_features()
+    with monitor.measure("create features"):
+        feature_generators = features.create_features(monitor=monitor)
+
+    if threads > 0:
+        evaluation = test_in_threads(identifier, feature_generators, articles, nb_append, threads,
+                                     monitor)
+        print("Tested on %d windows." % (evaluation.count_chains))
+        print(evaluation.report())
+        print("Memory usage:")
+        print(monitor.report())
+        return
 
     # create window generator
     print("Loading windows...")
-    windows = load_windows(articles, cfg.WINDOW_SIZE, feature_generators, only_labeled_windows=True)
+    windows = load_windows(articles, cfg.WINDOW_SIZE, feature_generators, only_labeled_windows=True,
+                           nb_append=nb_append)
 
-    # load feature lists and label lists (X, Y)
+    # generate feature lists and label lists (X, Y)
     # this may take a while
-    all_feature_values_lists = []
-    correct_label_chains = []
-    for fvlist, labels in generate_examples(windows, nb_append=nb_append):
-        all_feature_values_lists.append(fvlist)
-        correct_label_chains.append(labels)
-
-    # generate predicted chains of labels
-    print("Testing on %d windows..." % (len(all_feature_values_lists)))
-    predicted_label_chains = [tagger.tag(fvlists) for fvlists in all_feature_values_lists]
+    def generate_pruned_examples():
+        """Generates the examples to test on, without rare attributes (if these were removed
+        during training) and with hashed attributes (if these were hashed during training).
+        Returns:
+            Generator of pairs (feature_values_lists, labels).
+        """
+        for fvlist, labels in generate_examples(windows, nb_append=nb_append):
+            if pruner is not None:
+                fvlist = pruner.prune(fvlist)
+            if hasher is not None:
+                fvlist = hasher.hash_example(fvlist)
+            yield (fvlist, labels)
+
+    # tag the windows in worker processes, each worker has its own tagger
+    print("Testing with %d worker processes..." % (workers))
+    pool = multiprocessing.Pool(processes=workers, initializer=init_tagger_worker,
+                                initargs=(identifier, batch_decoding))
+    evaluation = IncrementalEvaluation()
+    pending = None
+    with monitor.measure("featurize and tag windows"):
+        for block in split_iterable_to_chunks(generate_pruned_examples(), TEST_BLOCK_SIZE):
+            # start tagging this block, then collect the results of the previous block
+            # (the next block is featurized while this one is being tagged)
+            chunk_size = max(1, len(block) // (workers * 4))
+            result = pool.map_async(tag_examples_chunk, list(split_to_chunks(block, chunk_size)))
+            if pending is not None:
+                with stage("wait for tagging workers"):
+                    update_evaluation(evaluation, pending.get())
+            pending = result
+        if pending is not None:
+            with stage("wait for tagging workers"):
+                update_evaluation(evaluation, pending.get())
+    pool.close()
+    pool.join()
 
     # print classification report (precision, recall, f1)
-    print(bio_classification_report(correct_label_chains, predicted_label_chains))
+    print("Tested on %d windows." % (evaluation.count_chains))
+    print(evaluation.report())
+    print("Memory usage (without the worker processes):")
+    print(monitor.report())
 
-def load_germeval(filepath):
-    """Loads the source of the gereval 2014 corpus and converts it to a list of Article objects.
+def test_cascade_on_articles(cheap_identifier, full_identifier, articles, nb_append=None):
+    """Test a cascade of a cheap and a full model on a list of Article objects.
+    The windows are tagged in this process, as the featurization of each window depends on the
+    result of the cheap model.
 
     Args:
-        filepath: Filepath to the source file, e.g. "/var/foo/NER-de-test.tsv".
+        cheap_identifier: Identifier of the cheap model (trained via train.py --cheap).
+        full_identifier: Identifier of the full model.
+        articles: A list of Article objects or a generator for such a list.
+        nb_append: How many windows to test on max or None if unlimited. (Default is None.)
+    """
+    monitor = create_memory_monitor()
+    print("Creating features...")
+    with monitor.measure("create features"):
+        feature_generators = features.create_features(monitor=monitor)
+        cascade = CascadeTagger(cheap_identifier, full_identifier, feature_generators)
+
+    print("Testing cascade (threshold %.4f, confidence measure '%s')..." \
+          % (cascade.threshold, cascade.confidence))
+    windows = load_windows(articles, cfg.WINDOW_SIZE, only_labeled_windows=True,
+                           nb_append=nb_append)
+    evaluation = IncrementalEvaluation()
+    with monitor.measure("featurize and tag windows"):
+        for window in windows:
+            labels, _ = cascade.tag(window)
+            evaluation.update(window.get_labels(), labels)
+            if evaluation.count_chains % 500 == 0:
+                print("Tagged %d windows" % (evaluation.count_chains))
+
+    print(cascade.report())
+    print(evaluation.report())
+    print("Memory usage:")
+    print(monitor.report())
+
+def test_in_threads(identifier, feature_generators, articles, nb_append, threads, monitor):
+    """Featurizes and tags windows in a pool of threads (see ThreadedTagger), which share the
+    loaded resources and the caches of the POS tagger and the LDA.
+    Args:
+        identifier: Identifier of the trained model to be used.
+        feature_generators: The feature generators, as returned by create_features().
+        articles: A list of Article objects or a generator for such a list.
+        nb_append: How many windows to test on max or None if unlimited.
+        threads: Number of threads.
+        monitor: The MemoryMonitor.
     Returns:
-        List of Article
-        (will contain only one single Article object).
+        The IncrementalEvaluation object.
     """
-    lines = open(filepath, "r").readlines()
-    lines = [line.decode("utf-8").strip() for line in lines]
-    # remove lines that are comments
-    lines = [line for line in lines if line[0:1] != "#"]
-    # remove all empty lines
-    lines = [line for line in lines if len(line) > 0]
-
-    sentence = []
-    sentences = []
-
-    for line_idx, line in enumerate(lines):
-        blocks = line.split("\t")
-        (number, word, tag1, _) = blocks # 4th block would be tag2
-        number = int(number)
-
-        # if we reach the next sentence, add the previous sentence to the 'sentences' container
-        if (number == 1 and len(sentence) > 0) or line_idx == len(lines) - 1:
-            sentences.append(sentence)
-            sentence = []
-
-        # convert all labels containing OTH (OTHER) so MISC
-        if "OTH" in tag1:
-            tag1 = "MISC"
-
-        # Add the word in an annotated way if the tag1 looks like one of the labels in the
-        # allowed labels (config setting LABELS). We don't check for full equality here, because
-        # that allows BIO tags (e.g. B-PER) to also be accepted. They will automatically be
-        # normalized by the Token objects (which will also throw away unnormalizable annotations).
-        # Notice that we ignore tag2 as tag1 is usually the more important one.
-        contains_label = any([(label in tag1) for label in cfg.LABELS])
-        is_blacklisted = any([(bl_label in tag1) for bl_label in ["part", "deriv"]])
-        if contains_label and not is_blacklisted:
-            sentence.append(word + "/" + tag1)
-        else:
-            sentence.append(word)
-
-    return [Article(" ".join(sentence)) for sentence in sentences]
-
-def bio_classification_report(y_true, y_pred):
+    print("Testing with %d threads..." % (threads))
+    tagger = ThreadedTagger(identifier, feature_generators, threads=threads)
+    windows = load_windows(articles, cfg.WINDOW_SIZE, only_labeled_windows=True,
+                           nb_append=nb_append)
+    evaluation = IncrementalEvaluation()
+    with monitor.measure("featurize and tag windows"):
+        for block in split_iterable_to_chunks(windows, TEST_BLOCK_SIZE):
+            for window, predicted_labels in zip(block, tagger.tag_windows(block)):
+                evaluation.update(window.get_labels(), predicted_labels)
+    tagger.close()
+    return evaluation
+
+def init_tagger_worker(identifier, batch_decoding=False):
+    """Opens the tagger of a worker process.
+    Args:
+        identifier: Identifier of the trained model to be used.
+        batch_decoding: Whether to use a BatchTagger. (Default is False.)
     """
-    Classification report for a list of BIO-encoded sequences.
-    It computes token-level metrics and discards "O" labels.
-
-    Note that it requires scikit-learn 0.15+ (or a version from github master)
-    to calculate averages properly!
+    global _TAGGER
+    # both work for models of pycrfsuite and of the numpy CRF (train.py --engine=numpy)
+    if batch_decoding:
+        _TAGGER = load_batch_tagger(identifier)
+    else:
+        _TAGGER = open_tagger(identifier)
+
+def tag_examples_chunk(examples):
+    """Tags a chunk of examples in a worker process.
+    Args:
+        examples: List of pairs (feature_values_lists, labels).
+    Returns:
+        List of pairs (correct labels, predicted labels).
+    """
+    if isinstance(_TAGGER, BatchTagger):
+        predicted = _TAGGER.tag_batch([fvlists for fvlists, _ in examples])
+        return [(labels, predicted_labels) \
+                for (_, labels), predicted_labels in zip(examples, predicted)]
+    return [(labels, _TAGGER.tag(fvlists)) for fvlists, labels in examples]
+
+def update_evaluation(evaluation, chunks):
+    """Adds the results of tagged chunks to the evaluation.
+    Args:
+        evaluation: The IncrementalEvaluation object.
+        chunks: List of results of tag_examples_chunk().
+    """
+    for chunk in chunks:
+        for correct_labels, predicted_labels in chunk:
+            evaluation.update(correct_labels, predicted_labels)
 
-    Note: This function was copied from
-    http://nbviewer.ipython.org/github/tpeng/python-crfsuite/blob/master/examples/CoNLL%202002.ipynb
+def load_germeval(filepath):
+    """Loads the source of the gereval 2014 corpus and converts it to Article objects.
+    The file is streamed, i.e. it is not loaded completely into RAM.
 
     Args:
-        y_true: True labels, list of strings
-        y_pred: Predicted labels, list of strings
+        filepath: Filepath to the source file, e.g. "/var/foo/NER-de-test.tsv".
     Returns:
-        classification report as string
+        Generator of Article objects (one per sentence).
     """
-    lbin = LabelBinarizer()
-    y_true_combined = lbin.fit_transform(list(chain.from_iterable(y_true)))
-    y_pred_combined = lbin.transform(list(chain.from_iterable(y_pred)))
-
-    #tagset = set(lbin.classes_) - {NO_NE_LABEL}
-    tagset = set(lbin.classes_)
-    tagset = sorted(tagset, key=lambda tag: tag.split('-', 1)[::-1])
-    class_indices = {cls: idx for idx, cls in enumerate(lbin.classes_)}
-
-    return classification_report(
-        y_true_combined,
-        y_pred_combined,
-        labels=[class_indices[cls] for cls in tagset],
-        target_names=tagset,
-    )
+    return load_articles(filepath, corpus_format="germeval")
 
 # ----------------------
 
@@ -6,13 +6,25 @@ line argument.
 
 Usage example:
     python train.py --identifier="my_experiment"
+    python train.py --identifier="my_experiment_cheap" --cheap
+    python train.py --identifier="my_experiment_45min" --time_budget=45
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 import argparse
+import multiprocessing
+import os
 import random
-import pycrfsuite
+import time
 
+from model.crf import CrfTrainer
 from model.datasets import load_windows, load_articles, generate_examples
+from model.dedup import create_deduplicator
+from model.hashing import AttributeHasher, get_hashing_filepath
+from model.memory import SpillingBuffer, create_memory_monitor
+from model.budget import BudgetedTrainer
+from model.monitoring import MonitoredTrainer, get_training_log_filepath, load_holdout_examples
+from model.profiling import add_profile_argument, profile, stage
+from model.pruning import AttributePruner, get_attributes_filepath
 import model.features as features
 
 # All capitalized constants come from this file
@@ -25,16 +37,43 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--identifier", required=True,
                         help="A short name/identifier for your experiment, e.g. 'ex42b'.")
+    parser.add_argument("--engine", required=False, default="crfsuite",
+                        choices=["crfsuite", "numpy"],
+                        help="Which CRF implementation to train: pycrfsuite (default) or the " \
+                             "numpy implementation in model/crf.py, which computes the " \
+                             "gradients in several processes (see --workers).")
+    parser.add_argument("--workers", required=False, default=multiprocessing.cpu_count(),
+                        type=int, help="Number of processes that compute the gradients " \
+                                       "(only for --engine=numpy).")
+    parser.add_argument("--cheap", required=False, action="store_const", const=True,
+                        help="Only use the cheap feature generators (CASCADE_CHEAP_FEATURES), " \
+                             "e.g. to train the first model of the cascade (see cascade.py).")
+    parser.add_argument("--time_budget", required=False, default=cfg.TIME_BUDGET_MINUTES,
+                        type=float, help="Wall-clock budget of the training in minutes. " \
+                                         "The training algorithm and the number of iterations " \
+                                         "are then chosen automatically (see model/budget.py).")
+    parser.add_argument("--algorithms", required=False,
+                        default=",".join(cfg.TRAINING_ALGORITHMS),
+                        help="Comma-separated crfsuite algorithms to choose from within the " \
+                             "time budget, e.g. 'lbfgs,l2sgd'.")
+    add_profile_argument(parser)
     args = parser.parse_args()
 
-    train(args)
+    if args.time_budget is not None:
+        if args.engine != "crfsuite":
+            parser.error("--time_budget is only supported with --engine=crfsuite.")
+        if cfg.COUNT_WINDOWS_HOLDOUT <= 0:
+            parser.error("--time_budget requires holdout windows (COUNT_WINDOWS_HOLDOUT > 0).")
+
+    with profile(args.profile, "train"):
+        train(args)
 
 def train(args):
     """Main training method.
 
     Does the following:
-        1. Create a new pycrfsuite trainer object. We will have to add feature chains and label
-           chains to that object and then train on them.
+        1. Create a new pycrfsuite (or numpy) trainer object. We will have to add feature chains
+           and label chains to that object and then train on them.
         2. Creates the feature (generators). A feature generator might e.g. take in a window
            of N tokens and then return ["upper=1"] for each token that starts with an uppercase
            letter and ["upper=0"] for each token that starts with a lowercase letter. (Lists,
@@ -42,31 +81,108 @@ def train(args):
            e.g. the case for LDA as a token may be part of multiple topics.)
         3. Loads windows from the corpus. Each window has a fixed (maximum) size in tokens.
            We only load windows that contain at least one label (named entity), so that we don't
-           waste too much time on windows without any label.
+           waste too much time on windows without any label. Optionally near-duplicate articles
+           and windows are skipped (see DEDUP_ARTICLES and DEDUP_WINDOWS).
         4. Generate features for each chain of tokens (window). That's basically described in (2.).
            Each chain of tokens from a window will be converted to a list of lists.
            One list at the top level representing each token, then another list for the feature
            values. E.g.
              [["w2v=123", "bc=742", "upper=0"], ["w2v=4", "bc=12", "upper=1", "lda4=1"]]
            for two tokens.
-        5. Add feature chains and label chains to the trainer.
-        6. Train. This may take several hours for 20k windows.
+        5. Optionally remove rare attributes (see ATTRIBUTE_MIN_FREQ). This requires a first pass
+           over all windows to count the attributes. Optionally hash the attributes into a fixed
+           number of buckets (see FEATURE_HASHING_BUCKETS).
+        6. Add feature chains and label chains to the trainer. Optionally also add holdout
+           windows (see COUNT_WINDOWS_HOLDOUT).
+        7. Train. This may take several hours for 20k windows. The metrics of each iteration are
+           written to "<identifier>.training.json" and the training stops early if the holdout
+           F1 score no longer improves (see EARLY_STOPPING_PATIENCE). With a time budget
+           (--time_budget) the training algorithm and the number of iterations are chosen
+           automatically and the best model so far is saved after each run.
+        8. Print the memory usage of each stage and each loaded resource (see MEMORY_BUDGET_MB).
 
     Args:
         args: Command line arguments as parsed by argparse.ArgumentParser.
     """
-    trainer = pycrfsuite.Trainer(verbose=True)
+    if args.engine == "numpy":
+        trainer = CrfTrainer(workers=args.workers, verbose=True)
+    elif args.time_budget is not None:
+        # chooses among crfsuite's algorithms and writes all runs to the JSON log
+        trainer = BudgetedTrainer(args.time_budget * 60, algorithms=args.algorithms.split(","),
+                                  probe_share=cfg.TIME_BUDGET_PROBE_SHARE,
+                                  log_filepath=get_training_log_filepath(args.identifier))
+    else:
+        # writes loss, active features, time and holdout F1 of each iteration to a JSON log
+        trainer = MonitoredTrainer(log_filepath=get_training_log_filepath(args.identifier),
+                                   patience=cfg.EARLY_STOPPING_PATIENCE,
+                                   min_delta=cfg.EARLY_STOPPING_MIN_DELTA)
+
+    # records the memory usage of each stage and of each loaded resource
+    monitor = create_memory_monitor()
 
     # Create/Initialize the feature generators
     # this may take a few minutes
     print("Creating features...")
-    feature_generators = features.create_features()
+    with monitor.measure("create features"):
+        feature_generators = features.create_features(
+            names=cfg.CASCADE_CHEAP_FEATURES if args.cheap else None, monitor=monitor)
 
     # Initialize the window generator
     # each window has a fixed maximum size of tokens
+    # The first COUNT_WINDOWS_TEST windows are reserved for testing. They are skipped before
+    # any features are generated for them.
+    # Optionally near-duplicate articles/windows are dropped (see DEDUP_ARTICLES, DEDUP_WINDOWS).
+    # The test windows are added to the deduplicator too, so that their duplicates don't end up
+    # among the training windows.
     print("Loading windows...")
+    deduplicator = create_deduplicator()
     windows = load_windows(load_articles(cfg.ARTICLES_FILEPATH), cfg.WINDOW_SIZE,
-                           feature_generators, only_labeled_windows=True)
+                           feature_generators, only_labeled_windows=True,
+                           nb_skip=cfg.COUNT_WINDOWS_TEST, nb_append=cfg.COUNT_WINDOWS_TRAIN,
+                           deduplicator=deduplicator)
+
+    # Count the attributes in a first pass over the windows and decide which ones are frequent
+    # enough to be kept. The windows are kept for the second pass, in RAM or, if the process
+    # exceeds MEMORY_BUDGET_MB, in a temporary file.
+    pruner = AttributePruner(cfg.ATTRIBUTE_MIN_FREQ, cfg.ATTRIBUTE_MIN_FREQ_PER_FEATURE,
+                             cfg.ATTRIBUTE_MIN_FREQ_PER_OFFSET)
+    attributes_filepath = get_attributes_filepath(args.identifier)
+    if pruner.is_active():
+        with monitor.measure("featurize windows"):
+            buffered_windows = SpillingBuffer(cfg.MEMORY_BUDGET_MB, cfg.MEMORY_SPILL_DIRPATH)
+            buffered_windows.extend(windows)
+            windows = buffered_windows
+        if windows.count_spilled > 0:
+            print("Moved %d of %d featurized windows to disk (%s) to stay below %d MB." \
+                  % (windows.count_spilled, len(windows), windows.filepath,
+                     cfg.MEMORY_BUDGET_MB))
+        print("Counting attributes...")
+        with monitor.measure("count attributes"):
+            for feature_values_lists, _ in generate_examples(windows, verbose=False):
+                pruner.count(feature_values_lists)
+        count_attributes_before = pruner.count_attributes()
+        pruner.fit()
+        count_attributes_after = pruner.count_attributes()
+        print("Keeping %d of %d attributes (removed %.1f%%)." \
+              % (count_attributes_after, count_attributes_before,
+                 100 * (1 - count_attributes_after / max(count_attributes_before, 1))))
+        # the same attributes are used by test.py
+        pruner.save(attributes_filepath)
+    elif os.path.isfile(attributes_filepath):
+        # remove leftovers of a previous experiment with the same identifier
+        os.remove(attributes_filepath)
+
+    # Optionally hash the (remaining) attributes into a fixed number of buckets.
+    # The settings are saved, so that test.py applies the same hashing.
+    hasher = None
+    hashing_filepath = get_hashing_filepath(args.identifier)
+    if cfg.FEATURE_HASHING_BUCKETS:
+        print("Hashing attributes into %d buckets..." % (cfg.FEATURE_HASHING_BUCKETS))
+        hasher = AttributeHasher(cfg.FEATURE_HASHING_BUCKETS, cfg.FEATURE_HASHING_SIGNED)
+        hasher.save(hashing_filepath)
+    elif os.path.isfile(hashing_filepath):
+        # remove leftovers of a previous experiment with the same identifier
+        os.remove(hashing_filepath)
 
     # Add chains of features (each list of lists of strings)
     # and chains of labels (each list of strings)
@@ -75,19 +191,66 @@ def train(args):
     # POS tags and LDA results are cached, so the second run through this part will be significantly
     # faster.
     print("Adding example windows (up to max %d)..." % (cfg.COUNT_WINDOWS_TRAIN))
-    examples = generate_examples(windows, nb_append=cfg.COUNT_WINDOWS_TRAIN,
-                                 nb_skip=cfg.COUNT_WINDOWS_TEST, verbose=True)
-    for feature_values_lists, labels in examples:
-        trainer.append(feature_values_lists, labels)
+    examples = generate_examples(windows, nb_append=cfg.COUNT_WINDOWS_TRAIN, verbose=True)
+    with monitor.measure("add examples"):
+        for feature_values_lists, labels in examples:
+            if pruner.is_active():
+                feature_values_lists = pruner.prune(feature_values_lists)
+            if hasher is not None:
+                feature_values_lists = hasher.hash_example(feature_values_lists)
+            with stage("trainer append"):
+                trainer.append(feature_values_lists, labels)
+    if isinstance(windows, SpillingBuffer):
+        windows.close()
+    windows = None
+    if deduplicator is not None:
+        print(deduplicator.report())
+
+    # Add the holdout windows (group 1), on which crfsuite evaluates the model after every
+    # iteration. They come after the training windows (counted after dropping near-duplicates,
+    # like the training windows) and their features are cached.
+    holdout = -1
+    if cfg.COUNT_WINDOWS_HOLDOUT > 0 and args.engine == "crfsuite":
+        print("Adding holdout windows (up to max %d)..." % (cfg.COUNT_WINDOWS_HOLDOUT))
+        holdout_examples = load_holdout_examples(feature_generators,
+                                                 cfg.COUNT_WINDOWS_TEST + cfg.COUNT_WINDOWS_TRAIN,
+                                                 cfg.COUNT_WINDOWS_HOLDOUT)
+        with monitor.measure("add holdout examples"):
+            for feature_values_lists, labels in holdout_examples:
+                if pruner.is_active():
+                    feature_values_lists = pruner.prune(feature_values_lists)
+                if hasher is not None:
+                    feature_values_lists = hasher.hash_example(feature_values_lists)
+                with stage("trainer append"):
+                    trainer.append(feature_values_lists, labels, 1)
+        holdout = 1
 
     # Train the model
     # this may take several hours
     print("Training...")
-    if cfg.MAX_ITERATIONS is not None and cfg.MAX_ITERATIONS > 0:
+    if cfg.MAX_ITERATIONS is not None and cfg.MAX_ITERATIONS > 0 and args.time_budget is None:
         # set the maximum number of iterations of defined in the config file
         # the optimizer stops automatically after some iterations if this is not set
         trainer.set_params({'max_iterations': cfg.MAX_ITERATIONS})
-    trainer.train(args.identifier)
+    start = time.time()
+    with monitor.measure("train"):
+        if args.engine == "numpy":
+            trainer.train(args.identifier)
+        elif args.time_budget is not None:
+            best_run = trainer.train_budgeted(args.identifier, holdout=holdout)
+            print(trainer.report())
+            if best_run is None:
+                print("No model could be trained within %.1f minutes." % (args.time_budget))
+                return
+            print("Saved model: %s after %d iterations (holdout F1 %.4f)." \
+                  % (best_run["algorithm"], best_run["iterations"], best_run["holdout_f1"]))
+        else:
+            trainer.train_monitored(args.identifier, holdout=holdout)
+    print("Training took %.1f seconds, the model has a size of %.2f MB." \
+          % (time.time() - start, os.path.getsize(args.identifier) / (1024 * 1024)))
+
+    print("Memory usage:")
+    print(monitor.report())
 
 # ----------------
 